@@ -0,0 +1,75 @@
+"""Report compression ratio vs encode/decode throughput of the chip codecs.
+
+Chips are read from the composited blocks of a materialized tile composite if one
+is given, otherwise a synthetic uint16 reflectance-like stack is used. Composite
+chips default to the composite's chunk size:
+
+    python benchmarks/bench_codecs.py [./local-30UXC-composite.zarr [chipsize]]
+"""
+
+import sys
+from typing import Optional
+
+import numpy as np
+import zarr
+
+from eoflow.core.codecs import benchmark_codecs
+
+
+def sample_chips(n: int = 32, bands: int = 3, chipsize: int = 256) -> np.ndarray:
+    """smooth, noisy uint16 reflectance in the usual 0-4000 range"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:chipsize, 0:chipsize] / chipsize
+    field = 1500 + 800 * np.sin(6 * xx + rng.random((n, bands, 1, 1)) * 6) * yy
+    return (field + rng.normal(0, 40, field.shape)).clip(0, 4000).astype(np.uint16)
+
+
+def composited_blocks(c) -> list[tuple[int, int]]:
+    """the (row, col) origins of the blocks of a (B, Y, X) composite holding data;
+    the rest of a tile's composite is never written and reads as 0"""
+    cy, cx = c.chunks[-2:]
+    return [
+        (r, q)
+        for r in range(0, c.shape[-2], cy)
+        for q in range(0, c.shape[-1], cx)
+        if c[:, r : r + cy, q : q + cx].any()
+    ]
+
+
+def composite_chips(c, n: int = 32, chipsize: Optional[int] = None) -> np.ndarray:
+    """`n` chips at random origins inside the composited blocks of a (B, Y, X)
+    composite"""
+    chipsize = chipsize or c.chunks[-1]
+    blocks = composited_blocks(c)
+    if not blocks:
+        raise ValueError("the composite has no composited blocks")
+
+    rng = np.random.default_rng(0)
+    chips = []
+    for kk in rng.choice(len(blocks), n, replace=len(blocks) < n):
+        origin = []
+        for start, block, size in zip(blocks[kk], c.chunks[-2:], c.shape[-2:]):
+            span = min(block, size - start)
+            offset = rng.integers(0, max(span - chipsize, 0) + 1)
+            origin.append(min(start + offset, size - chipsize))
+        r, q = origin
+        chips.append(c[:, r : r + chipsize, q : q + chipsize])
+    return np.stack(chips)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:
+        chips = composite_chips(
+            zarr.open(sys.argv[1], mode="r"),
+            chipsize=int(sys.argv[2]) if len(sys.argv) > 2 else None,
+        )
+    else:
+        chips = sample_chips()
+
+    print(f"{'codec':>6} {'level':>5} {'ratio':>6} {'enc MB/s':>9} {'dec MB/s':>9}")
+    for row in benchmark_codecs(chips):
+        print(
+            f"{row['codec']:>6} {row['level']:>5} {row['ratio']:>6.2f}"
+            f" {row['encode_mbps']:>9.0f} {row['decode_mbps']:>9.0f}"
+        )
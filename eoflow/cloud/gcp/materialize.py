@@ -12,6 +12,7 @@ from dagster_pipes import (
 from google.cloud.storage import Client
 
 from eoflow.cloud.gcp.pipes import PipesCloudStorageMessageWriter
+from eoflow.core.index import write_index
 from eoflow.core.materialize import materialize_tile
 from eoflow.models import DataSpec, S2IndexItem, Tile
 
@@ -74,12 +75,13 @@ def eager():
         pipes.report_custom_message(f"staring materaliazation {tile.tile}")
 
         idx_blob = materialize_tile(
-            tile, revisits, dataspec, logger=pipes.log, run_id=run_id
+            tile, revisits, dataspec, logger=pipes.log, run_id=run_id, tiles=tiles
         )
 
         pipes.log.info(f"Materialized {tile.tile}")
-        AnyPath(RUN_STORE + f"/{tile.tile}-index.json").write_text(
-            idx_blob.model_dump_json()
+        write_index(
+            idx_blob.to_table(dataspec.bands),
+            RUN_STORE + f"/{tile.tile}-index.parquet",
         )
 
         return 200, "success"
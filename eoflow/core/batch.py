@@ -0,0 +1,213 @@
+import json
+import time
+from collections import defaultdict
+from typing import Optional
+
+import dask
+import dask.array as da
+import numpy as np
+import zarr
+from cloudpathlib import AnyPath
+
+from eoflow.core.chips import TILE_PX
+from eoflow.core.index import write_index
+from eoflow.core.logging import logger as local_logger
+from eoflow.models.archive import Archive, ArchiveIndex
+from eoflow.models.granule import GCPS2Granule
+from eoflow.models.models import DataSpec, S2IndexDFtoItems, S2IndexItem, Tile
+
+
+class SharedFill:
+    """The revisits and bands of one dataspec within a fill shared by several.
+
+    Indexes like the (R, B, Y, X) array `Archive.fill` writes, so an archive can
+    composite from it unchanged.
+    """
+
+    def __init__(self, z: zarr.Array, revisits: list[int], bands: list[int]):
+        self.z = z
+        self.revisits = np.asarray(revisits, dtype=np.int64)
+        self.bands = np.asarray(bands, dtype=np.int64)
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return (len(self.revisits), len(self.bands), *self.z.shape[2:])
+
+    def __getitem__(self, key) -> np.ndarray:
+        revisits, bands, *window = key
+        return self.z.get_orthogonal_selection(
+            (self.revisits[revisits], self.bands[bands], *window)
+        )
+
+
+def fill_shared(
+    tile: Tile, revisits: list[S2IndexItem], bands: list[str], cfg: DataSpec
+) -> zarr.Array:
+    """fetch the union of several dataspecs' granule bands of a tile once"""
+
+    z = zarr.open(
+        f"./local-{tile.tile}-shared.zarr",
+        mode="w",
+        shape=(len(revisits), len(bands), TILE_PX, TILE_PX),
+        chunks=(1, 1, cfg.chipsize, cfg.chipsize),
+        dtype="uint16",
+    )
+
+    stack = da.stack(
+        [
+            GCPS2Granule(
+                mgrs_tile=tile.tile,
+                granule_id=revisit.granule_id,
+                product_id=revisit.product_id,
+                bands=bands,
+                upsample=cfg.upsample,
+            ).stack
+            for revisit in revisits
+        ],
+        axis=0,
+    )
+
+    dask.compute(stack.store(z, compute=False, return_stored=False), num_workers=2)
+    return z
+
+
+def plan_shared_reads(archives: list[Archive]) -> list[dict]:
+    """group archives whose granules can be read together, i.e. with the same
+    upsampling, into the union of their revisits and bands"""
+
+    groups = defaultdict(list)
+    for archive in archives:
+        groups[archive.cfg.upsample].append(archive)
+
+    plans = []
+    for group in groups.values():
+        revisits = sorted(
+            {r.granule_id: r for a in group for r in a.revisits}.values(),
+            key=lambda r: r.sensing_time,
+        )
+        bands = list(dict.fromkeys(b for a in group for b in a.cfg.bands))
+        plans.append({"archives": group, "revisits": revisits, "bands": bands})
+    return plans
+
+
+def materialize_tile_batch(
+    tile: Tile,
+    jobs: list[tuple[DataSpec, list[S2IndexItem]]],
+    logger=local_logger,
+    run_id=None,
+    tiles: Optional[list[list[str]]] = None,
+    resume=True,
+) -> tuple[list[ArchiveIndex], dict]:
+    """Materialize a single tile for several dataspecs, reading each granule band
+    they share once.
+
+    `jobs` pairs each dataspec with its revisits of the tile, and `tiles` optionally
+    lists all tiles of each dataspec's run for deduplication. Returns the archive
+    index of each dataspec, and the granule band reads requested by the dataspecs
+    that needed data against those actually fetched.
+    """
+
+    tic = time.time()
+
+    archives = [
+        Archive(
+            cfg=cfg,
+            tile=tile,
+            revisits=revisits,
+            run_id=run_id,
+            tiles=None if tiles is None else tiles[ii],
+        )
+        for ii, (cfg, revisits) in enumerate(jobs)
+    ]
+
+    # only archives with batches left and blocks not in the cache need data
+    fetch = [
+        archive
+        for archive in archives
+        if (archive.resume() if resume else None) != 0
+        and archive.uncached_blocks() != 0
+        and archive.revisits
+    ]
+
+    reads = {"requested": 0, "fetched": 0}
+    for plan in plan_shared_reads(fetch):
+        group, revisits, bands = plan["archives"], plan["revisits"], plan["bands"]
+        z = fill_shared(tile, revisits, bands, group[0].cfg)
+
+        granules = [r.granule_id for r in revisits]
+        for archive in group:
+            archive.z = SharedFill(
+                z,
+                [granules.index(r.granule_id) for r in archive.revisits],
+                [bands.index(b) for b in archive.cfg.bands],
+            )
+            archive.mask()
+
+        reads["requested"] += sum(len(a.revisits) * len(a.cfg.bands) for a in group)
+        reads["fetched"] += len(revisits) * len(bands)
+
+    logger.info(
+        f"{tile.tile}:{time.time() - tic:.2f} Filled {len(fetch)} of {len(archives)} "
+        f"dataspecs, {reads['fetched']} of {reads['requested']} granule bands fetched"
+    )
+
+    indices = [archive.materialize() for archive in archives]
+    logger.info(
+        f"{tile.tile}:{time.time() - tic:.2f} Materialized "
+        f"{sum(len(idx.chips) for idx in indices)} chips"
+    )
+    return indices, reads
+
+
+def materialize_batch(
+    configs: list[DataSpec], logger=local_logger, run_id: Optional[str] = None
+) -> dict:
+    """Materialize several dataspecs together, tile by tile, so granules they share
+    are fetched once. Each dataspec's index and dataspec are stored in its own
+    dataset store; returns the shared-read savings of the batch.
+    """
+
+    from eoflow.models.catalogue import get_revisits, get_tiles
+
+    jobs = defaultdict(dict)  # tile -> spec -> revisits
+    tiles, spec_tiles = {}, []
+    for ii, config in enumerate(configs):
+        config_tiles = get_tiles(config, logger=logger)
+        spec_tiles.append([t.tile for t in config_tiles])
+        df_revisits = get_revisits(config_tiles, config)
+        for name, df_tile in df_revisits.groupby("mgrs_tile"):
+            tiles[name] = Tile(tile=name)
+            jobs[name][ii] = S2IndexDFtoItems(df_tile)
+
+    indices = defaultdict(list)
+    reads = {"requested": 0, "fetched": 0}
+    for name, specs in jobs.items():
+        tile_indices, tile_reads = materialize_tile_batch(
+            tiles[name],
+            [(configs[ii], revisits) for ii, revisits in specs.items()],
+            logger=logger,
+            run_id=run_id,
+            tiles=[spec_tiles[ii] for ii in specs],
+        )
+        for ii, idx in zip(specs, tile_indices):
+            indices[ii].append(idx)
+        for key in reads:
+            reads[key] += tile_reads[key]
+
+    for ii, config in enumerate(configs):
+        merged = Archive.merge_archive_indices(indices[ii])
+        # a dataspec without revisits stored nothing yet
+        AnyPath(config.dataset_store).mkdir(parents=True, exist_ok=True)
+        write_index(
+            merged.to_table(config.bands), config.dataset_store + "/index.parquet"
+        )
+        AnyPath(config.dataset_store + "/dataspec.json").write_text(
+            json.dumps(json.loads(config.model_dump_json()))
+        )
+
+    reads["saved"] = reads["requested"] - reads["fetched"]
+    logger.info(
+        f"Batch of {len(configs)} dataspecs fetched {reads['fetched']} granule bands "
+        f"for {reads['requested']} requested, {reads['saved']} reads shared"
+    )
+    return reads
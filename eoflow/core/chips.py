@@ -0,0 +1,310 @@
+from typing import Iterator, Optional
+
+import numpy as np
+import shapely
+from mgrs import MGRS
+from pyproj import Transformer
+from rasterio import Affine
+
+RESOLUTION = 10  # m/px, all bands are upsampled to 10m
+TILE_PX = 10980  # px, width and height of an S2 tile at 10m
+
+
+class ChipTable:
+    """A struct-of-arrays table of square chips on a tile's 10m pixel grid.
+
+    Chips are addressed by the (row, col) of their top-left pixel, relative to the
+    top-left corner (`minx`, `maxy`) of the tile. `ids` are stable chip numbers
+    that survive subsetting.
+    """
+
+    def __init__(
+        self,
+        rows: np.ndarray,
+        cols: np.ndarray,
+        chipsize: int,
+        minx: float,
+        maxy: float,
+        ids: Optional[np.ndarray] = None,
+    ):
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.chipsize = chipsize
+        self.minx = minx
+        self.maxy = maxy
+        self.ids = (
+            np.arange(len(self.rows)) if ids is None else np.asarray(ids, np.int64)
+        )
+
+    @staticmethod
+    def lattice(chipsize: int, stride: int) -> np.ndarray:
+        """chip origins along one axis of the tile, snapped to multiples of stride.
+
+        A final origin is added flush with the tile edge so the remainder strip is
+        covered; that is the only origin that is not aligned to the chunk grid.
+        """
+        return np.unique(
+            np.append(np.arange(0, TILE_PX - chipsize + 1, stride), TILE_PX - chipsize)
+        )
+
+    @classmethod
+    def from_geometries(
+        cls,
+        geometries: np.ndarray,
+        chipsize: int,
+        stride: int,
+        minx: float,
+        maxy: float,
+        tree: Optional[shapely.STRtree] = None,
+    ) -> "ChipTable":
+        """the chips of the tile lattice that intersect any of `geometries`"""
+
+        lattice = cls.lattice(chipsize, stride)
+        n = len(lattice)
+
+        # 1. lattice index ranges [lo, hi) of chips overlapping each geometry's bounds
+        bounds = shapely.bounds(geometries).reshape(-1, 4)
+        px = (bounds[:, [0, 2]] - minx) / RESOLUTION
+        py = (maxy - bounds[:, [3, 1]]) / RESOLUTION
+        ilo = np.searchsorted(lattice, py[:, 0] - chipsize, side="right")
+        ihi = np.searchsorted(lattice, py[:, 1], side="right")
+        jlo = np.searchsorted(lattice, px[:, 0] - chipsize, side="right")
+        jhi = np.searchsorted(lattice, px[:, 1], side="right")
+
+        # 2. rasterize the ranges onto the lattice with a 2d difference array
+        keep = (ilo < ihi) & (jlo < jhi)
+        ilo, ihi, jlo, jhi = ilo[keep], ihi[keep], jlo[keep], jhi[keep]
+        occupancy = np.zeros((n + 1, n + 1), dtype=np.int64)
+        np.add.at(occupancy, (ilo, jlo), 1)
+        np.add.at(occupancy, (ilo, jhi), -1)
+        np.add.at(occupancy, (ihi, jlo), -1)
+        np.add.at(occupancy, (ihi, jhi), 1)
+        ii, jj = np.nonzero(occupancy.cumsum(axis=0).cumsum(axis=1)[:n, :n] > 0)
+
+        candidates = cls(lattice[ii], lattice[jj], chipsize, minx, maxy)
+
+        # 3. drop candidates that only overlap the bounds of a geometry
+        tree = shapely.STRtree(geometries) if tree is None else tree
+        hits = np.unique(tree.query(candidates.geometry, predicate="intersects")[0])
+
+        return cls(candidates.rows[hits], candidates.cols[hits], chipsize, minx, maxy)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, idx) -> "ChipTable":
+        return ChipTable(
+            self.rows[idx],
+            self.cols[idx],
+            self.chipsize,
+            self.minx,
+            self.maxy,
+            ids=self.ids[idx],
+        )
+
+    @property
+    def bounds(self) -> np.ndarray:
+        """(N, 4) array of chip minx, miny, maxx, maxy in the tile crs"""
+        size = self.chipsize * RESOLUTION
+        minx = self.minx + self.cols * RESOLUTION
+        maxy = self.maxy - self.rows * RESOLUTION
+        return np.column_stack([minx, maxy - size, minx + size, maxy]).astype(float)
+
+    @property
+    def geometry(self) -> np.ndarray:
+        """array of shapely chip polygons in the tile crs"""
+        return shapely.box(*self.bounds.T)
+
+    @property
+    def centroids(self) -> np.ndarray:
+        """(N, 2) array of chip centre x, y in the tile crs"""
+        bounds = self.bounds
+        return (bounds[:, :2] + bounds[:, 2:]) / 2
+
+    @property
+    def extent(self) -> tuple[int, int, int, int]:
+        """(row0, col0, row1, col1) pixel window enclosing all chips"""
+        return (
+            int(self.rows.min()),
+            int(self.cols.min()),
+            int(self.rows.max()) + self.chipsize,
+            int(self.cols.max()) + self.chipsize,
+        )
+
+    @property
+    def regions(self) -> np.ndarray:
+        """the chunk-grid block each chip starts in"""
+        n_blocks = -(-TILE_PX // self.chipsize)
+        return (self.rows // self.chipsize) * n_blocks + self.cols // self.chipsize
+
+    def transform(self, idx: int) -> Affine:
+        """the affine transform of a single chip"""
+        return Affine(
+            RESOLUTION,
+            0.0,
+            self.minx + self.cols[idx] * RESOLUTION,
+            0.0,
+            -RESOLUTION,
+            self.maxy - self.rows[idx] * RESOLUTION,
+        )
+
+    def window(self, idx: int, origin: tuple[int, int] = (0, 0)) -> tuple[slice, slice]:
+        """(rows, cols) slices of a single chip, relative to a pixel origin"""
+        row = int(self.rows[idx]) - origin[0]
+        col = int(self.cols[idx]) - origin[1]
+        return slice(row, row + self.chipsize), slice(col, col + self.chipsize)
+
+    def blocks(self) -> np.ndarray:
+        """(K, 2) array of the unique chunk-grid blocks covered by any chip"""
+        cs = self.chipsize
+        bi = np.stack([self.rows // cs, (self.rows + cs - 1) // cs])
+        bj = np.stack([self.cols // cs, (self.cols + cs - 1) // cs])
+        blocks = np.stack(
+            [np.repeat(bi, 2, axis=0).ravel(), np.tile(bj, (2, 1)).ravel()], axis=1
+        )
+        return np.unique(blocks, axis=0)
+
+    def groupby_region(self) -> Iterator["ChipTable"]:
+        """yield the chips of each region in turn"""
+        regions = self.regions
+        order = np.argsort(regions, kind="stable")
+        splits = np.flatnonzero(np.diff(regions[order])) + 1
+        for idx in np.split(order, splits):
+            if len(idx):
+                yield self[idx]
+
+
+def owned_chips(chips: ChipTable, crs: str, tile: str, tiles: list[str]) -> np.ndarray:
+    """boolean mask of the chips `tile` should materialize among the run's `tiles`.
+
+    Overlapping S2 tiles partition the ground by MGRS 100km square: a tile keeps the
+    chips that overlap its own square, so duplicate work is limited to chips that
+    straddle a square boundary. Chips overlapping no square of the run fall back to
+    the first of `tiles` (sorted) whose footprint contains the chip centroid. The
+    rule only depends on the chip footprint, so every tile reaches the same answer
+    independently.
+    """
+
+    from eoflow.models.models import Tile
+
+    to_wgs = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+    bounds = chips.bounds
+    lon, lat = to_wgs.transform(
+        bounds[:, [0, 2, 0, 2]].ravel(), bounds[:, [1, 1, 3, 3]].ravel()
+    )
+
+    mgrs = MGRS()
+    squares = np.array(
+        [mgrs.toMGRS(la, lo, MGRSPrecision=0) for lo, la in zip(lon, lat)],
+        dtype=object,
+    ).reshape(-1, 4)
+
+    owned = (squares == tile).any(axis=1)
+
+    orphans = np.flatnonzero(~np.isin(squares, tiles).any(axis=1))
+    if len(orphans):
+        points = shapely.points(*to_wgs.transform(*chips.centroids[orphans].T))
+        owners = np.full(len(orphans), "", dtype=object)
+        for candidate in sorted(tiles):
+            inside = shapely.contains(
+                Tile(tile=candidate).geometry.to_shapely(), points
+            )
+            owners[inside & (owners == "")] = candidate
+        owned[orphans] = owners == tile
+
+    return owned
+
+
+def iter_aoi_chips(
+    aoi: shapely.Geometry,
+    chipsize: int,
+    stride: int,
+    minx: float,
+    maxy: float,
+    batch: int,
+) -> Iterator[ChipTable]:
+    """stream the chips of the tile lattice intersecting `aoi` in batches of at most
+    `batch` chips.
+
+    The lattice is walked one row of chips at a time against the strip of the aoi
+    under it, so memory stays flat however large the aoi is. Chip ids run on across
+    batches.
+    """
+
+    lattice = ChipTable.lattice(chipsize, stride)
+    maxx = minx + TILE_PX * RESOLUTION
+
+    rows, cols, n_chips = [], [], 0
+    for row in lattice:
+        strip = shapely.clip_by_rect(
+            aoi,
+            minx,
+            maxy - (row + chipsize) * RESOLUTION,
+            maxx,
+            maxy - row * RESOLUTION,
+        )
+        if shapely.is_empty(strip):
+            continue
+
+        candidates = ChipTable(
+            np.full_like(lattice, row), lattice, chipsize, minx, maxy
+        )
+        shapely.prepare(strip)
+        hits = shapely.intersects(strip, candidates.geometry)
+        rows.append(candidates.rows[hits])
+        cols.append(candidates.cols[hits])
+
+        while sum(len(r) for r in rows) >= batch:
+            rows, cols = [np.concatenate(rows)], [np.concatenate(cols)]
+            yield ChipTable(
+                rows[0][:batch],
+                cols[0][:batch],
+                chipsize,
+                minx,
+                maxy,
+                ids=np.arange(n_chips, n_chips + batch),
+            )
+            rows, cols, n_chips = [rows[0][batch:]], [cols[0][batch:]], n_chips + batch
+
+    rows, cols = np.concatenate(rows or [[]]), np.concatenate(cols or [[]])
+    if len(rows):
+        yield ChipTable(
+            rows,
+            cols,
+            chipsize,
+            minx,
+            maxy,
+            ids=np.arange(n_chips, n_chips + len(rows)),
+        )
+
+
+def sample_chips(
+    chips: ChipTable, n: int, coverage: np.ndarray, strata: int = 4, seed: int = 0
+) -> ChipTable:
+    """a deterministic sample of at most `n` chips, stratified by target coverage.
+
+    Chips without targets form one stratum and the rest are split into `strata - 1`
+    coverage quantiles. The sample is spread evenly over the strata, and a stratum
+    too small for its share passes the remainder on to the others.
+    """
+
+    if len(chips) <= n:
+        return chips
+
+    coverage = np.asarray(coverage, dtype=np.float64)
+    stratum = np.zeros(len(chips), dtype=np.int64)
+    covered = coverage > 0
+    if covered.any() and strata > 1:
+        edges = np.quantile(coverage[covered], np.linspace(0, 1, strata)[1:-1])
+        stratum[covered] = 1 + np.searchsorted(edges, coverage[covered], side="right")
+
+    rng = np.random.default_rng(seed)
+    members = [rng.permutation(np.flatnonzero(stratum == s)) for s in range(strata)]
+    members = sorted((m for m in members if len(m)), key=len)
+
+    picked = []
+    for kk, idx in enumerate(members):
+        share = (n - sum(len(p) for p in picked)) // (len(members) - kk)
+        picked.append(idx[:share])
+
+    return chips[np.sort(np.concatenate(picked))]
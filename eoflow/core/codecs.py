@@ -0,0 +1,84 @@
+import time
+from enum import Enum
+
+import numpy as np
+from numcodecs import LZ4, Blosc, Shuffle, Zstd
+
+
+class CodecEnum(str, Enum):
+    NONE = "none"
+    LZ4 = "lz4"  # byte-shuffle + lz4, fastest
+    ZSTD = "zstd"  # byte-shuffle + zstd, smallest
+    BLOSC = "blosc"  # blosc-zstd with its own multithreaded byte-shuffle
+
+
+def compress(data: np.ndarray, codec: CodecEnum, level: int = 3) -> bytes:
+    """compress an array's bytes, byte-shuffled by the array's itemsize"""
+
+    if codec == CodecEnum.NONE:
+        return data.tobytes()
+
+    elif codec == CodecEnum.BLOSC:
+        return Blosc(cname="zstd", clevel=level, shuffle=Blosc.SHUFFLE).encode(data)
+
+    shuffled = Shuffle(elementsize=data.dtype.itemsize).encode(data)
+
+    if codec == CodecEnum.LZ4:
+        """lz4 trades ratio for speed and has no level"""
+        return LZ4().encode(shuffled)
+
+    elif codec == CodecEnum.ZSTD:
+        return Zstd(level=level).encode(shuffled)
+
+    raise NotImplementedError(f"codec {codec} not supported")
+
+
+def decompress(buffer: bytes, codec: CodecEnum, dtype: np.dtype = np.uint8) -> bytes:
+    """invert `compress` for data of `dtype`"""
+
+    if codec == CodecEnum.NONE:
+        return bytes(buffer)
+
+    elif codec == CodecEnum.BLOSC:
+        return bytes(Blosc().decode(buffer))
+
+    elif codec == CodecEnum.LZ4:
+        shuffled = LZ4().decode(buffer)
+
+    elif codec == CodecEnum.ZSTD:
+        shuffled = Zstd().decode(buffer)
+
+    else:
+        raise NotImplementedError(f"codec {codec} not supported")
+
+    return bytes(Shuffle(elementsize=np.dtype(dtype).itemsize).decode(shuffled))
+
+
+def benchmark_codecs(
+    chips: np.ndarray, levels: tuple[int, ...] = (1, 3, 9), repeat: int = 3
+) -> list[dict]:
+    """compression ratio and encode/decode throughput (MB/s) of each codec on chips"""
+
+    results = []
+    for codec in CodecEnum:
+        for level in levels if codec in (CodecEnum.ZSTD, CodecEnum.BLOSC) else (0,):
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                buffers = [compress(chip, codec, level) for chip in chips]
+            t1 = time.perf_counter()
+            for _ in range(repeat):
+                [decompress(b, codec, chips.dtype) for b in buffers]
+            t2 = time.perf_counter()
+
+            mb = chips.nbytes * repeat / 1e6
+            results.append(
+                {
+                    "codec": codec.value,
+                    "level": level,
+                    "ratio": chips.nbytes / sum(len(b) for b in buffers),
+                    "encode_mbps": mb / (t1 - t0),
+                    "decode_mbps": mb / (t2 - t1),
+                }
+            )
+
+    return results
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+def composite_pixels(arr: np.ndarray, valid: np.ndarray, method: str) -> np.ndarray:
+    """composite a (R, B, Y, X) stack of revisits, sorted oldest first, to (B, Y, X).
+
+    `valid` is a (R, Y, X) boolean array of usable pixels; pixels with no valid
+    revisit are filled with 0 (nodata). `method` is a CompositeEnum.
+    """
+
+    if method == "FIRST":
+        """the oldest valid revisit"""
+        idx = valid.argmax(axis=0)
+    elif method == "LAST":
+        """the most-recent valid revisit"""
+        idx = valid.shape[0] - 1 - valid[::-1].argmax(axis=0)
+    else:
+        raise NotImplementedError("Only FIRST and LAST composite is supported.")
+
+    out = np.take_along_axis(arr, idx[None, None, :, :], axis=0)[0]
+    out[:, ~valid.any(axis=0)] = 0
+
+    return out
+
+
+def composite_times(valid: np.ndarray, times: np.ndarray, method: str) -> np.ndarray:
+    """the (Y, X) time of the revisit `composite_pixels` picks, 0 where none is valid.
+
+    `times` are the (R,) revisit times as positive integers, e.g. unix seconds.
+    """
+
+    if valid.shape[0] == 0:
+        return np.zeros(valid.shape[1:], dtype=np.int64)
+
+    if method == "FIRST":
+        idx = valid.argmax(axis=0)
+    elif method == "LAST":
+        idx = valid.shape[0] - 1 - valid[::-1].argmax(axis=0)
+    else:
+        raise NotImplementedError("Only FIRST and LAST composite is supported.")
+
+    return np.where(valid.any(axis=0), np.asarray(times, dtype=np.int64)[idx], 0)
+
+
+def merge_composites(
+    prev: np.ndarray,
+    prev_times: np.ndarray,
+    new: np.ndarray,
+    new_times: np.ndarray,
+    method: str,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """fold a composite of new revisits into a previous composite, pixel by pixel.
+
+    Each composite is (B, Y, X) with the (Y, X) time of the revisit behind each
+    pixel (0 = no valid revisit). Returns the merged composite, its times, and the
+    (Y, X) mask of pixels that changed.
+    """
+
+    if method == "LAST":
+        take = new_times > prev_times
+    elif method == "FIRST":
+        take = (new_times > 0) & ((prev_times == 0) | (new_times < prev_times))
+    else:
+        raise NotImplementedError("Only FIRST and LAST composite is supported.")
+
+    return (
+        np.where(take[None], new, prev),
+        np.where(take, new_times, prev_times),
+        take,
+    )
@@ -0,0 +1,98 @@
+from enum import Enum
+
+import numpy as np
+
+
+class TargetEncodingEnum(str, Enum):
+    RAW = "raw"  # uint8 chipsize x chipsize raster
+    BITPACK = "bitpack"  # 1 bit per pixel, binary targets only
+    RLE = "rle"  # run-length (length, value) pairs
+    SPARSE = "sparse"  # (flat index, value) of non-zero pixels
+
+
+TARGET_SUFFIX = {
+    TargetEncodingEnum.RAW: "npy",
+    TargetEncodingEnum.BITPACK: "bitpack",
+    TargetEncodingEnum.RLE: "rle",
+    TargetEncodingEnum.SPARSE: "sparse",
+}
+
+
+def _pack_pairs(keys: np.ndarray, values: np.ndarray) -> bytes:
+    """[n: uint32][keys: n x uint32][values: n x uint8]"""
+    return (
+        np.uint32(len(keys)).tobytes()
+        + keys.astype(np.uint32).tobytes()
+        + values.astype(np.uint8).tobytes()
+    )
+
+
+def _unpack_pairs(buffer: bytes) -> tuple[np.ndarray, np.ndarray]:
+    n = int(np.frombuffer(buffer, dtype=np.uint32, count=1)[0])
+    keys = np.frombuffer(buffer, dtype=np.uint32, count=n, offset=4)
+    values = np.frombuffer(buffer, dtype=np.uint8, count=n, offset=4 + 4 * n)
+    return keys, values
+
+
+def encode_target(img: np.ndarray, encoding: TargetEncodingEnum) -> bytes:
+    """encode a uint8 target raster to bytes"""
+
+    flat = img.ravel()
+
+    if encoding == TargetEncodingEnum.RAW:
+        return img.astype(np.uint8).tobytes()
+
+    elif encoding == TargetEncodingEnum.BITPACK:
+        if not np.isin(flat, (0, 255)).all():
+            raise ValueError("bitpack encoding only supports binary (0/255) targets")
+        return np.packbits(flat > 0).tobytes()
+
+    elif encoding == TargetEncodingEnum.RLE:
+        starts = np.flatnonzero(np.diff(flat, prepend=~flat[:1]))
+        lengths = np.diff(starts, append=flat.size)
+        return _pack_pairs(lengths, flat[starts])
+
+    elif encoding == TargetEncodingEnum.SPARSE:
+        idx = np.flatnonzero(flat)
+        return _pack_pairs(idx, flat[idx])
+
+    raise NotImplementedError(f"target encoding {encoding} not supported")
+
+
+def decode_target(
+    buffer: bytes, encoding: TargetEncodingEnum, shape: tuple[int, int]
+) -> np.ndarray:
+    """decode bytes to a uint8 target raster of `shape`"""
+
+    return decode_targets([buffer], encoding, shape)[0]
+
+
+def decode_targets(
+    buffers: list[bytes], encoding: TargetEncodingEnum, shape: tuple[int, int]
+) -> np.ndarray:
+    """decode a batch of encoded targets to a (N, *shape) uint8 array in one pass"""
+
+    n_px = shape[0] * shape[1]
+
+    if encoding == TargetEncodingEnum.RAW:
+        out = np.frombuffer(b"".join(buffers), dtype=np.uint8)
+
+    elif encoding == TargetEncodingEnum.BITPACK:
+        packed = np.frombuffer(b"".join(buffers), dtype=np.uint8)
+        out = np.unpackbits(packed.reshape(len(buffers), -1), axis=1, count=n_px)
+        out *= 255
+
+    elif encoding == TargetEncodingEnum.RLE:
+        lengths, values = zip(*(_unpack_pairs(b) for b in buffers))
+        out = np.repeat(np.concatenate(values), np.concatenate(lengths))
+
+    elif encoding == TargetEncodingEnum.SPARSE:
+        idx, values = zip(*(_unpack_pairs(b) for b in buffers))
+        offsets = np.repeat(np.arange(len(buffers)) * n_px, [len(i) for i in idx])
+        out = np.zeros(len(buffers) * n_px, dtype=np.uint8)
+        out[np.concatenate(idx).astype(np.int64) + offsets] = np.concatenate(values)
+
+    else:
+        raise NotImplementedError(f"target encoding {encoding} not supported")
+
+    return out.reshape(len(buffers), *shape)
@@ -0,0 +1,262 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from cloudpathlib import AnyPath, CloudPath
+
+from eoflow.core.stats import merge_moments
+
+INDEX_SCHEMA = pa.schema(
+    [
+        ("tile", pa.string()),
+        ("chip_ii", pa.int64()),
+        ("chip_idx", pa.string()),
+        ("chip_path", pa.string()),
+        ("chip_offset", pa.int64()),
+        ("chip_nbytes", pa.int64()),
+        ("chip_codec", pa.string()),
+        ("quant_dtype", pa.string()),
+        ("quant_scale", pa.float64()),
+        ("quant_offset", pa.float64()),
+        ("target_path", pa.string()),
+        ("target_offset", pa.int64()),
+        ("target_nbytes", pa.int64()),
+        ("target_encoding", pa.string()),
+        ("target_codec", pa.string()),
+        ("chip_crs", pa.string()),
+        ("minx", pa.float64()),  # chip bounds in chip_crs
+        ("miny", pa.float64()),
+        ("maxx", pa.float64()),
+        ("maxy", pa.float64()),
+        ("lon_min", pa.float64()),  # chip bounds in EPSG:4326
+        ("lat_min", pa.float64()),
+        ("lon_max", pa.float64()),
+        ("lat_max", pa.float64()),
+        ("time_start", pa.timestamp("us", tz="UTC")),  # revisits composited
+        ("time_end", pa.timestamp("us", tz="UTC")),
+    ]
+)
+
+# columns flattened from nested ChipMetaData fields
+NESTED = {
+    "quant_dtype": ("chip_quantization", "dtype"),
+    "quant_scale": ("chip_quantization", "scale"),
+    "quant_offset": ("chip_quantization", "offset"),
+    "minx": ("chip_bounds", 0),
+    "miny": ("chip_bounds", 1),
+    "maxx": ("chip_bounds", 2),
+    "maxy": ("chip_bounds", 3),
+    "lon_min": ("chip_bounds_wgs", 0),
+    "lat_min": ("chip_bounds_wgs", 1),
+    "lon_max": ("chip_bounds_wgs", 2),
+    "lat_max": ("chip_bounds_wgs", 3),
+}
+
+# low-cardinality columns, read back dictionary-encoded
+CATEGORICAL = [
+    "tile",
+    "chip_path",
+    "chip_codec",
+    "quant_dtype",
+    "target_path",
+    "target_encoding",
+    "target_codec",
+    "chip_crs",
+]
+
+
+def _band_name(band) -> str:
+    return getattr(band, "value", band)
+
+
+def chips_to_table(
+    chips: list[dict], bands: list[str], metadata: Optional[dict] = None
+) -> pa.Table:
+    """flatten ChipMetaData records (`model_dump(mode="json")`) to a typed table.
+
+    Per-band stats become `mean_{band}` / `std_{band}` columns and target pixel
+    counts become one `px_{value}` column per class value. `metadata` is stored
+    json-encoded on the table schema.
+    """
+
+    def _column(name):
+        if name not in NESTED:
+            return [chip.get(name) for chip in chips]
+        field, key = NESTED[name]
+        return [None if chip.get(field) is None else chip[field][key] for chip in chips]
+
+    arrays = [
+        # timestamps arrive as iso strings, which arrow parses on cast
+        (
+            pa.array(_column(f.name), type=pa.string()).cast(f.type)
+            if pa.types.is_timestamp(f.type)
+            else pa.array(_column(f.name), type=f.type)
+        )
+        for f in INDEX_SCHEMA
+    ]
+    fields = list(INDEX_SCHEMA)
+
+    for stat, dtype in (
+        ("count", pa.int64()),
+        ("mean", pa.float64()),
+        ("std", pa.float64()),
+    ):
+        values = np.array(
+            [chip["chip_stats"].get(stat) or [np.nan] * len(bands) for chip in chips],
+            dtype=np.float64,
+        ).reshape(len(chips), len(bands))
+        for ii, band in enumerate(bands):
+            arrays.append(pa.array(values[:, ii], from_pandas=True).cast(dtype))
+            fields.append(pa.field(f"{stat}_{_band_name(band)}", dtype))
+
+    classes = sorted({int(k) for chip in chips for k in chip["target_pxcount"]})
+    for value in classes:
+        counts = [chip["target_pxcount"].get(str(value), 0) for chip in chips]
+        arrays.append(pa.array(counts, type=pa.int64()))
+        fields.append(pa.field(f"px_{value}", pa.int64()))
+
+    schema = pa.schema(fields, metadata=_encode_metadata(metadata))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _encode_metadata(metadata: Optional[dict]) -> Optional[dict]:
+    if metadata is None:
+        return None
+    return {k: json.dumps(v) for k, v in metadata.items()}
+
+
+def index_metadata(schema: pa.Schema) -> dict:
+    """the json metadata stored on an index table schema"""
+    return {
+        k.decode(): json.loads(v)
+        for k, v in (schema.metadata or {}).items()
+        if not k.startswith(b"ARROW")
+    }
+
+
+def read_index_metadata(path: str) -> dict:
+    """the json metadata of an index file, without reading any rows"""
+    return index_metadata(pq.read_metadata(_source(path)))
+
+
+def write_index(table: pa.Table, path: str):
+    """write an index table to a local or cloud parquet file"""
+    with AnyPath(path).open("wb") as f:
+        pq.write_table(table, f, compression="zstd")
+
+
+def _source(path: str):
+    pth = AnyPath(path)
+    return pth.fspath if isinstance(pth, CloudPath) else str(pth)
+
+
+def read_index(
+    path: str, columns: Optional[list[str]] = None, filters=None
+) -> pa.Table:
+    """read an index, pushing column selection and row `filters` down to parquet.
+
+    e.g. `read_index(path, filters=[("tile", "=", "30UXC"), ("px_255", ">", 0)])`
+    """
+    return pq.read_table(
+        _source(path),
+        columns=columns,
+        filters=filters,
+        read_dictionary=[c for c in CATEGORICAL if columns is None or c in columns],
+    )
+
+
+def _conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """add any columns missing from a tile table: zero pixel counts, else nulls"""
+
+    arrays = []
+    for field in schema:
+        if field.name in table.column_names:
+            arrays.append(table[field.name].cast(field.type))
+        elif field.name.startswith("px_"):
+            arrays.append(pa.array(np.zeros(len(table), dtype=np.int64)))
+        else:
+            arrays.append(pa.nulls(len(table), type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def merge_index_files(paths: list[str], out_path: str, workers: int = 16) -> dict:
+    """stream per-tile index files into one dataset index.
+
+    Tile files are read `workers` at a time and written out as row groups as they
+    arrive, so memory is bounded by the read window rather than the dataset. The
+    merged metadata sums `duplicate_chips` and the tile histograms, and pools the
+    chip stats per band exactly (see eoflow.core.stats.merge_moments).
+    """
+
+    with ThreadPoolExecutor(workers) as pool:
+        schemas = list(pool.map(lambda p: pq.read_schema(_source(p)), paths))
+        schema = pa.unify_schemas([s.remove_metadata() for s in schemas])
+        bands = [n[len("mean_") :] for n in schema.names if n.startswith("mean_")]
+
+        n_chips, duplicate_chips = 0, 0
+        pooled = []  # (count, mean, M2) per tile
+        hist, hist_range = None, None
+
+        with AnyPath(out_path).open("wb") as f:
+            with pq.ParquetWriter(f, schema, compression="zstd") as writer:
+                for ii in range(0, len(paths), workers):
+                    window = paths[ii : ii + workers]  # noqa: E203
+                    for table in pool.map(read_index, window):
+                        metadata = index_metadata(table.schema)
+                        duplicate_chips += metadata.get("duplicate_chips", 0)
+                        if metadata.get("histogram") is not None:
+                            hist = np.add(hist or 0, metadata["histogram"]).tolist()
+                            hist_range = metadata["hist_range"]
+
+                        table = _conform(table, schema)
+                        writer.write_table(table)
+                        n_chips += len(table)
+                        pooled.append(_tile_moments(table, bands))
+
+                count, mean, m2 = merge_moments(
+                    *(
+                        (np.array(m).reshape(-1, len(bands)) for m in zip(*pooled))
+                        if pooled
+                        else (np.zeros((0, len(bands))),) * 3
+                    )
+                )
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    sd = np.sqrt(m2 / count)
+
+                metadata = {
+                    "n_chips": n_chips,
+                    "duplicate_chips": duplicate_chips,
+                    "chip_stats": {
+                        "mean": _nan2none(mean),
+                        "std": _nan2none(sd),
+                        "count": count.tolist(),
+                    },
+                    "histogram": hist,
+                    "hist_range": hist_range,
+                }
+                writer.add_key_value_metadata(_encode_metadata(metadata))
+
+    return metadata
+
+
+def _column(table: pa.Table, name: str) -> np.ndarray:
+    return table[name].to_numpy(zero_copy_only=False).astype(np.float64)
+
+
+def _tile_moments(table: pa.Table, bands: list[str]):
+    """pooled (count, mean, M2) per band of a tile's chips"""
+
+    count = np.column_stack([_column(table, f"count_{b}") for b in bands])
+    mean = np.column_stack([_column(table, f"mean_{b}") for b in bands])
+    sd = np.column_stack([_column(table, f"std_{b}") for b in bands])
+    # chips indexed before counts were recorded are weighted equally
+    count = np.where(np.isnan(count), 1, count)
+
+    return merge_moments(count, mean, sd**2 * count)
+
+
+def _nan2none(values: np.ndarray) -> list:
+    return [None if np.isnan(v) else float(v) for v in values]
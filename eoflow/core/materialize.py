@@ -11,27 +11,72 @@ def materialize_tile(
     config: DataSpec,
     logger=local_logger,
     run_id=None,
+    tiles=None,
+    resume=True,
 ):
-    """Materialize (i.e. fetch data; mask; composite; and store) a single tile of the dataspec."""
+    """Materialize (i.e. fetch data; mask; composite; and store) a single tile of the dataspec.
+
+    If `tiles` lists all tiles of the run, chips owned by an overlapping tile are skipped.
+    With `resume`, batches of chips stored by an earlier attempt are kept, and a tile
+    that is already complete is not fetched again.
+    If the dataspec extends a `previous_store`, only revisits that run didn't composite
+    are fetched, and only the chips they change are stored again.
+    """
 
     tic = time.time()
 
     logger.info(f"{tile.tile}:{time.time() - tic:.2f} Materializing...")
-    archive = Archive(cfg=config, tile=tile, revisits=revisits, run_id=run_id)
-
-    logger.info(
-        f"{tile.tile}:{time.time() - tic:.2f} Built Archive, {len(archive.chips)} chips"
+    archive = Archive(
+        cfg=config, tile=tile, revisits=revisits, run_id=run_id, tiles=tiles
     )
-    archive.fill()
 
-    logger.info(
-        f"{tile.tile}:{time.time() - tic:.2f} Filled Archive, shape: {archive.z.shape}"
-    )
-    archive.mask()
+    if config.previous_store is not None:
+        logger.info(
+            f"{tile.tile}:{time.time() - tic:.2f} Extending {config.previous_store}, "
+            f"{len(archive.revisits)} new revisits"
+        )
+
+    if archive.chips is None:
+        logger.info(f"{tile.tile}:{time.time() - tic:.2f} Built Archive, streaming AOI")
+    else:
+        logger.info(
+            f"{tile.tile}:{time.time() - tic:.2f} Built Archive, {len(archive.chips)} chips, "
+            f"{archive.duplicate_chips} left to overlapping tiles"
+        )
 
-    logger.info(f"{tile.tile}:{time.time() - tic:.2f} Built Mask")
+    remaining = archive.resume() if resume else None
+    if archive.completed:
+        logger.info(
+            f"{tile.tile}:{time.time() - tic:.2f} Resuming, {len(archive.completed)} "
+            f"batches already stored, {remaining} to go"
+        )
+    if remaining == 0:
+        idx = archive.materialize()
+        logger.info(
+            f"{tile.tile}:{time.time() - tic:.2f} Already materialized! {len(idx.chips)} chips"
+        )
+        return idx
+
+    uncached = archive.uncached_blocks()
+    if uncached == 0:
+        # every block the chips need was composited by an earlier run
+        logger.info(f"{tile.tile}:{time.time() - tic:.2f} All blocks cached")
+    elif not archive.revisits:
+        # a delta run with no new revisits recomposites from the previous state only
+        logger.info(f"{tile.tile}:{time.time() - tic:.2f} No new revisits")
+    else:
+        archive.fill()
+
+        logger.info(
+            f"{tile.tile}:{time.time() - tic:.2f} Filled Archive, shape: {archive.z.shape}"
+        )
+        archive.mask()
+
+        logger.info(f"{tile.tile}:{time.time() - tic:.2f} Built Mask")
 
     # composite and materialize, returning the index
     idx = archive.materialize()
-    logger.info(f"{tile.tile}:{time.time() - tic:.2f} Materialized Archived!")
+    logger.info(
+        f"{tile.tile}:{time.time() - tic:.2f} Materialized Archived! {len(idx.chips)} chips"
+    )
     return idx
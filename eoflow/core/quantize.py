@@ -0,0 +1,58 @@
+from enum import Enum
+
+import numpy as np
+from pydantic import BaseModel
+
+
+class ChipDtypeEnum(str, Enum):
+    UINT16 = "uint16"  # raw reflectance, no clip or rescale
+    UINT16_SCALED = "uint16_scaled"  # clipped and rescaled, 65536 levels
+    FLOAT16 = "float16"  # clipped and rescaled
+    UINT8 = "uint8"  # clipped and rescaled, 256 levels
+
+
+QUANT_LEVELS = {ChipDtypeEnum.UINT16_SCALED: 65535, ChipDtypeEnum.UINT8: 255}
+
+
+class Quantization(BaseModel):
+    """how to invert a stored chip: value = stored * scale + offset"""
+
+    dtype: ChipDtypeEnum = ChipDtypeEnum.UINT16
+    scale: float = 1.0
+    offset: float = 0.0
+
+    @property
+    def numpy_dtype(self) -> np.dtype:
+        return np.dtype(self.dtype.value.replace("_scaled", ""))
+
+
+def quantize(
+    arr: np.ndarray,
+    dtype: ChipDtypeEnum,
+    clip: tuple[int, int],
+    rescale: tuple[float, float],
+) -> tuple[np.ndarray, Quantization]:
+    """clip raw reflectance to `clip`, map it linearly onto `rescale`, and store it
+    as `dtype`. Returns the stored array and its inverse.
+    """
+
+    if dtype == ChipDtypeEnum.UINT16:
+        return arr.astype(np.uint16, copy=False), Quantization()
+
+    (c0, c1), (r0, r1) = clip, rescale
+    unit = (np.clip(arr, c0, c1).astype(np.float32) - c0) / (c1 - c0)  # [0, 1]
+
+    if dtype == ChipDtypeEnum.FLOAT16:
+        return (unit * (r1 - r0) + r0).astype(np.float16), Quantization(dtype=dtype)
+
+    levels = QUANT_LEVELS[dtype]
+    quantization = Quantization(dtype=dtype, scale=(r1 - r0) / levels, offset=r0)
+    return (
+        np.rint(unit * levels).astype(quantization.numpy_dtype),
+        quantization,
+    )
+
+
+def dequantize(arr: np.ndarray, quantization: Quantization) -> np.ndarray:
+    """invert `quantize` to float32 values in the rescaled range"""
+    return arr.astype(np.float32) * quantization.scale + quantization.offset
@@ -0,0 +1,99 @@
+from datetime import datetime
+from functools import cached_property
+from typing import Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import shapely
+
+from eoflow.core.index import read_index
+
+
+def _timestamp(dt: datetime) -> pa.Scalar:
+    """a utc timestamp scalar, naive datetimes are taken to be utc"""
+    return pa.scalar(dt, type=pa.timestamp("us", tz="UTC"))
+
+
+class ChipQuery:
+    """Select chips from a dataset index by footprint, tile, time and class pixels.
+
+    Footprints are indexed in EPSG:4326 with an STRtree, so chips of tiles in
+    different UTM zones can be queried together. The tree is built on the first
+    spatial query; every query after that takes milliseconds.
+    """
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+
+    @classmethod
+    def from_index(cls, path: str, columns: Optional[list[str]] = None):
+        """load the columns of an index file needed to query and use the chips"""
+        return cls(read_index(path, columns=columns))
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    @cached_property
+    def tree(self) -> shapely.STRtree:
+        bounds = [
+            self.table[c].to_numpy(zero_copy_only=False)
+            for c in ("lon_min", "lat_min", "lon_max", "lat_max")
+        ]
+        return shapely.STRtree(shapely.box(*bounds))
+
+    def mask(
+        self,
+        geometry: Union[shapely.Geometry, tuple[float, float, float, float]] = None,
+        tiles: Optional[list[str]] = None,
+        min_pxcount: Optional[dict[int, int]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> np.ndarray:
+        """boolean mask of the chips matching every given criterion.
+
+        `geometry` is a shapely geometry or (minx, miny, maxx, maxy) bbox in
+        EPSG:4326; `min_pxcount` maps target class values to the minimum number of
+        pixels of that class; `start` / `end` keep chips whose composited revisits
+        overlap the interval.
+        """
+
+        mask = np.ones(len(self.table), dtype=bool)
+
+        if geometry is not None:
+            if isinstance(geometry, tuple):
+                geometry = shapely.box(*geometry)
+            hits = np.zeros_like(mask)
+            hits[self.tree.query(geometry, predicate="intersects")] = True
+            mask &= hits
+
+        if tiles is not None:
+            tile = self.table["tile"].cast(pa.string())
+            mask &= pc.is_in(tile, value_set=pa.array(tiles)).to_numpy(
+                zero_copy_only=False
+            )
+
+        for value, count in (min_pxcount or {}).items():
+            if f"px_{value}" not in self.table.column_names:
+                mask &= count <= 0
+                continue
+            mask &= self.table[f"px_{value}"].to_numpy(zero_copy_only=False) >= count
+
+        if start is not None:
+            mask &= pc.fill_null(
+                pc.greater_equal(self.table["time_end"], _timestamp(start)), False
+            ).to_numpy(zero_copy_only=False)
+        if end is not None:
+            mask &= pc.fill_null(
+                pc.less_equal(self.table["time_start"], _timestamp(end)), False
+            ).to_numpy(zero_copy_only=False)
+
+        return mask
+
+    def query(self, columns: Optional[list[str]] = None, **criteria) -> pa.Table:
+        """the rows of the chips matching `criteria` (see `mask`), e.g.
+        `query(geometry=bbox, min_pxcount={255: 1}, columns=["chip_idx", "chip_path"])`
+        """
+
+        table = self.table.filter(pa.array(self.mask(**criteria)))
+        return table if columns is None else table.select(columns)
@@ -0,0 +1,199 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from cloudpathlib import AnyPath, CloudPath
+
+# the S2IndexDF columns, mgrs_tile being the partition key
+REVISIT_SCHEMA = pa.schema(
+    [
+        ("granule_id", pa.string()),
+        ("product_id", pa.string()),
+        ("datatake_identifier", pa.string()),
+        ("mgrs_tile", pa.string()),
+        ("sensing_time", pa.timestamp("us", tz="UTC")),
+        ("base_url", pa.string()),
+        ("source_url", pa.string()),
+        ("total_size", pa.int64()),
+        ("cloud_cover", pa.float64()),
+    ]
+)
+
+# granules are indexed hours to days after sensing, so refreshes re-read a margin
+LOOKBACK = timedelta(days=3)
+
+
+def _utc(value: Union[str, datetime]) -> datetime:
+    """a utc datetime, naive values are taken to be utc"""
+    ts = pd.Timestamp(value)
+    return (
+        ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    ).to_pydatetime()
+
+
+def _conform(table: pa.Table) -> pa.Table:
+    """`table` with exactly the revisit columns, in order and cast to their types"""
+    return pa.Table.from_arrays(
+        [table[f.name].cast(f.type) for f in REVISIT_SCHEMA], schema=REVISIT_SCHEMA
+    )
+
+
+def query_bigquery(tiles: list[str], start, end) -> pa.Table:
+    """the revisits of `tiles` sensed in (start, end] from the public BigQuery index"""
+
+    from google.cloud import bigquery
+
+    start, end = _utc(start), _utc(end)
+    query_tiles = ",".join(f"'{tile}'" for tile in tiles)
+    Q = f"""
+        SELECT
+          {",".join(REVISIT_SCHEMA.names)}
+        FROM `bigquery-public-data.cloud_storage_geo_index.sentinel_2_sr_index`
+        WHERE sensing_time > '{start.isoformat()}'
+        AND sensing_time <= '{end.isoformat()}'
+        AND mgrs_tile IN ({query_tiles})
+    """
+    return _conform(bigquery.Client().query(Q).result().to_arrow())
+
+
+class RevisitIndex:
+    """A parquet cache of the S2 revisit index, partitioned by mgrs_tile.
+
+    Each tile is stored at `{root}/mgrs_tile={tile}/revisits.parquet`, sorted by
+    sensing_time, with the (start, end] sensing interval it covers in its metadata.
+    `refresh` fetches only what a tile is missing, re-reading a `lookback` margin
+    at its end for late-indexed granules, and `revisits` answers from the cache,
+    pushing the time window down to parquet. `root` may be local or a bucket.
+
+    `fetch(tiles, start, end)` returns the revisits sensed in (start, end] as an
+    arrow table; it defaults to the BigQuery index, and is only called for
+    intervals the cache does not cover.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        fetch: Callable[[list[str], datetime, datetime], pa.Table] = query_bigquery,
+        lookback: timedelta = LOOKBACK,
+    ):
+        self.root = root
+        self.fetch = fetch
+        self.lookback = lookback
+
+    def _path(self, tile: str) -> AnyPath:
+        return AnyPath(f"{self.root}/mgrs_tile={tile}/revisits.parquet")
+
+    def _source(self, tile: str) -> Optional[str]:
+        pth = self._path(tile)
+        if not pth.exists():
+            return None
+        return pth.fspath if isinstance(pth, CloudPath) else str(pth)
+
+    def coverage(self, tile: str) -> Optional[tuple[datetime, datetime]]:
+        """the (start, end] sensing interval cached for `tile`, if any"""
+
+        source = self._source(tile)
+        if source is None:
+            return None
+        meta = json.loads(pq.read_schema(source).metadata[b"coverage"])
+        return _utc(meta["start"]), _utc(meta["end"])
+
+    def update(self, tile: str, table: pa.Table, start: datetime, end: datetime):
+        """merge the revisits of `tile` sensed in (start, end] into the cache"""
+
+        start, end = _utc(start), _utc(end)
+        table = _conform(table)
+        tables = [table.filter(pc.equal(table["mgrs_tile"], tile))]
+
+        covered = self.coverage(tile)
+        if covered is not None:
+            tables.insert(0, self.read(tile))
+            start, end = min(start, covered[0]), max(end, covered[1])
+
+        # newer fetches replace cached rows of the same granule
+        merged = pa.concat_tables(tables)
+        ids = merged["granule_id"].to_numpy(zero_copy_only=False)[::-1]
+        _, last = np.unique(ids, return_index=True)
+        merged = merged.take(len(merged) - 1 - last)
+        merged = merged.sort_by("sensing_time").drop_columns("mgrs_tile")
+
+        meta = {"start": start.isoformat(), "end": end.isoformat()}
+        merged = merged.replace_schema_metadata({"coverage": json.dumps(meta)})
+        pth = self._path(tile)
+        if not isinstance(pth, CloudPath):
+            pth.parent.mkdir(parents=True, exist_ok=True)
+        with pth.open("wb") as f:
+            pq.write_table(merged, f, compression="zstd")
+
+    def _missing(self, tile: str, start: datetime, end: datetime):
+        """the (start, end] interval to fetch for `tile`, None if it is covered"""
+
+        covered = self.coverage(tile)
+        if covered is None:
+            return start, end
+
+        lo, hi = covered
+        if start >= lo and end <= hi:
+            return None
+
+        # extend the cached interval contiguously on whichever side is missing
+        fetch_start = start if start < lo else max(hi - self.lookback, lo)
+        fetch_end = end if end > hi else lo
+        return fetch_start, fetch_end
+
+    def refresh(self, tiles: list[str], start, end) -> int:
+        """fetch what the cache is missing of (start, end] for `tiles`, returning
+        the number of revisits fetched"""
+
+        # nothing sensed after now can be cached
+        start, end = _utc(start), min(_utc(end), datetime.now(timezone.utc))
+
+        intervals = defaultdict(list)
+        for tile in tiles:
+            missing = self._missing(tile, start, end)
+            if missing is not None:
+                intervals[missing].append(tile)
+
+        n = 0
+        for (fetch_start, fetch_end), group in intervals.items():
+            table = _conform(self.fetch(group, fetch_start, fetch_end))
+            for tile in group:
+                self.update(tile, table, fetch_start, fetch_end)
+            n += len(table)
+        return n
+
+    def read(self, tile: str, start=None, end=None) -> pa.Table:
+        """the cached revisits of `tile`, sensed in (start, end] if given"""
+
+        source = self._source(tile)
+        if source is None:
+            return REVISIT_SCHEMA.empty_table()
+
+        filters = []
+        if start is not None:
+            filters.append(("sensing_time", ">", _utc(start)))
+        if end is not None:
+            filters.append(("sensing_time", "<=", _utc(end)))
+
+        table = pq.read_table(source, filters=filters or None)
+        table = table.append_column(
+            "mgrs_tile", pa.array([tile] * len(table), pa.string())
+        )
+        return _conform(table.replace_schema_metadata(None))
+
+    def revisits(self, tiles: list[str], start, end, refresh: bool = True) -> pa.Table:
+        """the revisits of `tiles` sensed in (start, end], refreshing the cache
+        first unless `refresh` is False"""
+
+        if refresh:
+            self.refresh(tiles, start, end)
+        return pa.concat_tables(
+            [REVISIT_SCHEMA.empty_table()]
+            + [self.read(tile, start, end) for tile in tiles]
+        )
@@ -0,0 +1,101 @@
+import threading
+from typing import Optional
+
+import numpy as np
+from cloudpathlib import AnyPath, CloudPath
+
+SHARD_MAGIC = b"EOSHARD1"
+SHARD_SUFFIX = "shard"
+
+
+class ShardWriter:
+    """Pack many small payloads into one object with a trailing offset table.
+
+    Layout: [payload 0]...[payload n-1][keys: n x int64][offsets: n x uint64]
+    [nbytes: n x uint64][n: uint64][magic]. Payloads are written to a file as they
+    are added, so a shard never has to be held in memory, and `add` is safe to call
+    from concurrent workers. Any payload can later be fetched with a single range
+    read from its (offset, nbytes).
+
+    Cloud paths are not streamed: cloudpathlib writes to a local cache file and only
+    uploads the whole shard on `close`, so each open shard takes its full size of
+    local disk until then.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(AnyPath(path))
+        self.keys, self.offsets, self.nbytes = [], [], []
+        self._f = AnyPath(path).open("wb")
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: int, payload: bytes) -> tuple[int, int]:
+        """append a payload, returning its (offset, nbytes) in the shard"""
+        with self._lock:
+            offset = self._size
+            self._f.write(payload)
+            self._size += len(payload)
+            self.keys.append(key)
+            self.offsets.append(offset)
+            self.nbytes.append(len(payload))
+        return offset, len(payload)
+
+    def close(self):
+        """write the offset table and flush the shard to its store"""
+        with self._lock:
+            self._f.write(
+                np.asarray(self.keys, dtype=np.int64).tobytes()
+                + np.asarray(self.offsets, dtype=np.uint64).tobytes()
+                + np.asarray(self.nbytes, dtype=np.uint64).tobytes()
+                + np.uint64(len(self.keys)).tobytes()
+                + SHARD_MAGIC
+            )
+            self._f.close()
+
+
+def read_range(path: str, offset: Optional[int] = None, nbytes: Optional[int] = None):
+    """read `nbytes` from `offset` of a local or cloud object in one request.
+
+    With no offset the whole object is read, which keeps per-chip objects readable.
+    """
+
+    pth = AnyPath(path)
+
+    if offset is None:
+        return pth.read_bytes()
+
+    if isinstance(pth, CloudPath):
+        blob = pth.client.client.bucket(pth.bucket).blob(pth.blob)
+        return blob.download_as_bytes(start=offset, end=offset + nbytes - 1)
+
+    with open(pth, "rb") as f:
+        f.seek(offset)
+        return f.read(nbytes)
+
+
+def read_shard_index(path: str) -> dict[int, tuple[int, int]]:
+    """the {key: (offset, nbytes)} table of a shard"""
+
+    size = AnyPath(path).stat().st_size
+    tail = read_range(path, size - 16, 16) if size >= 16 else b""
+    if tail[8:] != SHARD_MAGIC:
+        raise ValueError(f"{path} is not an eoflow shard")
+
+    n = int(np.frombuffer(tail[:8], dtype=np.uint64)[0])
+    table = np.frombuffer(
+        read_range(path, size - 16 - 24 * n, 24 * n), dtype=np.int64
+    ).reshape(3, n)
+
+    return {
+        int(key): (int(offset), int(nbytes))
+        for key, offset, nbytes in zip(*table.tolist())
+    }
+
+
+def read_shard_item(path: str, key: int) -> bytes:
+    """read a single payload of a shard by key, without an external index"""
+    offset, nbytes = read_shard_index(path)[key]
+    return read_range(path, offset, nbytes)
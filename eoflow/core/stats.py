@@ -0,0 +1,98 @@
+from typing import Optional
+
+import numpy as np
+
+
+def _valid(data: np.ndarray, valid: Optional[np.ndarray]) -> np.ndarray:
+    """(B, Y*X) mask of the finite values of `data` in the (Y, X) `valid` mask"""
+    finite = np.isfinite(data)
+    if valid is not None:
+        finite &= np.asarray(valid, dtype=bool).reshape(1, -1)
+    return finite
+
+
+def moments(
+    data: np.ndarray, valid: Optional[np.ndarray] = None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """per-band (count, mean, M2) of the finite values of a (B, Y, X) array, only
+    over the pixels of the (Y, X) `valid` mask if given"""
+
+    data = data.reshape(data.shape[0], -1).astype(np.float64)
+    finite = _valid(data, valid)
+    count = finite.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(finite, data, 0).sum(axis=1) / count
+    m2 = (np.where(finite, data - mean[:, None], 0) ** 2).sum(axis=1)
+    return count, mean, m2
+
+
+def merge_moments(
+    count: np.ndarray, mean: np.ndarray, m2: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """pool (N, B) per-part moments into exact (B,) moments.
+
+    This is the parallel Welford (Chan et al.) update applied to all N parts at
+    once: M2 = sum(M2_i) + sum(n_i * (mean_i - mean)^2).
+    """
+
+    count = np.asarray(count, dtype=np.float64)
+    mean = np.nan_to_num(np.asarray(mean, dtype=np.float64))
+    m2 = np.nan_to_num(np.asarray(m2, dtype=np.float64))
+
+    n = count.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pooled = (count * mean).sum(axis=0) / n
+    m2 = m2.sum(axis=0) + (count * (mean - pooled) ** 2).sum(axis=0)
+
+    return n.astype(np.int64), pooled, m2
+
+
+def std(count: np.ndarray, m2: np.ndarray) -> np.ndarray:
+    """population standard deviation from (count, M2)"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(m2 / count)
+
+
+def histogram(
+    data: np.ndarray,
+    value_range: tuple[float, float],
+    bins: int,
+    valid: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """(B, bins) counts of a (B, Y, X) array on fixed bins over `value_range`.
+
+    Values outside the range fall in the edge bins; non-finite values and pixels
+    outside the (Y, X) `valid` mask are dropped.
+    """
+
+    lo, hi = value_range
+    data = data.reshape(data.shape[0], -1)
+    finite = _valid(data, valid)
+    idx = np.clip(
+        ((np.where(finite, data, lo) - lo) * (bins / (hi - lo))).astype(np.int64),
+        0,
+        bins - 1,
+    )
+    idx += np.arange(data.shape[0])[:, None] * bins
+
+    return np.bincount(idx[finite], minlength=data.shape[0] * bins).reshape(-1, bins)
+
+
+def percentiles(
+    hist: np.ndarray, value_range: tuple[float, float], q: list[float]
+) -> np.ndarray:
+    """(B, len(q)) approximate percentiles from (B, bins) histograms, interpolating
+    linearly within bins."""
+
+    hist = np.asarray(hist, dtype=np.float64)
+    lo, hi = value_range
+    edges = np.linspace(lo, hi, hist.shape[1] + 1)
+    cdf = np.concatenate(
+        [np.zeros((hist.shape[0], 1)), np.cumsum(hist, axis=1)], axis=1
+    )
+
+    out = np.full((hist.shape[0], len(q)), np.nan)
+    for bb in range(hist.shape[0]):
+        if cdf[bb, -1] > 0:
+            out[bb] = np.interp(np.asarray(q) / 100 * cdf[bb, -1], cdf[bb], edges)
+    return out
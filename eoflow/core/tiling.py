@@ -0,0 +1,168 @@
+import os
+import sys
+from functools import lru_cache
+from string import ascii_uppercase
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from mgrs import MGRS
+from pyproj import Transformer
+from shapely import affinity
+
+from eoflow.core.logging import logger
+
+# built ahead of time with `make tile-index`, as the materialize image does
+TILE_INDEX = os.getenv(
+    "EOFLOW_TILE_INDEX",
+    os.path.join(os.path.expanduser("~"), ".cache", "eoflow", "mgrs_tiles.parquet"),
+)
+
+# mgrs latitude bands, 8 degrees each from 80S except X, which runs to 84N
+BANDS = [c for c in ascii_uppercase if c not in "ABIOYZ"]
+SQUARE = 100000  # m, mgrs 100km square
+TILE = 109800  # m, an S2 tile overlaps its neighbours by 9.8km
+SAMPLES = 4  # points per square side used to find its tile ids
+
+
+def _utm_crs(zone: int, north: bool) -> str:
+    return f"EPSG:{(32600 if north else 32700) + zone}"
+
+
+def _zone_tiles(zone: int, mgrs: MGRS) -> set[str]:
+    """the ids of every tile of a utm zone, found by naming a lattice of points in
+    every 100km square that overlaps one of its latitude bands"""
+
+    tiles = set()
+    lon0 = -180 + 6 * (zone - 1)
+    for ii, band in enumerate(BANDS):
+        lat0 = -80 + 8 * ii
+        lat1 = 84 if band == "X" else lat0 + 8
+        to_utm = Transformer.from_crs(
+            "EPSG:4326", _utm_crs(zone, lat0 >= 0), always_xy=True
+        )
+        to_wgs = Transformer.from_crs(
+            _utm_crs(zone, lat0 >= 0), "EPSG:4326", always_xy=True
+        )
+
+        # the band's cell of the zone, densified so its utm outline is faithful
+        cell = shapely.segmentize(shapely.box(lon0, lat0, lon0 + 6, lat1), 0.25)
+        coords = shapely.get_coordinates(cell)
+        cell = shapely.set_coordinates(
+            cell, np.column_stack(to_utm.transform(*coords.T))
+        )
+        minx, miny, maxx, maxy = cell.bounds
+
+        offsets = (np.arange(SAMPLES) + 0.5) / SAMPLES * SQUARE
+        for x0 in np.arange(minx // SQUARE * SQUARE, maxx, SQUARE):
+            for y0 in np.arange(miny // SQUARE * SQUARE, maxy, SQUARE):
+                xx, yy = np.meshgrid(x0 + offsets, y0 + offsets)
+                points = shapely.points(xx.ravel(), yy.ravel())
+                inside = shapely.contains(cell, points)
+                if not inside.any():
+                    continue
+                lon, lat = to_wgs.transform(xx.ravel()[inside], yy.ravel()[inside])
+                tiles.update(
+                    mgrs.toMGRS(la, lo, MGRSPrecision=0) for lo, la in zip(lon, lat)
+                )
+    return tiles
+
+
+def _footprints(tiles: list[str]) -> np.ndarray:
+    """the EPSG:4326 footprint of each tile, from its utm corners as in Tile.geometry.
+
+    Footprints crossing the antimeridian are split into a multipolygon.
+    """
+
+    mgrs = MGRS()
+    utm = [mgrs.MGRSToUTM(tile) for tile in tiles]
+    geometries = np.empty(len(tiles), dtype=object)
+
+    keys = {(zone, hemisphere) for zone, hemisphere, _, _ in utm}
+    for zone, hemisphere in keys:
+        idx = [
+            ii for ii, (z, h, _, _) in enumerate(utm) if (z, h) == (zone, hemisphere)
+        ]
+        to_wgs = Transformer.from_crs(
+            _utm_crs(zone, hemisphere == "N"), "EPSG:4326", always_xy=True
+        )
+        x = np.array([utm[ii][2] for ii in idx])[:, None] + [0, TILE, TILE, 0]
+        y = np.array([utm[ii][3] for ii in idx])[:, None] + [
+            SQUARE + 20,
+            SQUARE + 20,
+            SQUARE + 20 - TILE,
+            SQUARE + 20 - TILE,
+        ]
+        lon, lat = to_wgs.transform(x, y)
+
+        wraps = lon.max(axis=1) - lon.min(axis=1) > 180
+        lon[wraps] = np.where(lon[wraps] < 0, lon[wraps] + 360, lon[wraps])
+        polygons = shapely.polygons(np.stack([lon, lat], axis=-1))
+        polygons[wraps] = [
+            shapely.union(
+                shapely.clip_by_rect(p, -180, -90, 180, 90),
+                affinity.translate(shapely.clip_by_rect(p, 180, -90, 540, 90), -360),
+            )
+            for p in polygons[wraps]
+        ]
+        geometries[idx] = polygons
+
+    return geometries
+
+
+def build_tile_index() -> pa.Table:
+    """every S2 tile id and EPSG:4326 footprint on the global mgrs grid"""
+
+    mgrs = MGRS()
+    tiles = sorted(set().union(*(_zone_tiles(zone, mgrs) for zone in range(1, 61))))
+    return pa.table(
+        {
+            "tile": pa.array(tiles, type=pa.string()),
+            "geometry": pa.array(shapely.to_wkb(_footprints(tiles)), type=pa.binary()),
+        }
+    )
+
+
+def write_tile_index(path: str = TILE_INDEX) -> str:
+    """build the tile index and write it to `path`, atomically"""
+
+    logger.info(f"Building the mgrs tile index at {path}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    table = build_tile_index()
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+    logger.info(f"Wrote {len(table)} tiles to {path}")
+    return path
+
+
+@lru_cache
+def load_tile_index(path: str = TILE_INDEX) -> tuple[np.ndarray, shapely.STRtree]:
+    """the tile ids and an STRtree of their footprints, loaded once"""
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No mgrs tile index at {path}, build it first with `make tile-index` "
+            "or set EOFLOW_TILE_INDEX to a built one"
+        )
+
+    table = pq.read_table(path)
+    footprints = shapely.from_wkb(table["geometry"].to_numpy(zero_copy_only=False))
+    return (
+        table["tile"].to_numpy(zero_copy_only=False),
+        shapely.STRtree(footprints),
+    )
+
+
+def tiles_for_geometries(geometries: np.ndarray) -> list[str]:
+    """the sorted ids of the tiles whose footprints intersect any of `geometries`,
+    given in EPSG:4326"""
+
+    tiles, tree = load_tile_index()
+    _, hits = tree.query(np.asarray(geometries), predicate="intersects")
+    return tiles[np.unique(hits)].tolist()
+
+
+if __name__ == "__main__":
+    write_tile_index(sys.argv[1] if len(sys.argv) > 1 else TILE_INDEX)
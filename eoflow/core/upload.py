@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from cloudpathlib import AnyPath
+
+
+class UploadQueue:
+    """A bounded queue of writes drained by its own pool of I/O workers.
+
+    Compute threads hand payloads off with `write` and carry on; once `maxsize`
+    writes are in flight, `submit` blocks until one lands, which bounds the memory
+    held by queued payloads.
+    """
+
+    def __init__(self, workers: int = 8, maxsize: int = 64):
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="eoflow-upload")
+        self._slots = threading.BoundedSemaphore(maxsize)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """queue `fn(*args)` on an I/O worker, blocking while the queue is full"""
+
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def write(self, pth: str, payload: bytes) -> Future:
+        """queue writing `payload` to a local or cloud path"""
+        return self.submit(AnyPath(pth).write_bytes, payload)
+
+    def close(self):
+        """wait for every queued write and stop the workers"""
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "UploadQueue":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def confirm(futures: list[Future]):
+    """block until every write has landed, raising the first failure"""
+    for future in futures:
+        future.result()
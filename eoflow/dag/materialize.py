@@ -20,12 +20,15 @@ from eoflow.cloud.materialize import (
     PipesEagerJobClient,
     op_materialize_tile_eager,
 )
+from eoflow.core.batch import materialize_batch
+from eoflow.core.index import merge_index_files, write_index
 from eoflow.core.materialize import materialize_tile
 from eoflow.models import (
     Archive,
     ArchiveIndex,
     DagsterS2IndexDF,
     DataSpec,
+    DataSpecBatch,
     S2IndexDF,
     S2IndexDFtoItems,
     Tile,
@@ -67,9 +70,15 @@ def dynamic_revisits(context: OpExecutionContext, tiles: list[Tile], config: Dat
         yield DynamicOutput(df_revisit_slice, mapping_key=mgrs_tile)
 
 
-@op(ins={"df_revisit_slice": In(DagsterS2IndexDF)}, out=Out(ArchiveIndex))
+@op(
+    ins={"df_revisit_slice": In(DagsterS2IndexDF), "tiles": In(list[Tile])},
+    out=Out(ArchiveIndex),
+)
 def op_materialize_tile_local(
-    context: OpExecutionContext, df_revisit_slice: S2IndexDF, config: DataSpec
+    context: OpExecutionContext,
+    df_revisit_slice: S2IndexDF,
+    tiles: list[Tile],
+    config: DataSpec,
 ):
     """Deploy local materialisation of the tile."""
 
@@ -77,7 +86,11 @@ def op_materialize_tile_local(
     tile = Tile(tile=df_revisit_slice["mgrs_tile"].values[0])
 
     return materialize_tile(
-        tile=tile, revisits=revisits, config=config, logger=context.log
+        tile=tile,
+        revisits=revisits,
+        config=config,
+        logger=context.log,
+        tiles=[t.tile for t in tiles],
     )
 
 
@@ -86,17 +99,16 @@ def op_collect_and_merge_indices(
     context: OpExecutionContext, tiles: list[Tile], config: DataSpec
 ):
 
-    indices = []
-    for tile in tiles:
-        blob = AnyPath(
-            config.dataset_store + f"/{context.run_id}" + f"/{tile.tile}-index.json"
-        ).read_text()
-        indices.append(ArchiveIndex(**json.loads(blob)))
-
-    merged_index = Archive.merge_archive_indices(indices)
+    run_store = config.dataset_store + f"/{context.run_id}"
 
-    AnyPath(config.dataset_store + f"/{context.run_id}" + "/index.json").write_text(
-        merged_index.model_dump_json()
+    # stream the per-tile indices into one table
+    metadata = merge_index_files(
+        [run_store + f"/{tile.tile}-index.parquet" for tile in tiles],
+        run_store + "/index.parquet",
+    )
+    context.log.info(
+        f"Merged {metadata['n_chips']} chips, skipped {metadata['duplicate_chips']} "
+        "chips owned by overlapping tiles"
     )
 
     return True
@@ -104,12 +116,14 @@ def op_collect_and_merge_indices(
 
 @op(ins={"archive_indices": In(list[ArchiveIndex])}, out=Out())
 def op_merge_and_store_dataset_index(
-    archive_indices: list[ArchiveIndex], config: DataSpec
+    context: OpExecutionContext, archive_indices: list[ArchiveIndex], config: DataSpec
 ):
     merged_index = Archive.merge_archive_indices(archive_indices)
-    json.dump(
-        json.loads(merged_index.model_dump_json()),
-        open(AnyPath(config.dataset_store + "/index.json"), "w"),
+    context.log.info(
+        f"Skipped {merged_index.duplicate_chips} chips owned by overlapping tiles"
+    )
+    write_index(
+        merged_index.to_table(config.bands), config.dataset_store + "/index.parquet"
     )
     json.dump(
         json.loads(config.model_dump_json()),
@@ -117,6 +131,15 @@ def op_merge_and_store_dataset_index(
     )
 
 
+@op(out=Out())
+def op_materialize_batch(context: OpExecutionContext, config: DataSpecBatch):
+    """Materialize every dataspec of the batch locally, tile by tile."""
+
+    return materialize_batch(
+        config.dataspecs, logger=context.log, run_id=context.run_id
+    )
+
+
 @graph
 def materialize_dataset_eager():
     tiles = get_tiles_op()  # remove duplicates
@@ -130,10 +153,20 @@ def materialize_dataset_eager():
 def materialize_dataset_local():
     tiles = get_tiles_op()
     revisits = dynamic_revisits(tiles)
-    archive_indices = revisits.map(op_materialize_tile_local)
+    archive_indices = revisits.map(lambda rev: op_materialize_tile_local(rev, tiles))
     op_merge_and_store_dataset_index(archive_indices.collect())
 
 
+@graph
+def materialize_dataset_batch():
+    op_materialize_batch()
+
+
+materialize_batch_local = materialize_dataset_batch.to_job(
+    name="materialize_dataset_batch",
+    description="Materialize several datasets locally, sharing granule reads",
+)
+
 materialize_local = materialize_dataset_local.to_job(
     name="materialize_dataset_locally",
     description="Materialize dataset locally for development and testing",
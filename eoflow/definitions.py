@@ -1,7 +1,11 @@
 from dagster import Definitions
 
-from eoflow.dag.materialize import materialize_eager, materialize_local
+from eoflow.dag.materialize import (
+    materialize_batch_local,
+    materialize_eager,
+    materialize_local,
+)
 
 defs = Definitions(
-    jobs=[materialize_local, materialize_eager],
+    jobs=[materialize_local, materialize_eager, materialize_batch_local],
 )
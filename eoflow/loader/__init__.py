@@ -0,0 +1,6 @@
+from eoflow.loader.augment import Augment
+from eoflow.loader.loader import ChipLoader
+from eoflow.loader.stream import ShardStream
+from eoflow.loader.view import open_dataset
+
+__all__ = ["Augment", "ChipLoader", "ShardStream", "open_dataset"]
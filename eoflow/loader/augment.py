@@ -0,0 +1,64 @@
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class Augment:
+    """Random augmentation of whole (N, B, H, W) batches and their (N, H, W) targets.
+
+    - `dihedral`: one of the 8 flips and quarter turns per chip. Chips sharing a
+      transform are moved together, so a batch costs at most 8 array operations.
+    - `crop`: a random `crop` x `crop` window per chip, gathered in one indexing
+      operation over a strided window view.
+    - `noise`: a per-chip, per-band gaussian offset with std `noise`, in the units
+      of the batch (i.e. normalized units when the loader normalizes).
+
+    Chips and targets always get the same geometric transform. Batches are
+    transformed in place where possible.
+    """
+
+    def __init__(
+        self, dihedral: bool = True, crop: Optional[int] = None, noise: float = 0.0
+    ):
+        self.dihedral = dihedral
+        self.crop = crop
+        self.noise = noise
+
+    def __call__(
+        self, chips: np.ndarray, targets: np.ndarray, rng: np.random.Generator
+    ) -> tuple[np.ndarray, np.ndarray]:
+        n = len(chips)
+
+        if self.crop is not None:
+            size = chips.shape[-1] - self.crop + 1
+            rows, cols = rng.integers(0, size, (2, n))
+            chips = sliding_window_view(chips, (self.crop,) * 2, axis=(2, 3))[
+                np.arange(n), :, rows, cols
+            ]
+            targets = sliding_window_view(targets, (self.crop,) * 2, axis=(1, 2))[
+                np.arange(n), rows, cols
+            ]
+
+        if self.dihedral:
+            transforms = rng.integers(0, 8, n)
+            for tt in np.unique(transforms[transforms > 0]):
+                sel = np.flatnonzero(transforms == tt)
+                chips[sel] = self._dihedral(chips[sel], tt, (2, 3))
+                targets[sel] = self._dihedral(targets[sel], tt, (1, 2))
+
+        if self.noise:
+            if not np.issubdtype(chips.dtype, np.floating):
+                raise ValueError("band noise needs normalized or dequantized chips")
+            chips += rng.normal(0, self.noise, (n, chips.shape[1], 1, 1)).astype(
+                chips.dtype
+            )
+
+        return chips, targets
+
+    @staticmethod
+    def _dihedral(arr: np.ndarray, tt: int, axes: tuple[int, int]) -> np.ndarray:
+        """transform `tt` of the dihedral group: tt % 4 quarter turns, then a flip
+        if tt >= 4"""
+        arr = np.rot90(arr, tt % 4, axes=axes)
+        return np.flip(arr, axis=axes[1]) if tt >= 4 else arr
@@ -0,0 +1,282 @@
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+from cloudpathlib import AnyPath, CloudPath
+
+from eoflow.core.codecs import CodecEnum, decompress
+from eoflow.core.encoding import TargetEncodingEnum, decode_targets
+from eoflow.core.index import index_metadata, read_index, read_index_metadata
+from eoflow.core.quantize import ChipDtypeEnum, Quantization
+from eoflow.core.shards import read_range
+from eoflow.loader.augment import Augment
+from eoflow.models.archive import DataSetIndex
+from eoflow.models.models import DataSpec, LoaderOuputEnum
+
+
+def _values(table: pa.Table, name: str, fill=None) -> np.ndarray:
+    """a column as a numpy array, nulls replaced by `fill`"""
+    column = table[name]
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    if fill is not None:
+        column = column.fill_null(fill)
+    return column.to_numpy(zero_copy_only=False)
+
+
+class ChipLoader:
+    """Iterate the chips and targets of a materialized dataset in batches.
+
+    Local uncompressed chips are memory-mapped, once per chip or shard object, and
+    sliced without copying; anything else is range-read on `workers` I/O threads.
+    Each batch is assembled into one contiguous (N, B, H, W) array, dequantized and
+    normalized in place with the dataset mean and std, and `prefetch` batches are
+    prepared on background threads while the consumer works on the current one.
+    An optional `augment` stage (see eoflow.loader.augment) transforms each whole
+    batch. Batches are returned as `cfg.loader_output` (see `format`).
+    """
+
+    def __init__(
+        self,
+        table: pa.Table,
+        cfg: DataSpec,
+        batch_size: int = 32,
+        shuffle: bool = False,
+        seed: int = 0,
+        normalize: bool = True,
+        stats: Optional[dict] = None,
+        workers: int = 8,
+        prefetch: int = 2,
+        drop_last: bool = False,
+        augment: Optional[Augment] = None,
+    ):
+        self.cfg = cfg
+        self.table = table
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0  # reshuffled on every pass
+        self.normalize = normalize
+        self.workers = workers
+        self.prefetch = prefetch
+        self.drop_last = drop_last
+        self.augment = augment
+
+        self.bands = [getattr(b, "value", b) for b in cfg.bands]
+        self.shape = (len(self.bands), cfg.chipsize, cfg.chipsize)
+
+        self.chip_idx = _values(table, "chip_idx")
+        self.chip_path = _values(table, "chip_path")
+        self.chip_offset = _values(table, "chip_offset", -1)
+        self.chip_nbytes = _values(table, "chip_nbytes", -1)
+        self.chip_codec = _values(table, "chip_codec", CodecEnum.NONE.value)
+        self.quant_dtype = _values(table, "quant_dtype", ChipDtypeEnum.UINT16.value)
+        self.quant_scale = _values(table, "quant_scale", 1.0).astype(np.float32)
+        self.quant_offset = _values(table, "quant_offset", 0.0).astype(np.float32)
+        self.target_path = _values(table, "target_path")
+        self.target_offset = _values(table, "target_offset", -1)
+        self.target_nbytes = _values(table, "target_nbytes", -1)
+        self.target_codec = _values(table, "target_codec", CodecEnum.NONE.value)
+        self.target_encoding = _values(
+            table, "target_encoding", TargetEncodingEnum.RAW.value
+        )
+
+        stats = stats or index_metadata(table.schema).get("chip_stats")
+        if normalize and stats is None:
+            raise ValueError("normalizing needs the dataset chip_stats")
+        if normalize:
+            self.mean = np.asarray(stats["mean"], dtype=np.float32)[:, None, None]
+            self.std = np.asarray(stats["std"], dtype=np.float32)[:, None, None]
+
+        self._dtypes = {
+            value: Quantization(dtype=value).numpy_dtype
+            for value in np.unique(self.quant_dtype)
+        }
+        self._maps: dict[str, np.memmap] = {}
+        self._maps_lock = threading.Lock()
+
+    @classmethod
+    def from_index(cls, index: DataSetIndex, cfg: DataSpec, **kwargs) -> "ChipLoader":
+        """load from an in-memory dataset index"""
+        return cls(
+            index.to_table(cfg.bands),
+            cfg,
+            stats=kwargs.pop("stats", index.chip_stats.model_dump()),
+            **kwargs,
+        )
+
+    @classmethod
+    def from_store(cls, store: str, **kwargs) -> "ChipLoader":
+        """load from a dataset store, i.e. its index.parquet and dataspec.json"""
+
+        cfg = DataSpec(**json.loads(AnyPath(f"{store}/dataspec.json").read_text()))
+        index = f"{store}/index.parquet"
+        stats = kwargs.pop("stats", read_index_metadata(index).get("chip_stats"))
+        return cls(read_index(index), cfg, stats=stats, **kwargs)
+
+    def __len__(self) -> int:
+        n = len(self.chip_idx)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def _memmap(self, path: str) -> Optional[np.memmap]:
+        """a read-only map of a local object, shared by every chip in it"""
+
+        if isinstance(AnyPath(path), CloudPath):
+            return None
+        with self._maps_lock:
+            if path not in self._maps:
+                self._maps[path] = np.memmap(path, dtype=np.uint8, mode="r")
+            return self._maps[path]
+
+    def _read(
+        self, path: str, offset: int, nbytes: int, codec: str, dtype=np.uint8
+    ) -> np.ndarray:
+        """the stored bytes of a chip or target, zero-copy from a map if possible"""
+
+        if codec == CodecEnum.NONE.value:
+            mapped = self._memmap(path)
+            if mapped is not None:
+                return mapped if offset < 0 else mapped[offset : offset + nbytes]
+
+        return self._decode(
+            read_range(path, None if offset < 0 else offset, nbytes), codec, dtype
+        )
+
+    @staticmethod
+    def _decode(buffer, codec: str, dtype=np.uint8) -> np.ndarray:
+        """the stored bytes of a chip or target of `dtype`, decompressed"""
+        if codec == CodecEnum.NONE.value:
+            return np.frombuffer(buffer, dtype=np.uint8)
+        return np.frombuffer(decompress(buffer, CodecEnum(codec), dtype), np.uint8)
+
+    def read_chip(self, kk: int) -> np.ndarray:
+        """the (B, H, W) chip `kk` as stored, i.e. still quantized"""
+
+        dtype = self._dtypes[self.quant_dtype[kk]]
+        raw = self._read(
+            self.chip_path[kk],
+            self.chip_offset[kk],
+            self.chip_nbytes[kk],
+            self.chip_codec[kk],
+            dtype,
+        )
+        return raw.view(dtype).reshape(self.shape)
+
+    def read_target(self, kk: int) -> np.ndarray:
+        """the encoded bytes of target `kk`"""
+        return self._read(
+            self.target_path[kk],
+            self.target_offset[kk],
+            self.target_nbytes[kk],
+            self.target_codec[kk],
+        )
+
+    def load(self, idx: np.ndarray, io: Optional[ThreadPoolExecutor] = None):
+        """read, assemble and normalize the chips and targets `idx` into a batch"""
+
+        reader = map if io is None else io.map
+        chips = list(reader(self.read_chip, idx))
+        targets = list(reader(self.read_target, idx))
+        return self.assemble(idx, chips, targets)
+
+    def assemble(
+        self, idx: np.ndarray, chips: list[np.ndarray], targets: list[np.ndarray]
+    ):
+        """stack and normalize the stored chips `idx` and decode their targets"""
+
+        idx = np.asarray(idx)
+        if self.normalize:
+            batch = np.empty((len(idx), *self.shape), dtype=np.float32)
+            np.stack(chips, out=batch)
+            batch *= self.quant_scale[idx, None, None, None]
+            batch += self.quant_offset[idx, None, None, None]
+            batch -= self.mean
+            batch /= self.std
+        else:
+            batch = np.stack(chips)
+
+        labels = self.decode_targets(idx, targets)
+
+        if self.augment is not None:
+            # seeded per batch, so batches prepared concurrently stay reproducible
+            rng = np.random.default_rng([self.seed, self.epoch, *idx[:1].tolist()])
+            batch, labels = self.augment(batch, labels, rng)
+
+        return self.format(idx, batch, labels)
+
+    def decode_targets(self, idx: np.ndarray, targets: list[np.ndarray]) -> np.ndarray:
+        """the (N, H, W) target rasters of the encoded targets of chips `idx`"""
+
+        shape = self.shape[1:]
+        labels = np.empty((len(idx), *shape), dtype=np.uint8)
+        encodings = self.target_encoding[idx]
+        for encoding in np.unique(encodings):
+            sel = np.flatnonzero(encodings == encoding)
+            labels[sel] = decode_targets(
+                [targets[ii].tobytes() for ii in sel],
+                TargetEncodingEnum(encoding),
+                shape,
+            )
+        return labels
+
+    def format(self, idx: np.ndarray, chips: np.ndarray, targets: np.ndarray):
+        """a batch as `cfg.loader_output`: a dict, a (chips, targets) tuple of arrays,
+        or an xarray Dataset"""
+
+        output = self.cfg.loader_output
+        if output == LoaderOuputEnum.DICT:
+            return {
+                "chip_idx": self.chip_idx[idx].tolist(),
+                "chips": chips,
+                "targets": targets,
+            }
+        elif output == LoaderOuputEnum.XARRAY:
+            import xarray as xr
+
+            return xr.Dataset(
+                {
+                    "chips": (("chip", "band", "y", "x"), chips),
+                    "targets": (("chip", "y", "x"), targets),
+                },
+                coords={"chip": self.chip_idx[idx], "band": self.bands},
+            )
+        return chips, targets
+
+    def _order(self) -> np.ndarray:
+        n = len(self.chip_idx)
+        if not self.shuffle:
+            return np.arange(n)
+        return np.random.default_rng((self.seed, self.epoch)).permutation(n)
+
+    def batches(self) -> Iterator[np.ndarray]:
+        """the chip positions of each batch of the next pass"""
+
+        order = self._order()
+        stop = len(self) * self.batch_size
+        for ii in range(0, min(stop, len(order)), self.batch_size):
+            yield order[ii : ii + self.batch_size]  # noqa: E203
+
+    def __iter__(self) -> Iterator[Union[tuple, dict]]:
+        batches = self.batches()
+        self.epoch += 1
+
+        with (
+            ThreadPoolExecutor(self.workers, thread_name_prefix="eoflow-read") as io,
+            ThreadPoolExecutor(
+                max(self.prefetch, 1), thread_name_prefix="eoflow-prefetch"
+            ) as pool,
+        ):
+            ahead = deque(
+                pool.submit(self.load, idx, io)
+                for idx in islice(batches, max(self.prefetch, 1))
+            )
+            while ahead:
+                batch = ahead.popleft().result()
+                for idx in islice(batches, 1):
+                    ahead.append(pool.submit(self.load, idx, io))
+                yield batch
@@ -0,0 +1,214 @@
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+
+from eoflow.core.shards import read_range
+from eoflow.loader.loader import ChipLoader
+from eoflow.models.models import DataSpec
+
+try:
+    from torch.utils.data import IterableDataset
+except ImportError:
+    IterableDataset = object  # torch is optional, the stream iterates without it
+
+
+def _worker_info() -> tuple[int, int]:
+    """(id, count) of the loader process this runs in, (0, 1) outside of torch"""
+
+    try:
+        from torch.utils.data import get_worker_info
+    except ImportError:
+        return 0, 1
+
+    info = get_worker_info()
+    return (0, 1) if info is None else (info.id, info.num_workers)
+
+
+class ShardStream(ChipLoader, IterableDataset):
+    """Stream a dataset shard by shard, for training straight from an object store.
+
+    Instead of one request per chip, each shard's chips (and their targets) are
+    fetched in a few large sequential range reads of up to `chunk_bytes`, with
+    `read_ahead` shards in flight at once. Shard order is reshuffled every epoch and
+    chips are mixed in a `shuffle_buffer` as they arrive.
+
+    Each epoch's chips, in shard order, are split into contiguous runs across
+    `world_size` data-parallel ranks and, within a rank, across torch loader
+    processes, so every chip is seen once per epoch by one of them. Every rank gets
+    the same number of chips, as DDP needs: the last rank is padded with chips from
+    the start of the epoch, or with `drop_last` all are truncated to the shortest.
+
+    It is a torch IterableDataset when torch is installed; use it with
+    `DataLoader(stream, batch_size=None)`. Loader processes work on copies of the
+    stream, so call `set_epoch` before every epoch, as with a DistributedSampler.
+    Batches are formatted as in ChipLoader.
+    """
+
+    def __init__(
+        self,
+        table: pa.Table,
+        cfg: DataSpec,
+        shuffle_buffer: int = 1024,
+        chunk_bytes: int = 64 << 20,
+        read_ahead: int = 4,
+        rank: int = 0,
+        world_size: int = 1,
+        **kwargs,
+    ):
+        super().__init__(table, cfg, **kwargs)
+        self.shuffle_buffer = shuffle_buffer
+        self.chunk_bytes = chunk_bytes
+        self.read_ahead = read_ahead
+        self.rank = rank
+        self.world_size = world_size
+
+        shards = defaultdict(list)
+        for kk, path in enumerate(self.chip_path):
+            shards[path].append(kk)
+        self.shards = {path: np.asarray(rows) for path, rows in shards.items()}
+
+    def set_epoch(self, epoch: int):
+        """set the epoch the shard order, split and shuffle of the next pass use"""
+        self.epoch = epoch
+
+    def shards_of(
+        self, worker: int = 0, n_workers: int = 1
+    ) -> list[tuple[str, np.ndarray]]:
+        """the shards, and their rows, a loader process of this rank reads in the
+        next epoch"""
+
+        paths = sorted(self.shards)
+        if self.shuffle:
+            rng = np.random.default_rng((self.seed, self.epoch))
+            paths = [paths[ii] for ii in rng.permutation(len(paths))]
+
+        rows = np.concatenate([self.shards[p] for p in paths] or [[]]).astype(int)
+        owner = np.repeat(np.arange(len(paths)), [len(self.shards[p]) for p in paths])
+
+        # the same number of chips for every rank, padded or truncated
+        n = len(rows)
+        per_rank = n // self.world_size if self.drop_last else -(-n // self.world_size)
+        take = np.arange(self.rank * per_rank, (self.rank + 1) * per_rank) % max(n, 1)
+        take = np.array_split(take, n_workers)[worker]
+
+        # contiguous runs of the same shard are read together
+        runs = np.flatnonzero(np.diff(owner[take], prepend=-1, append=-1))
+        return [
+            (paths[owner[take[lo]]], rows[take[lo:hi]])
+            for lo, hi in zip(runs[:-1], runs[1:])
+        ]
+
+    def __len__(self) -> int:
+        """the batches of this rank's next epoch"""
+        n = sum(len(rows) for _, rows in self.shards_of())
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def _read_coalesced(
+        self, path: str, offsets: np.ndarray, nbytes: np.ndarray
+    ) -> list[np.ndarray]:
+        """the byte ranges of one object, read in as few sequential requests of up
+        to `chunk_bytes` as they fit in"""
+
+        if offsets[0] < 0:
+            """a chip stored as its own object"""
+            return [np.frombuffer(read_range(path), dtype=np.uint8)]
+
+        out = [None] * len(offsets)
+        order = np.argsort(offsets, kind="stable")
+        ends = offsets + nbytes
+
+        start = 0
+        while start < len(order):
+            lo = offsets[order[start]]
+            stop = start + 1
+            while stop < len(order) and ends[order[stop]] - lo <= self.chunk_bytes:
+                stop += 1
+            hi = ends[order[start:stop]].max()
+
+            buffer = np.frombuffer(read_range(path, int(lo), int(hi - lo)), np.uint8)
+            for kk in order[start:stop]:
+                out[kk] = buffer[offsets[kk] - lo : ends[kk] - lo]
+            start = stop
+
+        return out
+
+    def read_shard(
+        self, path: str, rows: Optional[np.ndarray] = None
+    ) -> list[tuple[int, np.ndarray, np.ndarray]]:
+        """the (row, chip, encoded target) of every chip in a shard, or of `rows`"""
+
+        rows = self.shards[path] if rows is None else rows
+        raw = self._read_coalesced(path, self.chip_offset[rows], self.chip_nbytes[rows])
+
+        chips = []
+        for kk, buffer in zip(rows, raw):
+            dtype = self._dtypes[self.quant_dtype[kk]]
+            chips.append(
+                self._decode(buffer, self.chip_codec[kk], dtype)
+                .view(dtype)
+                .reshape(self.shape)
+            )
+
+        targets = [None] * len(rows)
+        for target_path in np.unique(self.target_path[rows]):
+            sel = np.flatnonzero(self.target_path[rows] == target_path)
+            raw = self._read_coalesced(
+                target_path,
+                self.target_offset[rows[sel]],
+                self.target_nbytes[rows[sel]],
+            )
+            for ii, buffer in zip(sel, raw):
+                targets[ii] = self._decode(buffer, self.target_codec[rows[ii]])
+
+        return list(zip(rows.tolist(), chips, targets))
+
+    def _items(self, reads: list[tuple[str, np.ndarray]], rng: np.random.Generator):
+        """stream the chips of the (shard, rows) `reads`, mixed in the shuffle
+        buffer"""
+
+        buffer = []
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="eoflow-read") as io:
+            reads = iter(reads)
+            ahead = deque(
+                io.submit(self.read_shard, *read)
+                for read in islice(reads, max(self.read_ahead, 1))
+            )
+            while ahead:
+                items = ahead.popleft().result()
+                for read in islice(reads, 1):
+                    ahead.append(io.submit(self.read_shard, *read))
+
+                for item in items:
+                    if not self.shuffle:
+                        yield item
+                    elif len(buffer) < self.shuffle_buffer:
+                        buffer.append(item)
+                    else:
+                        jj = rng.integers(len(buffer))
+                        buffer[jj], item = item, buffer[jj]
+                        yield item
+
+        for jj in rng.permutation(len(buffer)):
+            yield buffer[jj]
+
+    def __iter__(self) -> Iterator[Union[tuple, dict]]:
+        worker, n_workers = _worker_info()
+        reads = self.shards_of(worker, n_workers)
+        rng = np.random.default_rng(
+            (self.seed, self.epoch, self.rank * n_workers + worker)
+        )
+        self.epoch += 1
+
+        batch = []
+        for item in self._items(reads, rng):
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield self.assemble(*(list(v) for v in zip(*batch)))
+                batch = []
+
+        if batch and not self.drop_last:
+            yield self.assemble(*(list(v) for v in zip(*batch)))
@@ -0,0 +1,102 @@
+from typing import Optional, Union
+
+import numpy as np
+
+from eoflow.loader.loader import ChipLoader
+from eoflow.models.archive import DataSetIndex
+from eoflow.models.models import DataSpec
+
+# per-chip index columns exposed as coordinates along the chip dimension
+CHIP_COORDS = [
+    "tile",
+    "chip_crs",
+    "minx",
+    "miny",
+    "maxx",
+    "maxy",
+    "lon_min",
+    "lat_min",
+    "lon_max",
+    "lat_max",
+    "time_start",
+    "time_end",
+]
+
+
+def open_dataset(
+    source: Union[str, DataSetIndex],
+    cfg: Optional[DataSpec] = None,
+    chips_per_block: int = 64,
+    dequantize: bool = False,
+):
+    """open a materialized dataset as one lazy xarray Dataset.
+
+    `source` is a dataset store, or a dataset index with its dataspec. `chips` is
+    (chip, band, y, x) and `targets` (chip, y, x); both are dask arrays that read
+    `chips_per_block` chips from their objects only when computed. Chips keep their
+    stored dtype unless `dequantize`, which returns float32 values. The tile, chip
+    bounds and composited time span of each chip are coordinates along `chip`.
+    """
+
+    import dask.array as da
+    import xarray as xr
+
+    if isinstance(source, str):
+        loader = ChipLoader.from_store(source, normalize=False)
+    else:
+        loader = ChipLoader.from_index(source, cfg, normalize=False)
+
+    dtypes = set(loader._dtypes.values())
+    if dequantize:
+        dtype = np.dtype(np.float32)
+    elif len(dtypes) == 1:
+        dtype = dtypes.pop()
+    else:
+        raise ValueError("chips are stored as several dtypes, open with dequantize")
+
+    def read_chips(ids: np.ndarray) -> np.ndarray:
+        chips = np.stack([loader.read_chip(kk) for kk in ids]).astype(dtype)
+        if dequantize:
+            chips *= loader.quant_scale[ids, None, None, None]
+            chips += loader.quant_offset[ids, None, None, None]
+        return chips
+
+    def read_targets(ids: np.ndarray) -> np.ndarray:
+        return loader.decode_targets(ids, [loader.read_target(kk) for kk in ids])
+
+    ids = da.arange(len(loader.chip_idx), chunks=chips_per_block)
+    chips = ids.map_blocks(
+        read_chips,
+        new_axis=[1, 2, 3],
+        chunks=(ids.chunks[0], *((n,) for n in loader.shape)),
+        dtype=dtype,
+    )
+    targets = ids.map_blocks(
+        read_targets,
+        new_axis=[1, 2],
+        chunks=(ids.chunks[0], *((n,) for n in loader.shape[1:])),
+        dtype=np.uint8,
+    )
+
+    columns = [c for c in CHIP_COORDS if c in loader.table.column_names]
+    table = loader.table.select(columns).to_pandas()
+    for column in ("time_start", "time_end"):
+        if column in columns:
+            """xarray keeps naive datetime64, the index times are utc"""
+            table[column] = table[column].dt.tz_convert(None)
+
+    return xr.Dataset(
+        {
+            "chips": (("chip", "band", "y", "x"), chips),
+            "targets": (("chip", "y", "x"), targets),
+        },
+        coords={
+            "chip": loader.chip_idx,
+            "band": loader.bands,
+            **{c: ("chip", table[c].to_numpy()) for c in columns},
+        },
+        attrs={
+            "chipsize": loader.cfg.chipsize,
+            "composite": getattr(loader.cfg.composite, "value", loader.cfg.composite),
+        },
+    )
@@ -2,15 +2,19 @@ from eoflow.models.archive import Archive, ArchiveIndex, DataSetIndex
 from eoflow.models.models import (
     DagsterS2IndexDF,
     DataSpec,
+    DataSpecBatch,
     S2IndexDF,
     S2IndexDFtoItems,
     S2IndexItem,
+    TargetEncodingEnum,
     Tile,
 )
 
 __all__ = [
     "DataSpec",
+    "DataSpecBatch",
     "Tile",
+    "TargetEncodingEnum",
     "S2IndexDF",
     "S2IndexItem",
     "Archive",
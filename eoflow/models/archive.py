@@ -1,25 +1,72 @@
+import hashlib
+import json
+import threading
+import zlib
+from datetime import datetime
 from itertools import chain
-from typing import Optional, Union
+from typing import Iterator, Optional, Union
 
 import dask
 import dask.array as da
-import geopandas as gpd
 import numpy as np
+import shapely
 import zarr
 from cloudpathlib import AnyPath
 from pydantic import BaseModel, field_validator
+from pyproj import Transformer
 from rasterio import Affine, features
-from sentinelhub import CRS, UtmZoneSplitter
-from xarray import DataArray as xda
-
+from shapely import STRtree
+
+from eoflow.core.chips import (
+    RESOLUTION,
+    TILE_PX,
+    ChipTable,
+    iter_aoi_chips,
+    owned_chips,
+    sample_chips,
+)
+from eoflow.core.codecs import CodecEnum, compress, decompress
+from eoflow.core.composite import composite_pixels, composite_times, merge_composites
+from eoflow.core.encoding import TARGET_SUFFIX, encode_target
+from eoflow.core.index import chips_to_table
+from eoflow.core.quantize import ChipDtypeEnum, Quantization, dequantize, quantize
+from eoflow.core.shards import SHARD_SUFFIX, ShardWriter
+from eoflow.core.stats import histogram, merge_moments, moments, percentiles, std
+from eoflow.core.upload import UploadQueue, confirm
 from eoflow.core.utils import read_any_geofile
 from eoflow.models.granule import GCPS2Granule
-from eoflow.models.models import DataSpec, S2IndexItem, Tile
+from eoflow.models.models import DataSpec, S2IndexItem, TargetEncodingEnum, Tile
+
+# the dataspec fields that change the chips, targets or stats an archive produces;
+# run settings such as stores and upload throughput don't
+FINGERPRINT_FIELDS = {
+    "target_geofile",
+    "aoi_geofile",
+    "previous_store",
+    "cloud_mask",
+    "composite",
+    "constellation",
+    "bands",
+    "chipsize",
+    "chip_stride",
+    "chip_batch",
+    "preview",
+    "shard_chips",
+    "target_encoding",
+    "codec",
+    "codec_level",
+    "upsample",
+    "chip_dtype",
+    "hist_bins",
+    "clip",
+    "rescale",
+}
 
 
 class ChipStats(BaseModel):
     mean: list[Union[float, None]]
-    std: list[Union[float, None]]
+    std: list[Union[float, None]]  # population std, M2 = std**2 * count
+    count: list[int] = []  # pixels per band the stats are over
 
     @field_validator("*")
     @classmethod
@@ -38,11 +85,24 @@ class Indexbase(BaseModel):
 class ChipIndex(Indexbase):
     chip_path: str
     chip_stats: ChipStats
+    chip_offset: Optional[int] = None  # byte range in a shard, None=whole object
+    chip_nbytes: Optional[int] = None
+    chip_codec: CodecEnum = CodecEnum.NONE
+    chip_quantization: Quantization = Quantization()
+    chip_crs: Optional[str] = None
+    chip_bounds: Optional[list[float]] = None  # minx, miny, maxx, maxy in chip_crs
+    chip_bounds_wgs: Optional[list[float]] = None  # in EPSG:4326
+    time_start: Optional[datetime] = None  # first and last revisit composited
+    time_end: Optional[datetime] = None
 
 
 class TargetIndex(Indexbase):
     target_path: str
     target_pxcount: dict[int, int]
+    target_encoding: TargetEncodingEnum = TargetEncodingEnum.RAW
+    target_offset: Optional[int] = None  # byte range in a shard, None=whole object
+    target_nbytes: Optional[int] = None
+    target_codec: CodecEnum = CodecEnum.NONE
 
 
 class ChipMetaData(ChipIndex, TargetIndex):
@@ -52,11 +112,57 @@ class ChipMetaData(ChipIndex, TargetIndex):
 class ArchiveIndex(BaseModel):
     tile: str
     chips: list[ChipMetaData]
+    duplicate_chips: int = 0  # chips left to an overlapping tile
+    histogram: Optional[list[list[int]]] = None  # bands x bins over hist_range
+    hist_range: Optional[list[float]] = None
+
+    def to_table(self, bands: list[str]):
+        """the index as a typed arrow table, see eoflow.core.index"""
+        return chips_to_table(
+            [chip.model_dump(mode="json") for chip in self.chips],
+            bands,
+            metadata={
+                "tile": self.tile,
+                "duplicate_chips": self.duplicate_chips,
+                "histogram": self.histogram,
+                "hist_range": self.hist_range,
+            },
+        )
+
+
+class Manifest(BaseModel):
+    """the index of one stored batch of chips, written once all of its writes land"""
+
+    fingerprint: str  # of the dataspec and revisits the batch was made from
+    shard: int
+    chip_ids: list[int]
+    index: ArchiveIndex
 
 
 class DataSetIndex(BaseModel):
     chips: list[ChipMetaData]
     chip_stats: ChipStats
+    duplicate_chips: int = 0
+    histogram: Optional[list[list[int]]] = None
+    hist_range: Optional[list[float]] = None
+
+    def percentiles(self, q: list[float]) -> np.ndarray:
+        """(bands, len(q)) approximate percentiles from the pooled histogram"""
+        return percentiles(self.histogram, self.hist_range, q)
+
+    def to_table(self, bands: list[str]):
+        """the index as a typed arrow table, see eoflow.core.index"""
+        return chips_to_table(
+            [chip.model_dump(mode="json") for chip in self.chips],
+            bands,
+            metadata={
+                "n_chips": len(self.chips),
+                "duplicate_chips": self.duplicate_chips,
+                "chip_stats": self.chip_stats.model_dump(mode="json"),
+                "histogram": self.histogram,
+                "hist_range": self.hist_range,
+            },
+        )
 
 
 class Archive:
@@ -67,29 +173,82 @@ class Archive:
         tile: Tile,
         revisits: list[S2IndexItem],
         run_id: Optional[str] = None,
+        tiles: Optional[list[str]] = None,
     ):
         self.cfg = cfg
         self.tile = tile
+        self.tiles = tiles  # all tiles of the run, used to deduplicate chips
         self.revisits = sorted(
             revisits, key=lambda x: x.sensing_time
         )  # most recent last
 
+        self.stride = cfg.chip_stride or cfg.chipsize
+        self.c = None  # tile-level composite, see composite()
+        self.uploads: Optional[UploadQueue] = None  # async writes, see materialize()
+        self._pending = []  # futures of queued writes not yet confirmed
+
+        # pooled pixel histogram of the stored chips, in dequantized units
+        self.hist_range = (
+            cfg.clip if cfg.chip_dtype == ChipDtypeEnum.UINT16 else cfg.rescale
+        )
+        self.histogram = np.zeros((len(cfg.bands), cfg.hist_bins), dtype=np.int64)
+        self._hist_lock = threading.Lock()
+
+        self.completed: dict[int, Manifest] = {}  # batches done by an earlier attempt
+
+        # content-addressed composite blocks shared across runs, see _load_cache
+        self.cache = cfg.cache_store
+        self._cached: dict[str, set[tuple[int, int]]] = {}
+
         if run_id is not None:
             self.store = f"{cfg.dataset_store}/{run_id}"
         else:
             self.store = cfg.dataset_store
 
+        # delta mode extends the composite state of a previous run, see _load_previous
+        self.previous_store = cfg.previous_store
+        self.previous: Optional[dict] = None
+        self.previous_manifests: dict[int, Manifest] = {}
+        self._changed: set[tuple[int, int]] = set()  # blocks the new revisits changed
+        self.persist_state = cfg.composite_state or cfg.previous_store is not None
+        if cfg.previous_store is not None:
+            self._load_previous()
+            self.cache = None  # cached blocks don't include the previous composite
+        self._times = np.array(
+            [int(r.sensing_time.timestamp()) for r in self.revisits], dtype=np.int64
+        )
+
         # retrieve intersecting features
+        tile_geometry = self.tile.geometry.to_shapely()
         gdf = read_any_geofile(cfg.target_geofile)
-        self.gdf = gdf.loc[gdf.intersects(self.tile.geometry.to_shapely())]
+        self.gdf = gdf.loc[gdf.intersects(tile_geometry)]
+
+        # don't need wgs gdf anymore, cast it to tile_crs and index it
+        self.gdf = self.gdf.to_crs(self.tile.utm_crs)
+        self.tree = STRtree(self.gdf.geometry.values)
+
+        self._to_wgs = Transformer.from_crs(
+            self.tile.utm_crs, "EPSG:4326", always_xy=True
+        )
+
+        # top-left corner of the tile's pixel grid
+        self.tile_minx, _, _, self.tile_maxy = (
+            self.tile.geometry_utm.to_shapely().bounds
+        )
+
+        # in aoi mode chips cover the aoi wall-to-wall and are streamed in batches
+        self.aoi = None
+        if cfg.aoi_geofile is not None:
+            aoi = read_any_geofile(cfg.aoi_geofile)
+            aoi = aoi.loc[aoi.intersects(tile_geometry)].to_crs(self.tile.utm_crs)
+            self.aoi = shapely.intersection(
+                aoi.union_all(), self.tile.geometry_utm.to_shapely()
+            )
 
         self._get_granules()
         self._create_lazy_data_store()
         self._get_chips()
 
-        # don't need wgs gdf anymore, cast it to tile_crs
-        self.gdf = self.gdf.to_crs(self.tile.utm_crs)
-
     def _get_granules(self):
         """instantiate all granules."""
         self.granules: list[GCPS2Granule] = [
@@ -106,6 +265,11 @@ class Archive:
     def _create_lazy_data_store(self):
         """lazily create the archive for computation from the dask array."""
 
+        if not self.granules:
+            """a delta run with no new revisits has nothing to fetch"""
+            self.stack = None
+            return True
+
         self.stack = da.stack(
             [granule.stack for granule in self.granules],
             axis=0,
@@ -113,48 +277,88 @@ class Archive:
 
         return True
 
+    def _own_chips(self, chips: ChipTable) -> ChipTable:
+        """drop the chips materialized by an overlapping tile of the run"""
+
+        if self.tiles is None:
+            return chips
+
+        owned = owned_chips(chips, self.tile.utm_crs, self.tile.tile, self.tiles)
+        self.duplicate_chips += int((~owned).sum())
+        return chips[owned]
+
     def _get_chips(self):
-        """create chips from the archive"""
-
-        splitter = UtmZoneSplitter(
-            [self.gdf.union_all()], CRS.WGS84, (self.cfg.chipsize, self.cfg.chipsize)
-        )
-
-        bbox_list = splitter.get_bbox_list()
-
-        chip_polygons = []
-        transforms = []
-        for bbox in bbox_list:
-            if str(bbox.crs) != self.tile.utm_crs:
-                """only process chips in the same crs as the tile."""
-                continue
-            chip_polygons.append(bbox.geometry)
-            transforms.append(bbox.get_transform_vector(10, 10))
-
-        chips = gpd.GeoDataFrame(geometry=chip_polygons, crs=self.tile.utm_crs)
-        chips["tile_minpx"] = (
-            (chips.geometry.bounds.minx - self.tile.utm_top_left.to_shapely().x) / 10
-        ).astype(int)
-        chips["tile_maxpx"] = (
-            (
-                chips.geometry.bounds.maxx
-                - (self.tile.utm_top_left.to_shapely().x - 10000)
+        """create chips on the tile's chunk-aligned lattice covering the targets"""
+
+        self.duplicate_chips = 0
+        self.chips = None
+
+        if self.aoi is not None and self.cfg.preview is None:
+            """chips are streamed from the aoi, see iter_chips"""
+            return
+
+        if self.aoi is not None:
+            # a preview samples from every chip of the aoi, so gather them up front
+            batches = list(self.iter_chips())
+            self.chips = ChipTable(
+                np.concatenate([b.rows for b in batches] or [[]]),
+                np.concatenate([b.cols for b in batches] or [[]]),
+                self.cfg.chipsize,
+                self.tile_minx,
+                self.tile_maxy,
+                ids=np.concatenate([b.ids for b in batches] or [[]]),
             )
-            / 10
-        ).astype(int)
-        chips["tile_minpy"] = (
-            (chips.geometry.bounds.miny - self.tile.utm_top_left.to_shapely().y) / 10
-        ).astype(int)
-        chips["tile_maxpy"] = (
-            (
-                chips.geometry.bounds.maxy
-                - (self.tile.utm_top_left.to_shapely().y - 10000)
+        else:
+            self.chips = self._own_chips(
+                ChipTable.from_geometries(
+                    self.gdf.geometry.values,
+                    chipsize=self.cfg.chipsize,
+                    stride=self.stride,
+                    minx=self.tile_minx,
+                    maxy=self.tile_maxy,
+                    tree=self.tree,
+                )
             )
-            / 10
-        ).astype(int)
-        chips["affine_transform"] = transforms
 
-        self.chips = chips
+        if self.cfg.preview is not None:
+            self.chips = sample_chips(
+                self.chips,
+                self.cfg.preview,
+                self._target_coverage(self.chips),
+                seed=zlib.crc32(self.tile.tile.encode()),
+            )
+
+    def _target_coverage(self, chips: ChipTable) -> np.ndarray:
+        """the fraction of each chip covered by targets, a proxy for its pixel count"""
+
+        geometries = chips.geometry
+        ichip, itarget = self.tree.query(geometries, predicate="intersects")
+        areas = shapely.area(
+            shapely.intersection(geometries[ichip], self.gdf.geometry.values[itarget])
+        )
+        size = (self.cfg.chipsize * RESOLUTION) ** 2
+        return np.bincount(ichip, weights=areas, minlength=len(chips)) / size
+
+    def iter_chips(self) -> Iterator[ChipTable]:
+        """yield the chips of the tile in batches of at most cfg.chip_batch"""
+
+        if self.chips is not None:
+            for ii in range(0, len(self.chips), self.cfg.chip_batch):
+                yield self.chips[ii : ii + self.cfg.chip_batch]  # noqa: E203
+            return
+
+        self.duplicate_chips = 0  # recounted on every pass over the aoi
+        for chips in iter_aoi_chips(
+            self.aoi,
+            chipsize=self.cfg.chipsize,
+            stride=self.stride,
+            minx=self.tile_minx,
+            maxy=self.tile_maxy,
+            batch=self.cfg.chip_batch,
+        ):
+            chips = self._own_chips(chips)
+            if len(chips):
+                yield chips
 
     def fill(self):
         """execute the dask-delayed computation to mask, fill, and composite."""
@@ -162,54 +366,57 @@ class Archive:
         self.z = zarr.open(
             f"./local-{self.tile.tile}.zarr",
             mode="w",
-            shape=(len(self.revisits), len(self.cfg.bands), 10980, 10980),
+            shape=(len(self.revisits), len(self.cfg.bands), TILE_PX, TILE_PX),
             chunks=(1, 1, self.cfg.chipsize, self.cfg.chipsize),
             dtype="uint16",
         )
 
-        stack = da.stack([g.stack for g in self.granules], axis=0)
-
-        job = stack.store(self.z, compute=False, return_stored=False)
+        if self.cfg.preview is None:
+            stack = da.stack([g.stack for g in self.granules], axis=0)
+            job = stack.store(self.z, compute=False, return_stored=False)
+        else:
+            # only the sampled chips' blocks are read from the granules, as windows
+            cs = self.cfg.chipsize
+            windows = [
+                (
+                    slice(bi * cs, min((bi + 1) * cs, TILE_PX)),
+                    slice(bj * cs, min((bj + 1) * cs, TILE_PX)),
+                )
+                for bi, bj in self.chips.blocks()
+            ]
+            job = [
+                dask.delayed(self._fill_windows)(ii, bb, windows)
+                for ii in range(len(self.granules))
+                for bb in range(len(self.cfg.bands))
+            ]
 
         dask.compute(job, num_workers=2)
 
+    def _fill_windows(self, ii: int, bb: int, windows: list[tuple[slice, slice]]):
+        """read and store the windows of a single band of a single granule"""
+
+        arrs = self.granules[ii].read_windows(self.cfg.bands[bb], windows)
+        for (rows, cols), arr in zip(windows, arrs):
+            self.z[ii, bb, rows, cols] = arr
+
     def _generate_mask(self):
         """mask the archive data"""
 
-        shape = (len(self.revisits), 10980, 10980)
+        shape = (len(self.revisits), TILE_PX, TILE_PX)
+        cs = self.cfg.chipsize
+
         # 1. mask non-scope chips
         mask = np.ones(shape, dtype=bool)
-        for _idx, chip in self.chips.iterrows():
-            mask[
-                :,
-                chip["tile_minpx"] : chip["tile_maxpx"],  # noqa: E203
-                chip["tile_minpy"] : chip["tile_maxpy"],  # noqa: E203
-            ] = False
-
-        # 2. mask non-data pixels
-        non_data_mask = np.zeros(shape, dtype=bool)
-
-        # 2a. there's a small number of chips, just map using chips
-        for _idx, chip in self.chips.iterrows():
-            non_data_mask[
-                :,
-                chip.tile_minpx : chip.tile_maxpx,  # noqa: E203
-                chip.tile_minpy : chip.tile_maxpy,  # noqa: E203
-            ] = (
-                self.z[
-                    :,
-                    :,
-                    chip.tile_minpx : chip.tile_maxpx,  # noqa: E203
-                    chip.tile_minpy : chip.tile_maxpy,  # noqa: E203
-                ]
-                == 0
-            ).all(
-                axis=1
-            )
+        for ii in range(len(self.chips)):
+            mask[(slice(None), *self.chips.window(ii))] = False
+
+        # 2. mask non-data pixels, once per block so overlapping chips aren't re-read
+        for bi, bj in self.chips.blocks():
+            rows = slice(bi * cs, (bi + 1) * cs)
+            cols = slice(bj * cs, (bj + 1) * cs)
+            mask[:, rows, cols] |= (self.z[:, :, rows, cols] == 0).all(axis=1)
 
-        # 2b. there's a large number of chips, map the whole dataset using chunks
-        self.mask = np.logical_or(mask, non_data_mask)
-        del non_data_mask
+        self.mask = mask
 
         # 3. mask clouds
         # TODO
@@ -217,83 +424,276 @@ class Archive:
     def mask(self):
         """mask the archive data"""
 
+        if self.aoi is not None or self.cache is not None or self.previous is not None:
+            """streaming, cached and delta modes mask each block as it is composited"""
+            return
+
         self._generate_mask()
 
-    def _composite_chip(
-        self,
-        block_id: Optional[tuple[int]] = None,
-        chip: Optional[gpd.GeoSeries] = None,
-    ):
+    def _cache_key(self, band: str) -> str:
+        """hash of everything that determines a band's composite blocks"""
+        key = {
+            "tile": self.tile.tile,
+            "granules": sorted(r.granule_id for r in self.revisits),
+            "band": getattr(band, "value", band),
+            "composite": getattr(self.cfg.composite, "value", self.cfg.composite),
+            "cloud_mask": [getattr(m, "value", m) for m in self.cfg.cloud_mask or []],
+            "upsample": getattr(self.cfg.upsample, "value", None),
+            "chipsize": self.cfg.chipsize,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def _cache_path(self, band: str, bi: int = None, bj: int = None) -> str:
+        pth = f"{self.cache}/{self.tile.tile}/{self._cache_key(band)}"
+        return pth if bi is None else f"{pth}/{bi}-{bj}"
+
+    def _load_cache(self):
+        """list the tile's cached blocks once, keyed per band so runs with any subset
+        of the bands reuse them"""
+
+        root = AnyPath(f"{self.cache}/{self.tile.tile}/")
+        listing = (
+            {(p.parent.name, p.name) for p in root.rglob("*-*")}
+            if root.exists()
+            else set()
+        )
+        self._cached = {}
+        for band in self.cfg.bands:
+            key = self._cache_key(band)
+            self._cached[key] = {
+                tuple(int(v) for v in name.split("-"))
+                for parent, name in listing
+                if parent == key
+            }
+            AnyPath(self._cache_path(band)).mkdir(parents=True, exist_ok=True)
+
+    @property
+    def _caches_blocks(self) -> bool:
+        # cached blocks carry no pixel times, and delta runs merge blocks with the
+        # previous run's, which the key doesn't cover: runs keeping composite state
+        # neither read nor write the cache
+        return self.cache is not None and not self.persist_state
+
+    def _is_cached(self, bi: int, bj: int) -> bool:
+        return self._caches_blocks and all(
+            (bi, bj) in self._cached.get(self._cache_key(band), ())
+            for band in self.cfg.bands
+        )
 
-        def composite_first(arr):
-            """composite using the most-recent non-nan value"""
+    def uncached_blocks(self) -> int:
+        """the number of blocks covered by chips that must be composited from data"""
 
-            arr = (
-                xda(
-                    arr,
-                    dims=("R", "B", "X", "Y"),
-                )
-                .ffill(dim="R")
-                .to_numpy()
-                .astype(np.uint16)
-            )
+        if self.cache is None:
+            return None
+
+        self._load_cache()
+        blocks = {
+            (int(bi), int(bj))
+            for batch in self.iter_chips()
+            for bi, bj in batch.blocks()
+        }
+        return sum(not self._is_cached(bi, bj) for bi, bj in blocks)
 
-            return arr[0, :, :, :]
+    def _composite_block(self, bi: int, bj: int):
+        """composite a single block of the tile into the tile-level composite."""
 
-        def composite_last(arr):
-            return composite_first(arr[:, ::-1, :, :])
+        cs = self.cfg.chipsize
+        rows = slice(bi * cs, (bi + 1) * cs)
+        cols = slice(bj * cs, (bj + 1) * cs)
+        shape = (min(cs, TILE_PX - bi * cs), min(cs, TILE_PX - bj * cs))
 
-        if chip is not None:
-            x_slice = slice(chip.tile_minpx, chip.tile_maxpx)
-            y_slice = slice(chip.tile_minpy, chip.tile_maxpy)
-        elif block_id:
-            x_slice = slice(
-                block_id[2] * self.cfg.chipsize, (block_id[2] + 1) * self.cfg.chipsize
+        if self._is_cached(bi, bj):
+            self.c[:, rows, cols] = np.stack(
+                [
+                    np.frombuffer(
+                        decompress(
+                            AnyPath(self._cache_path(band, bi, bj)).read_bytes(),
+                            CodecEnum.ZSTD,
+                            np.uint16,
+                        ),
+                        dtype=np.uint16,
+                    ).reshape(shape)
+                    for band in self.cfg.bands
+                ]
             )
-            y_slice = slice(
-                block_id[3] * self.cfg.chipsize, (block_id[3] + 1) * self.cfg.chipsize
+            return
+
+        if len(self.revisits):
+            arr = self.z[:, :, rows, cols]
+            if self.aoi is None and self.cache is None and self.previous is None:
+                valid = ~self.mask[:, rows, cols]  # R, Y, X
+            else:
+                # no tile-wide mask, only mask non-data pixels so blocks don't depend
+                # on which chips were in scope
+                valid = (arr != 0).any(axis=1)
+        else:
+            valid = np.zeros((0, *shape), dtype=bool)
+
+        if valid.any() and self._caches_blocks:
+            # cached blocks are shared per band, so each band is composited on its own
+            # validity, as a run of only that band would
+            block = np.concatenate(
+                [
+                    composite_pixels(arr[:, [bb]], arr[:, bb] != 0, self.cfg.composite)
+                    for bb in range(arr.shape[1])
+                ]
             )
+        elif valid.any():
+            block = composite_pixels(arr, valid, self.cfg.composite)
         else:
-            raise ValueError("neither chip nor block_id is provided.")
+            """shortcut if all data is masked, the composite is filled with 0"""
+            block = np.zeros((len(self.cfg.bands), *shape), dtype=np.uint16)
+
+        if self.persist_state:
+            times = composite_times(valid, self._times, self.cfg.composite)
+            if self.previous is not None:
+                prev, prev_times = self._read_state(self.previous_store, bi, bj, shape)
+                block, times, changed = merge_composites(
+                    prev, prev_times, block, times, self.cfg.composite
+                )
+                if changed.any():
+                    self._changed.add((bi, bj))
+            self._write_state(bi, bj, block, times)
+
+        if block.any():
+            self.c[:, rows, cols] = block
 
-        if self.mask[:, x_slice, y_slice].all():  # R, X, Y
-            """maybe shortcut if all data is masked"""
+        if self._caches_blocks:
+            for band, band_block in zip(self.cfg.bands, block):
+                AnyPath(self._cache_path(band, bi, bj)).write_bytes(
+                    compress(band_block, CodecEnum.ZSTD, 1)
+                )
+
+    def _state_path(self, store: str, bi: int = None, bj: int = None) -> str:
+        pth = f"{store}/state/{self.tile.tile}"
+        return f"{pth}/state.json" if bi is None else f"{pth}/{bi}-{bj}"
+
+    def _write_state(self, bi: int, bj: int, block: np.ndarray, times: np.ndarray):
+        """persist a composited block and the time of the revisit behind each pixel"""
+
+        block = compress(block, CodecEnum.ZSTD, 1)
+        AnyPath(self._state_path(self.store, bi, bj)).write_bytes(
+            np.uint64(len(block)).tobytes()
+            + block
+            + compress(times.astype(np.int64), CodecEnum.ZSTD, 1)
+        )
+
+    def _read_state(
+        self, store: str, bi: int, bj: int, shape: tuple[int, int]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """a block's persisted composite and pixel times, empty if it wasn't stored"""
+
+        pth = AnyPath(self._state_path(store, bi, bj))
+        if not pth.exists():
             return (
-                np.ones(
-                    (len(self.cfg.bands), self.cfg.chipsize, self.cfg.chipsize),
-                    dtype=self.z.dtype,
+                np.zeros((len(self.cfg.bands), *shape), dtype=np.uint16),
+                np.zeros(shape, dtype=np.int64),
+            )
+
+        payload = pth.read_bytes()
+        split = 8 + int(np.frombuffer(payload[:8], dtype=np.uint64)[0])
+        block = decompress(payload[8:split], CodecEnum.ZSTD, np.uint16)
+        times = decompress(payload[split:], CodecEnum.ZSTD, np.int64)
+        return (
+            np.frombuffer(block, dtype=np.uint16).reshape(-1, *shape),
+            np.frombuffer(times, dtype=np.int64).reshape(shape),
+        )
+
+    def _load_previous(self):
+        """read the composite state of the run this one extends and keep only the
+        revisits it hasn't composited yet"""
+
+        pth = AnyPath(self._state_path(self.previous_store))
+        if not pth.exists():
+            raise ValueError(
+                f"{self.previous_store} has no composite state for {self.tile.tile}, "
+                "materialize it with composite_state=True"
+            )
+
+        previous = json.loads(pth.read_text())
+        current = self._state_meta([])
+        for field in ("bands", "composite", "chipsize"):
+            if previous[field] != current[field]:
+                raise ValueError(
+                    f"{field} of the previous run {previous[field]} "
+                    f"don't match {current[field]}"
                 )
-                * np.nan
+
+        done = set(previous["granules"])
+        self.revisits = [r for r in self.revisits if r.granule_id not in done]
+        self.previous = previous
+
+        root = AnyPath(f"{self.previous_store}/manifests/")
+        if root.exists():
+            for p in root.glob(f"{self.tile.tile}-*.json"):
+                manifest = Manifest.model_validate_json(p.read_text())
+                self.previous_manifests[manifest.shard] = manifest
+
+    def _state_meta(self, granules: list[str]) -> dict:
+        """what a run's composite state holds, checked before a delta run extends it"""
+
+        times = [r.sensing_time.isoformat() for r in self.revisits]
+        if self.previous is not None:
+            times += [self.previous["time_start"], self.previous["time_end"]]
+        times = sorted(t for t in times if t is not None)
+
+        return {
+            "granules": sorted(granules),
+            "bands": [getattr(b, "value", b) for b in self.cfg.bands],
+            "composite": getattr(self.cfg.composite, "value", self.cfg.composite),
+            "chipsize": self.cfg.chipsize,
+            "time_start": times[0] if times else None,
+            "time_end": times[-1] if times else None,
+        }
+
+    def _write_state_meta(self):
+        granules = [r.granule_id for r in self.revisits]
+        if self.previous is not None:
+            granules += self.previous["granules"]
+        AnyPath(self._state_path(self.store)).write_text(
+            json.dumps(self._state_meta(granules))
+        )
+
+    def composite(self, chips: Optional[ChipTable] = None):
+        """composite each pixel covered by a chip exactly once into a tile-level composite"""
+
+        if self.cache is not None and not self._cached:
+            self._load_cache()
+
+        if self.c is None:
+            self.c = zarr.open(
+                f"./local-{self.tile.tile}-composite.zarr",
+                mode="w",
+                shape=(len(self.cfg.bands), TILE_PX, TILE_PX),
+                chunks=(len(self.cfg.bands), self.cfg.chipsize, self.cfg.chipsize),
+                dtype="uint16",
+                fill_value=0,
             )
+            self._composited = set()
+            if self.persist_state:
+                AnyPath(self._state_path(self.store)).parent.mkdir(
+                    parents=True, exist_ok=True
+                )
 
-        arr = self.z[
-            :,
-            :,
-            chip.tile_minpx : chip.tile_maxpx,  # noqa: E203
-            chip.tile_minpy : chip.tile_maxpy,  # noqa: E203
-        ]
+        chips = self.chips if chips is None else chips
+        blocks = {(int(bi), int(bj)) for bi, bj in chips.blocks()} - self._composited
 
-        if self.cfg.composite == "FIRST":
-            return composite_first(arr)
-        elif self.cfg.composite == "LAST":
-            return composite_last(arr)
-        else:
-            raise NotImplementedError("Only FIRST and LAST composite is supported.")
+        jobs = [dask.delayed(self._composite_block)(bi, bj) for bi, bj in blocks]
+        dask.compute(*jobs, num_workers=4)
+        self._composited |= blocks
 
-    def _burn_target(self, chip):
-        """burn the target data into an image matching the chip"""
+        return self.c
+
+    def _rasterize(self, geometries, out_shape: tuple[int, int], transform: Affine):
+        """burn geometries into a uint8 label raster"""
 
-        transform = Affine.from_gdal(*chip.affine_transform)
+        if len(geometries) == 0:
+            return np.zeros(out_shape, dtype=np.uint8)
 
         return np.array(
             features.rasterize(
-                [
-                    (target.geometry, 255)
-                    for _idx, target in self.gdf.loc[
-                        self.gdf.intersects(chip.geometry)
-                    ].iterrows()
-                ],
-                out_shape=(self.cfg.chipsize, self.cfg.chipsize),
+                [(geometry, 255) for geometry in geometries],
+                out_shape=out_shape,
                 transform=transform,
                 fill=0,
                 all_touched=False,
@@ -301,24 +701,49 @@ class Archive:
             )
         )
 
-    def composite(self):
-        """composite the whole archive data"""
+    def _burn_target(self, chips: ChipTable, kk: int):
+        """burn the target data into an image matching the chip"""
 
-        return da.map_blocks(
-            self._composite_chip,
-            chunks=(
-                len(self.revisits),
-                len(self.cfg.bands),
-                self.cfg.chipsize,
-                self.cfg.chipsize,
+        return self._rasterize(
+            self.gdf.geometry.values[
+                self.tree.query(shapely.box(*chips.bounds[kk]), predicate="intersects")
+            ],
+            (self.cfg.chipsize, self.cfg.chipsize),
+            chips.transform(kk),
+        )
+
+    def _burn_region(self, chips: ChipTable) -> np.ndarray:
+        """burn the target data once into an image covering a region of chips"""
+
+        row0, col0, row1, col1 = chips.extent
+        footprint = shapely.union_all(chips.geometry)
+
+        # only rasterize target geometry that falls within the chips
+        targets = shapely.intersection(
+            self.gdf.geometry.values[
+                self.tree.query(footprint, predicate="intersects")
+            ],
+            footprint,
+        )
+
+        return self._rasterize(
+            targets[~shapely.is_empty(targets)],
+            (row1 - row0, col1 - col0),
+            Affine(
+                RESOLUTION,
+                0.0,
+                self.tile_minx + col0 * RESOLUTION,
+                0.0,
+                -RESOLUTION,
+                self.tile_maxy - row0 * RESOLUTION,
             ),
-            dtype=self.z.dtype,
-        ).compute()
+        )
 
     def composite_chips(self):
-        """iterate over chips and composite"""
-        for _idx, chip in self.chips.iterrows():
-            yield self._composite_chip(chip=chip)
+        """iterate over chips of the tile-level composite"""
+        for chips in self.iter_chips():
+            for kk in range(len(chips)):
+                yield self.c[(slice(None), *chips.window(kk))]
 
     def _prep_chip_path(self):
         """prepare the chip path"""
@@ -334,115 +759,474 @@ class Archive:
         """prepare the archive paths"""
         self._prep_chip_path()
         self._prep_target_path()
+        AnyPath(f"{self.store}/manifests/").mkdir(parents=True, exist_ok=True)
+
+    @property
+    def fingerprint(self) -> str:
+        """identifies the chips this archive produces: its output-affecting dataspec
+        fields and revisits"""
+        key = self.cfg.model_dump_json(include=FINGERPRINT_FIELDS) + ",".join(
+            r.granule_id for r in self.revisits
+        )
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def _manifest_path(self, shard: int) -> str:
+        return f"{self.store}/manifests/{self.tile.tile}-{shard:05d}.json"
+
+    def resume(self) -> int:
+        """load the batches an earlier attempt completed, returning how many batches
+        are left to materialize.
+
+        The tile's objects are listed once; a batch counts as done if its manifest
+        matches this archive's fingerprint and chip ids, and every chip and target
+        object it references was listed.
+        """
+
+        root = AnyPath(self.store)
+        listing = (
+            {str(p) for p in root.rglob(f"{self.tile.tile}-*")}
+            if root.exists()
+            else set()
+        )
+
+        manifests = [
+            Manifest.model_validate_json(AnyPath(p).read_text())
+            for p in sorted(listing)
+            if p.startswith(str(AnyPath(self._manifest_path(0)).parent))
+        ]
+
+        self.completed = {}
+        for manifest in manifests:
+            paths = {c.chip_path for c in manifest.index.chips} | {
+                c.target_path for c in manifest.index.chips
+            }
+            if manifest.fingerprint == self.fingerprint and paths <= listing:
+                self.completed[manifest.shard] = manifest
+
+        return sum(
+            not self._is_completed(shard, batch)
+            for shard, batch in enumerate(self.iter_chips())
+        )
+
+    def _is_completed(self, shard: int, batch: ChipTable) -> bool:
+        manifest = self.completed.get(shard)
+        return manifest is not None and manifest.chip_ids == batch.ids.tolist()
+
+    def _write_manifest(
+        self,
+        shard: int,
+        batch: ChipTable,
+        chip_indices: list[ChipIndex],
+        target_indices: list[TargetIndex],
+        histogram: np.ndarray,
+    ):
+        """record a batch whose writes have all landed"""
+
+        index = self._merge_indices(chip_indices, target_indices).model_copy(
+            update={"histogram": histogram.tolist()}
+        )
+        AnyPath(self._manifest_path(shard)).write_text(
+            Manifest(
+                fingerprint=self.fingerprint,
+                shard=shard,
+                chip_ids=batch.ids.tolist(),
+                index=index,
+            ).model_dump_json()
+        )
+
+    def _is_unchanged(self, shard: int, batch: ChipTable) -> bool:
+        """whether a delta run left every block of a batch stored by the previous
+        run as it was"""
+
+        manifest = self.previous_manifests.get(shard)
+        return (
+            manifest is not None
+            and manifest.chip_ids == batch.ids.tolist()
+            and not {(int(bi), int(bj)) for bi, bj in batch.blocks()} & self._changed
+        )
+
+    def _reuse_previous(self, shard: int, batch: ChipTable) -> ArchiveIndex:
+        """point this run's manifest at a batch the previous run stored, so later
+        delta runs can keep reusing it"""
+
+        manifest = self.previous_manifests[shard]
+        AnyPath(self._manifest_path(shard)).write_text(
+            manifest.model_copy(
+                update={"fingerprint": self.fingerprint}
+            ).model_dump_json()
+        )
+        return manifest.index
+
+    def _open_shards(self, shard: int) -> tuple[ShardWriter, ShardWriter]:
+        """open the chip and target shards of a batch, or None if chips aren't sharded"""
+
+        if not self.cfg.shard_chips:
+            return None, None
+
+        name = f"{self.tile.tile}-{shard:05d}.{SHARD_SUFFIX}"
+        return (
+            ShardWriter(f"{self.store}/chips/{name}"),
+            ShardWriter(f"{self.store}/targets/{name}"),
+        )
+
+    def _write(
+        self, pth: str, ii: int, payload: bytes, shard: Optional[ShardWriter] = None
+    ) -> tuple[str, Optional[int], Optional[int]]:
+        """write a chip's payload to its own object, or append it to a shard"""
+
+        if shard is None:
+            if self.uploads is None:
+                AnyPath(pth).write_bytes(payload)
+            else:
+                self._pending.append(self.uploads.write(pth, payload))
+            return str(AnyPath(pth)), None, None
+
+        return shard.path, *shard.add(ii, payload)
+
+    def _store_chip(
+        self,
+        ii: int,
+        chip_data: np.ndarray,
+        shard: Optional[ShardWriter] = None,
+        quantization: Quantization = Quantization(),
+        valid: Optional[np.ndarray] = None,
+    ):
+        """store the composite chip, already quantized by `quantization`. Stats
+        are taken over the (H, W) `valid` pixels only, if given."""
+        pth, offset, nbytes = self._write(
+            f"{self.store}/chips/{self.tile.tile}-{ii}.npy",
+            ii,
+            compress(
+                np.ascontiguousarray(chip_data), self.cfg.codec, self.cfg.codec_level
+            ),
+            shard,
+        )
+
+        # stats and histograms are reported in dequantized units
+        values = dequantize(chip_data, quantization)
+        count, mean, m2 = moments(values, valid)
+        hist = histogram(values, self.hist_range, self.cfg.hist_bins, valid)
+        with self._hist_lock:
+            self.histogram += hist
 
-    def _store_chip(self, ii: int, chip):
-        """store the composite chip"""
-        chip_data = self._composite_chip(chip=chip)
-        pth = AnyPath(f"{self.store}/chips/{self.tile.tile}-{ii}.npy")
-        pth.write_bytes(chip_data.tobytes())
         return ChipIndex(
             tile=self.tile.tile,
             chip_ii=ii,
             chip_idx=self.tile.tile + f"-{ii}",
-            chip_path=str(pth),
+            chip_path=pth,
+            chip_offset=offset,
+            chip_nbytes=nbytes,
+            chip_codec=self.cfg.codec,
+            chip_quantization=quantization,
             chip_stats={
-                "mean": np.nanmean(chip_data, axis=(1, 2)).tolist(),
-                "std": np.nanstd(chip_data, axis=(1, 2)).tolist(),
+                "mean": mean.tolist(),
+                "std": std(count, m2).tolist(),
+                "count": count.tolist(),
             },
         )
 
-    def _store_target(self, ii: int, chip):
+    def _chip_geo(self, chips: ChipTable) -> list[dict]:
+        """the footprint and time span of each chip, recorded in the index"""
+
+        bounds = chips.bounds
+        lon, lat = self._to_wgs.transform(
+            bounds[:, [0, 2, 0, 2]], bounds[:, [1, 1, 3, 3]]
+        )
+        bounds_wgs = np.column_stack(
+            [lon.min(axis=1), lat.min(axis=1), lon.max(axis=1), lat.max(axis=1)]
+        )
+        times = [r.sensing_time for r in self.revisits]
+        if self.previous is not None:
+            times += [
+                datetime.fromisoformat(t)
+                for t in (self.previous["time_start"], self.previous["time_end"])
+                if t is not None
+            ]
+        times = sorted(times) or [None]
+
+        return [
+            {
+                "chip_crs": self.tile.utm_crs,
+                "chip_bounds": b.tolist(),
+                "chip_bounds_wgs": w.tolist(),
+                "time_start": times[0],
+                "time_end": times[-1],
+            }
+            for b, w in zip(bounds, bounds_wgs)
+        ]
+
+    def _store_region(
+        self, chips: ChipTable, shard: Optional[ShardWriter] = None
+    ) -> list[ChipIndex]:
+        """read and quantize a composite region once and store all its chips as
+        views of it"""
+
+        row0, col0, row1, col1 = chips.extent
+        raw = np.asarray(self.c[:, row0:row1, col0:col1])
+        # the composite fills nodata with 0, which quantizes to a real value
+        valid = (raw != 0).any(axis=0)
+        region, quantization = quantize(
+            raw,
+            self.cfg.chip_dtype,
+            self.cfg.clip,
+            self.cfg.rescale,
+        )
+
+        geo = self._chip_geo(chips)
+
+        return [
+            self._store_chip(
+                int(ii),
+                region[(slice(None), *chips.window(kk, (row0, col0)))],
+                shard,
+                quantization,
+                valid[chips.window(kk, (row0, col0))],
+            ).model_copy(update=geo[kk])
+            for kk, ii in enumerate(chips.ids)
+        ]
+
+    def _store_target(
+        self, ii: int, target_img: np.ndarray, shard: Optional[ShardWriter] = None
+    ):
         """store the target data"""
-        target_img = self._burn_target(chip)
-        pth = AnyPath(f"{self.store}/targets/{self.tile.tile}-{ii}.npy")
-        pth.write_bytes(target_img.tobytes())
+        encoding = self.cfg.target_encoding
+        pth, offset, nbytes = self._write(
+            f"{self.store}/targets/{self.tile.tile}-{ii}.{TARGET_SUFFIX[encoding]}",
+            ii,
+            compress(
+                np.frombuffer(encode_target(target_img, encoding), dtype=np.uint8),
+                self.cfg.codec,
+                self.cfg.codec_level,
+            ),
+            shard,
+        )
         val, counts = np.unique(target_img, return_counts=True)
         return TargetIndex(
             tile=self.tile.tile,
             chip_ii=ii,
             chip_idx=self.tile.tile + f"-{ii}",
-            target_path=str(pth),
+            target_path=pth,
             target_pxcount=dict(zip(val.tolist(), counts.tolist())),
+            target_encoding=encoding,
+            target_offset=offset,
+            target_nbytes=nbytes,
+            target_codec=self.cfg.codec,
         )
 
+    def _store_target_region(
+        self, chips: ChipTable, shard: Optional[ShardWriter] = None
+    ) -> list[TargetIndex]:
+        """burn the targets of a region once and store each chip's slice of it"""
+
+        row0, col0, _, _ = chips.extent
+        region = self._burn_region(chips)
+
+        return [
+            self._store_target(int(ii), region[chips.window(kk, (row0, col0))], shard)
+            for kk, ii in enumerate(chips.ids)
+        ]
+
+    def _store_target_chip(
+        self, chips: ChipTable, kk: int, shard: Optional[ShardWriter] = None
+    ) -> list[TargetIndex]:
+        """burn and store the target of a single chip"""
+        return [
+            self._store_target(int(chips.ids[kk]), self._burn_target(chips, kk), shard)
+        ]
+
     def store_chips_eager(self):
         """store the composite chips"""
 
         self._prep_chip_path()
 
-        for ii, (_idx, chip) in enumerate(self.chips.iterrows()):
-            self._store_chip(ii, chip)
+        for shard, batch in enumerate(self.iter_chips()):
+            chip_shard, _ = self._open_shards(shard)
+            for chips in batch.groupby_region():
+                self._store_region(chips, chip_shard)
+            if chip_shard is not None:
+                chip_shard.close()
 
     def store_targets_eager(self):
         """store the target data"""
 
         self._prep_target_path()
 
-        for ii, (_idx, chip) in enumerate(self.chips.iterrows()):
-            self._store_target(ii, chip)
+        for shard, batch in enumerate(self.iter_chips()):
+            _, target_shard = self._open_shards(shard)
+            for chips in batch.groupby_region():
+                self._store_target_region(chips, target_shard)
+            if target_shard is not None:
+                target_shard.close()
 
-    def store_chips(self):
+    def store_chips(
+        self, batch: Optional[ChipTable] = None, shard: Optional[ShardWriter] = None
+    ):
 
-        for ii, (_idx, chip) in enumerate(self.chips.iterrows()):
-            yield dask.delayed(self._store_chip)(ii, chip)
+        batch = self.chips if batch is None else batch
+        for chips in batch.groupby_region():
+            yield dask.delayed(self._store_region)(chips, shard)
 
-    def store_targets(self):
-        for ii, (_idx, chip) in enumerate(self.chips.iterrows()):
-            yield dask.delayed(self._store_target)(ii, chip)
+    def store_targets(
+        self,
+        batch: Optional[ChipTable] = None,
+        per_chip: bool = False,
+        shard: Optional[ShardWriter] = None,
+    ):
+        """yield delayed target stores, burning once per region or once per chip"""
+
+        batch = self.chips if batch is None else batch
+        if per_chip:
+            for kk in range(len(batch)):
+                yield dask.delayed(self._store_target_chip)(batch, kk, shard)
+        else:
+            for chips in batch.groupby_region():
+                yield dask.delayed(self._store_target_region)(chips, shard)
 
     def _merge_indices(
         self, chip_indices: list[ChipIndex], target_indices: list[TargetIndex]
     ) -> ArchiveIndex:
 
         target_index = {t.chip_idx: t.model_dump() for t in target_indices}
-        chip_index = {c.chip_idx: c.model_dump() for c in chip_indices}
+        chip_index = {
+            c.chip_idx: c.model_dump()
+            for c in sorted(chip_indices, key=lambda c: c.chip_ii)
+        }
 
         # merge chip and target data together and cast to ChipMetaData
         chip_data = {k: {**chip_index[k], **target_index[k]} for k in chip_index.keys()}
 
         chip_data = [ChipMetaData(**chip_data[k]) for k in chip_data.keys()]
 
-        return ArchiveIndex(tile=self.tile.tile, chips=chip_data)
+        return ArchiveIndex(
+            tile=self.tile.tile,
+            chips=chip_data,
+            duplicate_chips=self.duplicate_chips,
+            histogram=self.histogram.tolist(),
+            hist_range=list(self.hist_range),
+        )
 
-    def materialize(self):
-        """materialize the archive data"""
+    def materialize(self, per_chip_targets: bool = False):
+        """materialize the archive data, one bounded batch of chips at a time.
 
-        self.prep_archive_paths()
+        Writes drain on a bounded upload queue while the next batch is composited;
+        a batch's index entries are only kept, and its manifest written, once all
+        of its writes have landed. Batches completed by an earlier attempt (see
+        `resume`) are read back from their manifests instead, as are batches a
+        delta run (see DataSpec.previous_store) didn't change.
+        """
 
-        store_chip_futures = [fn for fn in self.store_chips()]
-        store_target_futures = [fn for fn in self.store_targets()]
+        self.prep_archive_paths()
 
-        chip_indices = dask.compute(*store_chip_futures, num_workers=4)  # fast!
-        target_indices = dask.compute(*store_target_futures, num_workers=4)
+        chip_indices, target_indices = [], []
+        pending = []  # unconfirmed batches, see _confirm
+
+        def _confirm(batches):
+            for shard, batch, chip_index, target_index, hist, writes in batches:
+                confirm(writes)
+                self._write_manifest(shard, batch, chip_index, target_index, hist)
+                chip_indices.extend(chip_index)
+                target_indices.extend(target_index)
+
+        with UploadQueue(self.cfg.upload_workers, self.cfg.upload_queue) as uploads:
+            self.uploads = uploads
+            try:
+                for shard, batch in enumerate(self.iter_chips()):
+                    if self._is_completed(shard, batch):
+                        index = self.completed[shard].index
+                        chip_indices.extend(index.chips)
+                        target_indices.extend(index.chips)
+                        self.histogram += np.asarray(index.histogram, dtype=np.int64)
+                        continue
+
+                    self.composite(batch)
+                    if self._is_unchanged(shard, batch):
+                        index = self._reuse_previous(shard, batch)
+                        chip_indices.extend(index.chips)
+                        target_indices.extend(index.chips)
+                        self.histogram += np.asarray(index.histogram, dtype=np.int64)
+                        continue
+
+                    chip_shard, target_shard = self._open_shards(shard)
+                    self._pending = []
+                    hist = self.histogram.copy()
+
+                    store_chip_futures = list(self.store_chips(batch, chip_shard))
+                    store_target_futures = list(
+                        self.store_targets(
+                            batch, per_chip=per_chip_targets, shard=target_shard
+                        )
+                    )
+
+                    # one barrier for chips and targets; writes keep draining after
+                    results = dask.compute(
+                        *store_chip_futures, *store_target_futures, num_workers=4
+                    )
+                    n_chip = len(store_chip_futures)
+
+                    for writer in (chip_shard, target_shard):
+                        if writer is not None:
+                            self._pending.append(uploads.submit(writer.close))
+
+                    pending.append(
+                        (
+                            shard,
+                            batch,
+                            list(chain.from_iterable(results[:n_chip])),
+                            list(chain.from_iterable(results[n_chip:])),
+                            self.histogram - hist,
+                            self._pending,
+                        )
+                    )
+
+                    # confirm the previous batch while this one uploads
+                    _confirm(pending[:-1])
+                    pending = pending[-1:]
+
+                _confirm(pending)
+            finally:
+                self.uploads = None
+
+        if self.persist_state:
+            self._write_state_meta()
 
         return self._merge_indices(chip_indices, target_indices)
 
     @classmethod
     def merge_archive_indices(cls, indices: list[ArchiveIndex]):
+        """pool the chip stats and histograms of tile indices into a dataset index"""
+
+        chips = list(chain.from_iterable(idx.chips for idx in indices))
+        stats = [chip.chip_stats for chip in chips]
+
+        if not stats:
+            """no chips left, e.g. every chip is owned by an overlapping tile"""
+            return DataSetIndex(
+                chips=[],
+                chip_stats={"mean": [], "std": [], "count": []},
+                duplicate_chips=sum(idx.duplicate_chips for idx in indices),
+            )
+
+        mean = np.array([s.mean for s in stats], dtype=np.float64)
+        sd = np.array([s.std for s in stats], dtype=np.float64)
+        # chips indexed before counts were recorded are weighted equally
+        count = np.array(
+            [s.count or [1] * len(s.mean) for s in stats], dtype=np.float64
+        )
+        mean, sd, count = (a.reshape(len(stats), -1) for a in (mean, sd, count))
+        count, mean, m2 = merge_moments(count, mean, sd**2 * count)
+
+        hists = [idx.histogram for idx in indices if idx.histogram is not None]
+
         return DataSetIndex(
-            chips=list(chain.from_iterable([idx.chips for idx in indices])),
+            chips=chips,
             chip_stats={
-                "mean": np.nanmean(
-                    np.array(
-                        [
-                            chip.chip_stats.mean
-                            for chip in list(
-                                chain.from_iterable([idx.chips for idx in indices])
-                            )
-                        ]
-                    ),
-                    axis=1,
-                ).tolist(),
-                "std": np.nanmean(
-                    np.array(
-                        [
-                            chip.chip_stats.std
-                            for chip in list(
-                                chain.from_iterable([idx.chips for idx in indices])
-                            )
-                        ]
-                    ),
-                    axis=1,
-                ),
+                "mean": mean.tolist(),
+                "std": std(count, m2).tolist(),
+                "count": count.tolist(),
             },
+            duplicate_chips=sum(idx.duplicate_chips for idx in indices),
+            histogram=np.sum(hists, axis=0).tolist() if hists else None,
+            hist_range=next(
+                (idx.hist_range for idx in indices if idx.histogram is not None), None
+            ),
         )
@@ -1,85 +1,97 @@
+import io
 import os
-import tempfile
-from functools import reduce
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import List
 
+import geopandas as gpd
 import requests
-from google.cloud import bigquery
 
 from eoflow.core.logging import logger
+from eoflow.core.revisits import RevisitIndex, query_bigquery
+from eoflow.core.tiling import tiles_for_geometries
 from eoflow.core.utils import read_any_geofile
 from eoflow.models import DataSpec, S2IndexDF, Tile
 
 
 def get_tiles(dataspec: DataSpec, logger=logger) -> list[Tile]:
+    """the S2 tiles intersecting the aoi or targets, from the local mgrs tile index"""
 
-    CATALOGUE_BASE_URL = os.getenv(
-        "CATALOGUE_BASE_URL", "https://eo-catalogue.svante.io"
-    )
-    CATALOGUE_API_KEY = os.getenv("CATALOGUE_API_KEY")
+    # in aoi mode the aoi is materialized wall-to-wall, so it decides the tiles
+    gdf = read_any_geofile(dataspec.aoi_geofile or dataspec.target_geofile)
+    if gdf.crs is not None and not gdf.crs.equals("EPSG:4326"):
+        gdf = gdf.to_crs("EPSG:4326")
 
-    tmp = tempfile.NamedTemporaryFile(suffix=".gpkg")
+    tiles = tiles_for_geometries(gdf.geometry.values)
+    logger.info(f"Found {len(tiles)} tiles for {len(gdf)} geometries")
 
-    gdf = read_any_geofile(dataspec.target_geofile)
+    return [Tile(tile=tile) for tile in tiles]
 
-    if len(gdf) > 1000000:
-        raise ValueError("Too many rows in target geofile to use tiling service")
 
-    BATCH = 5000  # toDO move to env var and match catalog service
+def _post_tiles(
+    session: requests.Session, url: str, batch: gpd.GeoDataFrame
+) -> list[str]:
+    """the tile ids of one batch of geometries, posted as an in-memory geoparquet"""
 
-    tiles = []
+    buffer = io.BytesIO()
+    batch.to_parquet(buffer, compression="zstd")
 
-    for ii in range(len(gdf) // BATCH + 1):
+    r = session.post(
+        url, files={"file": ("targets.parquet", buffer.getvalue())}, timeout=300
+    )
+    r.raise_for_status()
+    return [item["tile"] for item in r.json()["tiles"]]
 
-        logger.info(f"Fetching tiles: {ii + 1}/{len(gdf) // BATCH + 1}")
 
-        gdf.iloc[ii * BATCH : (ii + 1) * BATCH].to_file(tmp.name, driver="gpkg")
+def get_tiles_remote(dataspec: DataSpec, logger=logger) -> list[Tile]:
+    """the S2 tiles intersecting the aoi or targets, from the catalogue service.
 
-        headers = {"x-api-key": CATALOGUE_API_KEY}
+    Batches are posted concurrently over one pooled session.
+    """
 
-        r = requests.post(
-            CATALOGUE_BASE_URL + "/mgrs-tiles",
-            files={"file": (tmp.name, open(tmp.name, "rb"))},
-            headers=headers,
-        )
+    CATALOGUE_BASE_URL = os.getenv(
+        "CATALOGUE_BASE_URL", "https://eo-catalogue.svante.io"
+    )
+    CATALOGUE_API_KEY = os.getenv("CATALOGUE_API_KEY")
+    BATCH = int(os.getenv("CATALOGUE_BATCH", 5000))  # match the catalog service
+    WORKERS = int(os.getenv("CATALOGUE_WORKERS", 8))
 
-        r.raise_for_status()
+    # in aoi mode the aoi is materialized wall-to-wall, so it decides the tiles
+    gdf = read_any_geofile(dataspec.aoi_geofile or dataspec.target_geofile)
 
-        tiles += [Tile(**item) for item in r.json()["tiles"]]
+    if len(gdf) > 1000000:
+        raise ValueError("Too many rows in target geofile to use tiling service")
 
-    unique_tiles = reduce(
-        lambda x, y: x + [y] if (y.tile not in {t.tile for t in x}) else x, tiles, []
-    )
+    batches = [gdf.iloc[ii : ii + BATCH] for ii in range(0, max(len(gdf), 1), BATCH)]
+    logger.info(f"Fetching tiles: {len(batches)} batches on {WORKERS} connections")
 
-    return unique_tiles
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=WORKERS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if CATALOGUE_API_KEY:
+            session.headers["x-api-key"] = CATALOGUE_API_KEY
 
+        with ThreadPoolExecutor(WORKERS, thread_name_prefix="eoflow-tiles") as pool:
+            results = pool.map(
+                partial(_post_tiles, session, CATALOGUE_BASE_URL + "/mgrs-tiles"),
+                batches,
+            )
+            tiles = dict.fromkeys(tile for batch in results for tile in batch)
 
-def get_revisits(tiles: List[Tile], dataspec: DataSpec) -> S2IndexDF:
+    return [Tile(tile=tile) for tile in tiles]
 
-    query_columns = ",".join(
-        [
-            key
-            for key in S2IndexDF.to_json_schema()["properties"].keys()
-            if key != "index"
-        ]
-    )
-    query_tiles = ",".join([f"'{tile.tile}'" for tile in tiles])
-
-    Q = f"""
-        SELECT
-          {query_columns}
-        FROM `bigquery-public-data.cloud_storage_geo_index.sentinel_2_sr_index`
-        WHERE sensing_time > '{dataspec.start_datetime}'
-        AND sensing_time <= '{dataspec.end_datetime}'
-        AND mgrs_tile IN ({query_tiles})
-        LIMIT 3
-    """
 
-    client = bigquery.Client()
-    query_job = client.query(Q)
+def get_revisits(tiles: List[Tile], dataspec: DataSpec) -> S2IndexDF:
+    """every revisit of `tiles` sensed in the dataspec's (start, end], from the
+    revisit cache if the dataspec has one, or else straight from BigQuery"""
 
-    results = query_job.result()  # Waits for job to complete.
+    tiles = [tile.tile for tile in tiles]
+    start, end = dataspec.start_datetime, dataspec.end_datetime
 
-    df = results.to_dataframe()
+    if dataspec.revisit_index is not None:
+        table = RevisitIndex(dataspec.revisit_index).revisits(tiles, start, end)
+    else:
+        table = query_bigquery(tiles, start, end)
 
-    return df
+    return table.to_pandas()
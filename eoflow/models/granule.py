@@ -4,12 +4,15 @@ from typing import List
 
 import dask.array as da
 import numpy as np
+import rasterio
 
 # from eoflow.cloud.gcp.utils import download_blob
 from cloudpathlib import AnyPath
 from PIL import Image
+from rasterio.windows import Window
 
 from eoflow.core import settings
+from eoflow.core.chips import TILE_PX
 from eoflow.core.resize import imresize
 from eoflow.models.models import (
     S2_BAND_RESOLUTION,
@@ -18,6 +21,15 @@ from eoflow.models.models import (
     UpsampleEnum,
 )
 
+# the upsampling factor of each band resolution to the 10m grid
+UPSAMPLE_FACTOR = {"10m": 1, "20m": 2, "60m": 6}
+
+# source pixels read around a window, covering the support of the upsampling kernels
+WINDOW_MARGIN = 4
+
+# the GDAL virtual filesystem of each cloud prefix
+VSI_PREFIX = {"gs://": "/vsigs/"}
+
 
 def make_band_urls(mgrs_tile, product_id, granule_id):
     """return the band prefixes for the given product_id."""
@@ -95,6 +107,48 @@ class GCPS2Granule:
 
         return np.expand_dims(arr, AXIS)
 
+    def _read_band_windows(self, band: str, windows: List[Window]) -> List[np.ndarray]:
+        """read windows of a band at its native resolution, fetching only the jp2
+        tiles they cover rather than the whole band."""
+
+        pth = VSI_PREFIX[settings.cloud_prefix] + os.path.join(
+            S2_BUCKET, self.band_urls[band]
+        )
+
+        # the sentinel-2 bucket is public
+        with rasterio.Env(GS_NO_SIGN_REQUEST="YES"), rasterio.open(pth) as src:
+            return [src.read(1, window=window) for window in windows]
+
+    def read_windows(
+        self, band: str, windows: List[tuple[slice, slice]]
+    ) -> List[np.ndarray]:
+        """read (rows, cols) windows of the 10m tile grid from a single band,
+        upsampled as `_read_one_band` does for the whole band."""
+
+        factor = UPSAMPLE_FACTOR[S2_BAND_RESOLUTION[band]]
+        size = TILE_PX // factor
+
+        # the source windows, padded so the kernel sees the same neighbours
+        origins, sources = [], []
+        for rows, cols in windows:
+            r0 = max(rows.start // factor - WINDOW_MARGIN, 0)
+            c0 = max(cols.start // factor - WINDOW_MARGIN, 0)
+            r1 = min(-(-rows.stop // factor) + WINDOW_MARGIN, size)
+            c1 = min(-(-cols.stop // factor) + WINDOW_MARGIN, size)
+            origins.append((r0 * factor, c0 * factor))
+            sources.append(Window.from_slices((r0, r1), (c0, c1)))
+
+        arrs = []
+        for (rows, cols), (r0, c0), arr in zip(
+            windows, origins, self._read_band_windows(band, sources)
+        ):
+            if factor > 1:
+                arr = imresize(arr, factor, kernel=self.upsample)
+            arrs.append(
+                arr[rows.start - r0 : rows.stop - r0, cols.start - c0 : cols.stop - c0]
+            )
+        return arrs
+
     def _build_delayed_stack(self):
 
         self.stack = da.map_blocks(
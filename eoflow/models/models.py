@@ -23,6 +23,10 @@ from pyproj import CRS, Transformer
 from shapely import geometry as shapely_geometry
 from shapely.ops import transform
 
+from eoflow.core.codecs import CodecEnum
+from eoflow.core.encoding import TargetEncodingEnum
+from eoflow.core.quantize import ChipDtypeEnum
+
 Point = tuple[float, float]
 LinearRing = conlist(Point, min_length=4)
 PolygonCoords = conlist(LinearRing, min_length=1)
@@ -136,6 +140,10 @@ class DataSpec(Config):
     target_geofile: str
     aoi_geofile: Optional[str]
     dataset_store: str
+    cache_store: Optional[str] = None  # composite blocks shared across runs
+    composite_state: bool = False  # persist per-pixel revisit times for delta runs
+    previous_store: Optional[str] = None  # run store to extend with new revisits
+    revisit_index: Optional[str] = None  # parquet cache of the bigquery revisit index
     start_datetime: Optional[str] = Field(
         ..., example=(datetime.now() - relativedelta(months=1)).isoformat()[0:10]
     )
@@ -145,9 +153,20 @@ class DataSpec(Config):
     constellation: ConstellationEnum = ConstellationEnum.S2
     bands: list[S2BandsEnum] = ["B02", "B03", "B04"]
     chipsize: int = 256
+    chip_stride: Optional[int] = None  # pixels between chip origins, None=chipsize
+    chip_batch: int = 1024  # max chips composited and stored at once
+    preview: Optional[int] = None  # chips per tile in a stratified sample, None=all
+    shard_chips: bool = True  # pack each batch of chips into one shard object
+    target_encoding: TargetEncodingEnum = TargetEncodingEnum.RAW
+    codec: CodecEnum = CodecEnum.NONE  # compression of stored chips and targets
+    codec_level: int = 3
+    upload_workers: int = 8  # i/o threads draining chip and target writes
+    upload_queue: int = 64  # max writes in flight before compositing blocks
     loader_output: LoaderOuputEnum = LoaderOuputEnum.NDARRAY
     upsample: Optional[UpsampleEnum] = UpsampleEnum.BILINEAR
     thumbnail: Optional[ThumbnailProps] = None
+    chip_dtype: ChipDtypeEnum = ChipDtypeEnum.UINT16  # applies clip and rescale
+    hist_bins: int = 256  # per-band pixel histogram bins over clip (or rescale)
     clip: conlist(int, min_length=2, max_length=2) = [0, 4000]
     rescale: conlist(float, min_length=2, max_length=2) = [0, 1]
 
@@ -164,6 +183,20 @@ class DataSpec(Config):
             )
         return v
 
+    @field_validator("chip_stride")
+    def chip_stride_within_chipsize(cls, v, values):
+        # validate chips can overlap but never leave gaps
+        if v is not None and not 0 < v <= values.data["chipsize"]:
+            raise ValueError("chip_stride must be in (0, chipsize]")
+        return v
+
+    @field_validator("clip")
+    def clip_increasing(cls, v, values):
+        # validate the clip range can be rescaled
+        if v[0] >= v[1]:
+            raise ValueError("clip must be [min, max] with min < max")
+        return v
+
     @field_validator("start_datetime")
     def start_datetime_default_1m(cls, v, values):
         if v is None:
@@ -185,6 +218,12 @@ class DataSpec(Config):
             return v
 
 
+class DataSpecBatch(Config):
+    """dataspecs materialized together, sharing the granules they have in common"""
+
+    dataspecs: list[DataSpec]
+
+
 class Tile(BaseModel):
     tile: str
 
@@ -1,9 +1,21 @@
 import json
+import os
 
 import pytest
 
+from eoflow.core.tiling import TILE_INDEX, write_tile_index
 from eoflow.models import DataSpec, S2IndexItem, Tile
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def tile_index():
+    """the mgrs tile index, built once as `make tile-index` does if it is missing"""
+    if not os.path.exists(TILE_INDEX):
+        write_tile_index(TILE_INDEX)
+    return TILE_INDEX
+
 
 @pytest.fixture
 def sample_dataspec():
@@ -25,3 +37,125 @@ def sample_archive_revisits():
     return [
         S2IndexItem(**item) for item in archive_raw if item.get("mgrs_tile") == "30UXC"
     ]
+
+
+@pytest.fixture
+def read_chip():
+    """read a stored, uncompressed uint16 chip back from its index entry"""
+
+    import numpy as np
+
+    from eoflow.core.shards import read_range
+
+    def read(chip, bands: int, chipsize: int = 256) -> np.ndarray:
+        buffer = read_range(chip.chip_path, chip.chip_offset, chip.chip_nbytes)
+        return np.frombuffer(buffer, dtype=np.uint16).reshape(bands, chipsize, chipsize)
+
+    return read
+
+
+@pytest.fixture
+def archive_dataspec(sample_dataspec, tmp_path):
+    """the sample dataspec, usable from any cwd and storing to tmp_path"""
+    return sample_dataspec.model_copy(
+        update={
+            "target_geofile": os.path.join(ROOT, sample_dataspec.target_geofile),
+            "dataset_store": str(tmp_path / "store"),
+        }
+    )
+
+
+@pytest.fixture
+def sample_archive(archive_dataspec, sample_archive_tile, sample_archive_revisits):
+    """build an archive of the sample tile from the archive dataspec, updated by
+    `update`"""
+
+    from eoflow.models import Archive
+
+    def make(revisits=None, **update):
+        return Archive(
+            cfg=archive_dataspec.model_copy(update=update),
+            tile=sample_archive_tile,
+            revisits=sample_archive_revisits if revisits is None else revisits,
+        )
+
+    return make
+
+
+class FakeFill:
+    """fake revisit data in zarr stores under `root`, standing in for fill"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def open(self, shape: tuple, name: str = "fill.zarr", mode: str = "w"):
+        import zarr
+
+        return zarr.open(
+            str(self.root / name),
+            mode=mode,
+            shape=shape,
+            chunks=(1, 1, 256, 256),
+            dtype="uint16",
+        )
+
+    def __call__(self, archive, value=None, chips=None, mode: str = "w", seed=0):
+        """give `archive` a fill of its revisits and bands, writing `value` or random
+        reflectance into the window of each of `chips` (default all)"""
+
+        import numpy as np
+
+        from eoflow.core.chips import TILE_PX
+
+        shape = (len(archive.revisits), len(archive.cfg.bands))
+        archive.z = self.open((*shape, TILE_PX, TILE_PX), mode=mode)
+
+        rng = np.random.default_rng(seed)
+        chips = range(len(archive.chips)) if chips is None else chips
+        for ii in chips:
+            rows, cols = archive.chips.window(ii)
+            archive.z[:, :, rows, cols] = (
+                rng.integers(
+                    1, 4000, (*shape, rows.stop - rows.start, cols.stop - cols.start)
+                )
+                if value is None
+                else value
+            )
+        return archive.z
+
+
+@pytest.fixture
+def fake_fill(tmp_path, monkeypatch):
+    """fake revisit data for archives; runs the test in tmp_path, where the tile
+    composite is written"""
+
+    monkeypatch.chdir(tmp_path)
+    return FakeFill(tmp_path)
+
+
+@pytest.fixture
+def sample_dataset(sample_archive, fake_fill):
+    """materialize a dataset store from fake revisit data, returning its dataspec
+    and dataset index. With `nodata`, half of every chip has no valid revisit."""
+
+    from cloudpathlib import AnyPath
+
+    from eoflow.core.index import write_index
+    from eoflow.models import Archive
+
+    def make(nodata: bool = False, **update):
+        archive = sample_archive(**update)
+        cfg = archive.cfg
+        fake_fill(archive)
+        if nodata:  # no valid revisit in the left half of every chip
+            for ii in range(len(archive.chips)):
+                rows, cols = archive.chips.window(ii)
+                archive.z[:, :, rows, cols.start : cols.start + 128] = 0
+        archive.mask()
+
+        index = Archive.merge_archive_indices([archive.materialize()])
+        write_index(index.to_table(cfg.bands), f"{cfg.dataset_store}/index.parquet")
+        AnyPath(f"{cfg.dataset_store}/dataspec.json").write_text(cfg.model_dump_json())
+        return cfg, index
+
+    return make
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from eoflow.loader import Augment, ChipLoader
+
+
+def test_augment_moves_chips_and_targets_together():
+    rng = np.random.default_rng(0)
+    targets = rng.integers(0, 255, (16, 64, 64), dtype=np.uint8)
+    chips = np.stack([targets, 255 - targets], axis=1).astype(np.float32)
+
+    out, out_targets = Augment(crop=48)(chips, targets, rng)
+    assert out.shape == (16, 2, 48, 48) and out_targets.shape == (16, 48, 48)
+    assert (out[:, 0] == out_targets).all()
+    assert (out[:, 1] == 255 - out_targets.astype(np.float32)).all()
+
+    # every crop is a dihedral transform of some window of its chip
+    for chip, crop in zip(targets, out_targets):
+        windows = np.lib.stride_tricks.sliding_window_view(chip, (48, 48))
+        variants = [np.rot90(crop, -k) for k in range(4)]
+        variants += [np.rot90(np.flip(crop, axis=1), -k) for k in range(4)]
+        assert any((windows == v).all(axis=(2, 3)).any() for v in variants)
+
+    # all eight transforms occur
+    _, flipped = Augment()(chips.copy(), targets.copy(), np.random.default_rng(1))
+    assert not (flipped == targets).all()
+
+    noisy, _ = Augment(dihedral=False, noise=0.1)(chips.copy(), targets, rng)
+    offsets = (noisy - chips).reshape(16, 2, -1)
+    assert np.allclose(offsets, offsets[..., :1], atol=1e-3)  # one offset per band
+
+    with pytest.raises(ValueError):
+        Augment(noise=0.1)(chips.astype(np.uint16), targets, rng)
+
+
+def test_loader_augments_batches(sample_dataset):
+    cfg, index = sample_dataset()
+    loader = ChipLoader.from_index(
+        index, cfg, batch_size=8, augment=Augment(crop=224, noise=0.05)
+    )
+
+    chips, targets = next(iter(loader))
+    assert chips.shape == (8, 2, 224, 224) and targets.shape == (8, 224, 224)
+
+    loader.augment = None
+    plain, _ = next(iter(loader))
+    assert chips.std() > 0 and not np.array_equal(chips, plain[..., :224, :224])
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from eoflow.core import batch
+from eoflow.core.chips import TILE_PX
+from eoflow.core.index import read_index
+
+
+def shared_fill(fake_fill, fetched: list):
+    """a shared fill in which every band of every revisit holds its band's
+    position in the union, recording what it fetched"""
+
+    def fill(tile, revisits, bands, cfg):
+        fetched.append(([r.granule_id for r in revisits], bands))
+        z = fake_fill.open(
+            (len(revisits), len(bands), TILE_PX, TILE_PX), name="shared.zarr"
+        )
+        for bb in range(len(bands)):
+            z[:, bb, :512, :] = bb + 1
+        return z
+
+    return fill
+
+
+def test_materialize_tile_batch_shares_reads(
+    archive_dataspec,
+    sample_archive_tile,
+    sample_archive_revisits,
+    fake_fill,
+    read_chip,
+    tmp_path,
+    monkeypatch,
+):
+    cfg = archive_dataspec
+    fetched = []
+    monkeypatch.setattr(batch, "fill_shared", shared_fill(fake_fill, fetched))
+
+    specs = [
+        cfg.model_copy(
+            update={"dataset_store": str(tmp_path / "a"), "bands": ["B01", "B09"]}
+        ),
+        cfg.model_copy(
+            update={"dataset_store": str(tmp_path / "b"), "bands": ["B09", "B02"]}
+        ),
+    ]
+    indices, reads = batch.materialize_tile_batch(
+        sample_archive_tile,
+        [(spec, sample_archive_revisits) for spec in specs],
+    )
+
+    # one fetch of the union of bands, three reads short of two separate runs
+    assert len(fetched) == 1
+    assert fetched[0][1] == ["B01", "B09", "B02"]
+    n = len(sample_archive_revisits)
+    assert reads == {"requested": 4 * n, "fetched": 3 * n}
+
+    a, b = indices
+    assert len(a.chips) == len(b.chips)
+    for chip_a, chip_b in zip(a.chips, b.chips):
+        assert chip_a.chip_path.startswith(str(tmp_path / "a"))
+        assert (read_chip(chip_a, 2)[1] == read_chip(chip_b, 2)[0]).all()
+        # each spec reads its own bands out of the union
+        assert set(np.unique(read_chip(chip_b, 2)[0])) <= {0, 2}
+        assert set(np.unique(read_chip(chip_b, 2)[1])) <= {0, 3}
+
+
+def test_materialize_batch_indexes_empty_specs(
+    archive_dataspec, sample_archive_revisits, fake_fill, tmp_path, monkeypatch
+):
+    from eoflow.models import catalogue
+
+    cfg = archive_dataspec
+    monkeypatch.setattr(batch, "fill_shared", shared_fill(fake_fill, []))
+
+    revisits = pd.DataFrame([r.model_dump() for r in sample_archive_revisits])
+    empty = [str(tmp_path / "empty")]
+    monkeypatch.setattr(
+        catalogue,
+        "get_revisits",
+        lambda tiles, spec: (
+            revisits.iloc[:0] if spec.dataset_store in empty else revisits
+        ),
+    )
+
+    specs = [
+        cfg.model_copy(update={"dataset_store": str(tmp_path / "empty")}),
+        cfg.model_copy(update={"dataset_store": str(tmp_path / "a")}),
+    ]
+    batch.materialize_batch(specs)
+
+    # a dataspec without revisits still gets its (empty) index
+    assert read_index(str(tmp_path / "empty" / "index.parquet")).num_rows == 0
+    assert read_index(str(tmp_path / "a" / "index.parquet")).num_rows > 0
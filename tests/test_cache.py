@@ -0,0 +1,41 @@
+def test_composite_cache_reused_across_runs(
+    sample_archive, fake_fill, read_chip, tmp_path
+):
+    def make(**update):
+        return sample_archive(cache_store=str(tmp_path / "cache"), **update)
+
+    # a first run composites from the data and fills the cache
+    first = make(dataset_store=str(tmp_path / "run-1"))
+    assert first.uncached_blocks() == len(first.chips.blocks())
+    fake_fill(first)
+    # the bands' nodata footprints differ in the latest revisit
+    for ii in range(len(first.chips)):
+        rows, cols = first.chips.window(ii)
+        first.z[-1, 0, rows, cols.start : cols.start + 128] = 0
+        first.z[-1, 1, rows, cols.start + 128 : cols.stop] = 0
+    first.mask()
+    first_index = first.materialize()
+
+    # a later run with a subset of the bands needs no data at all
+    second = make(dataset_store=str(tmp_path / "run-2"), bands=["B09"])
+    assert second.uncached_blocks() == 0
+    second.z = None
+    second_index = second.materialize()
+
+    assert len(second_index.chips) == len(first_index.chips)
+    for a, b in zip(first_index.chips, second_index.chips):
+        assert (read_chip(a, 2)[1] == read_chip(b, 1)[0]).all()
+
+    # and matches what a fresh, uncached run of just that band composites
+    fresh = sample_archive(dataset_store=str(tmp_path / "run-3"), bands=["B09"])
+    fresh.z = fake_fill.open((len(fresh.revisits), 1, *first.z.shape[-2:]), "b09.zarr")
+    for ii in range(len(fresh.chips)):
+        window = fresh.chips.window(ii)
+        fresh.z[(slice(None), 0, *window)] = first.z[(slice(None), 1, *window)]
+    fresh.mask()
+    fresh_index = fresh.materialize()
+    for a, b in zip(second_index.chips, fresh_index.chips):
+        assert (read_chip(a, 1) == read_chip(b, 1)).all()
+
+    # a different composite method is a different artifact
+    assert make(composite="FIRST").uncached_blocks() == len(first.chips.blocks())
@@ -0,0 +1,78 @@
+import io
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import geopandas as gpd
+import pytest
+
+from eoflow.core.tiling import tiles_for_geometries
+from eoflow.models.catalogue import get_tiles, get_tiles_remote
+
+
+class StandInCatalogue(BaseHTTPRequestHandler):
+    """a local /mgrs-tiles service answering from the local mgrs tile index"""
+
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        part = next(BytesParser(policy=default).parsebytes(head + body).iter_parts())
+        gdf = gpd.read_parquet(io.BytesIO(part.get_payload(decode=True)))
+
+        server = self.server
+        with server.lock:
+            server.clients.add(self.client_address)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        time.sleep(0.05)
+        with server.lock:
+            server.active -= 1
+
+        tiles = tiles_for_geometries(gdf.geometry.values)
+        payload = json.dumps({"tiles": [{"tile": t} for t in tiles]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """records the client connections and the peak of concurrent requests"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.active = self.peak = 0
+
+
+@pytest.fixture
+def catalogue(monkeypatch):
+    server = StandInServer(("127.0.0.1", 0), StandInCatalogue)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv("CATALOGUE_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("CATALOGUE_BATCH", "1")
+    monkeypatch.setenv("CATALOGUE_WORKERS", "4")
+    yield server
+    server.shutdown()
+
+
+def test_get_tiles_remote(catalogue, sample_dataspec):
+    tiles = get_tiles_remote(sample_dataspec)
+
+    # one batch per park, deduplicated to the same tiles as the local index
+    ids = [t.tile for t in tiles]
+    assert len(ids) == len(set(ids))
+    assert sorted(ids) == [t.tile for t in get_tiles(sample_dataspec)]
+    assert catalogue.peak > 1
+    assert len(catalogue.clients) <= 4
@@ -0,0 +1,245 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from eoflow.core.chips import ChipTable, iter_aoi_chips, sample_chips
+from eoflow.core.composite import composite_pixels
+from eoflow.core.resize import imresize
+from eoflow.models import Archive, DataSpec, Tile
+from eoflow.models import granule as granule_module
+from eoflow.models.granule import GCPS2Granule
+
+
+def test_composite_pixels():
+    arr = np.arange(1, 4, dtype=np.uint16)[:, None, None, None] * np.ones(
+        (3, 2, 4, 4), dtype=np.uint16
+    )
+    valid = np.ones((3, 4, 4), dtype=bool)
+    valid[2, 0, 0] = False  # most recent revisit invalid
+    valid[:, 1, 1] = False  # no valid revisit
+
+    first = composite_pixels(arr, valid, "FIRST")
+    last = composite_pixels(arr, valid, "LAST")
+
+    assert first.shape == (2, 4, 4)
+    assert (first[:, 0, 0] == 1).all()
+    assert (last[:, 0, 0] == 2).all()
+    assert (last[:, 0, 1] == 3).all()
+    assert (first[:, 1, 1] == 0).all() and (last[:, 1, 1] == 0).all()
+
+
+def test_strided_chips(sample_dataspec, sample_archive_tile, sample_archive_revisits):
+    """overlapping chips tile the same ground as the non-overlapping chips"""
+
+    archive = Archive(
+        cfg=sample_dataspec,
+        tile=sample_archive_tile,
+        revisits=sample_archive_revisits,
+    )
+
+    strided = Archive(
+        cfg=sample_dataspec.model_copy(update={"chip_stride": 128}),
+        tile=sample_archive_tile,
+        revisits=sample_archive_revisits,
+    )
+
+    assert len(strided.chips) > len(archive.chips)
+    assert set(archive.chips.regions).issubset(strided.chips.regions)
+    assert {tuple(b) for b in archive.chips.blocks()}.issubset(
+        {tuple(b) for b in strided.chips.blocks()}
+    )
+
+
+def test_chip_stride_validation():
+    with pytest.raises(ValueError):
+        DataSpec(
+            target_geofile="tests/data/parks.geojson",
+            dataset_store="tests/data/local_store",
+            chipsize=256,
+            chip_stride=512,
+        )
+
+
+def test_region_targets_match_chip_targets(
+    sample_dataspec, sample_archive_tile, sample_archive_revisits
+):
+    """burning targets once per region gives the same chips as burning per chip"""
+
+    archive = Archive(
+        cfg=sample_dataspec.model_copy(update={"chip_stride": 128}),
+        tile=sample_archive_tile,
+        revisits=sample_archive_revisits,
+    )
+
+    for chips in archive.chips.groupby_region():
+        region = archive._burn_region(chips)
+        row0, col0, _, _ = chips.extent
+        for kk in range(len(chips)):
+            assert (
+                region[chips.window(kk, (row0, col0))]
+                == archive._burn_target(chips, kk)
+            ).all()
+
+
+def test_chip_grid_is_chunk_aligned():
+    """chips cover every geometry and each one sits in exactly one chunk"""
+
+    geometries = shapely.buffer(
+        shapely.points(np.random.default_rng(0).uniform(5000, 100000, (500, 2))), 50
+    )
+    chips = ChipTable.from_geometries(
+        geometries, chipsize=256, stride=256, minx=0, maxy=109800
+    )
+
+    assert (chips.rows % 256 == 0).all() and (chips.cols % 256 == 0).all()
+    assert len(chips.blocks()) == len(chips)
+    assert shapely.covers(shapely.union_all(chips.geometry), geometries).all()
+    assert len(chips) == len(np.unique(chips.regions))
+
+    # no chip is kept without a geometry in it
+    assert len(
+        np.unique(
+            shapely.STRtree(geometries).query(chips.geometry, predicate="intersects")[0]
+        )
+    ) == len(chips)
+
+
+def test_aoi_chips_stream_in_batches():
+    """streamed aoi chips match the full grid, in bounded batches with running ids"""
+
+    aoi = shapely.buffer(shapely.Point(50000, 50000), 20000)
+    batches = list(
+        iter_aoi_chips(aoi, chipsize=256, stride=128, minx=0, maxy=109800, batch=500)
+    )
+    reference = ChipTable.from_geometries(
+        np.array([aoi]), chipsize=256, stride=128, minx=0, maxy=109800
+    )
+
+    assert all(len(b) == 500 for b in batches[:-1]) and 0 < len(batches[-1]) <= 500
+    ids = np.concatenate([b.ids for b in batches])
+    assert (ids == np.arange(len(reference))).all()
+
+    streamed = {(r, c) for b in batches for r, c in zip(b.rows, b.cols)}
+    assert streamed == set(zip(reference.rows, reference.cols))
+
+
+def test_overlapping_tiles_share_chips(sample_dataspec, sample_archive_revisits):
+    """chips in the overlap of two tiles are only materialized by one of them"""
+
+    tiles = ["30UXC", "30UYC"]
+    archives = [
+        Archive(
+            cfg=sample_dataspec,
+            tile=Tile(tile=tile),
+            revisits=sample_archive_revisits,
+            tiles=tiles,
+        )
+        for tile in tiles
+    ]
+    full = [
+        Archive(
+            cfg=sample_dataspec, tile=Tile(tile=tile), revisits=sample_archive_revisits
+        )
+        for tile in tiles
+    ]
+
+    assert sum(a.duplicate_chips for a in archives) > 0
+    for archive, reference in zip(archives, full):
+        assert len(archive.chips) + archive.duplicate_chips == len(reference.chips)
+
+    # the kept chips still cover every target
+    coverage = shapely.union_all(
+        [
+            gpd.GeoSeries(a.chips.geometry, crs=a.tile.utm_crs).to_crs(4326).union_all()
+            for a in archives
+        ]
+    )
+    targets = gpd.read_file(sample_dataspec.target_geofile)
+    assert shapely.covers(shapely.buffer(coverage, 1e-9), targets.geometry.values).all()
+
+
+def test_sample_chips_stratified():
+    chips = ChipTable(np.arange(100) * 256, np.zeros(100), 256, 0, 109800)
+    coverage = np.where(np.arange(100) < 80, 0, np.linspace(0, 1, 100))
+
+    sample = sample_chips(chips, 12, coverage, strata=4, seed=1)
+    assert len(sample) == 12
+    assert (sample.ids == sample_chips(chips, 12, coverage, strata=4, seed=1).ids).all()
+    # a quarter from the chips without targets, though they are most of the tile
+    assert (coverage[sample.ids] == 0).sum() == 3
+
+    assert len(sample_chips(chips, 200, coverage)) == 100
+
+
+def test_preview_samples_chips(
+    sample_dataspec, sample_archive_tile, sample_archive_revisits
+):
+    full = Archive(
+        cfg=sample_dataspec, tile=sample_archive_tile, revisits=sample_archive_revisits
+    )
+    preview = Archive(
+        cfg=sample_dataspec.model_copy(update={"preview": 5}),
+        tile=sample_archive_tile,
+        revisits=sample_archive_revisits,
+    )
+
+    assert len(preview.chips) == min(5, len(full.chips))
+    assert set(preview.chips.ids) <= set(full.chips.ids)
+
+
+def test_granule_windows_match_whole_band(monkeypatch):
+    # a small stand-in tile, so the whole band can be upsampled for comparison
+    monkeypatch.setattr(granule_module, "TILE_PX", 1200)
+    rng = np.random.default_rng(0)
+    source = rng.integers(1, 4000, (200, 200)).astype(np.uint16)
+    monkeypatch.setattr(
+        GCPS2Granule,
+        "_read_band_windows",
+        lambda self, band, windows: [source[w.toslices()] for w in windows],
+    )
+
+    granule = GCPS2Granule(
+        "30UXC", "granule", "S2A_MSIL2A_20240610T110621", ["B01"], "bicubic"
+    )
+    whole = imresize(source, 6, kernel="bicubic")
+    windows = [
+        (slice(0, 256), slice(0, 256)),
+        (slice(512, 768), slice(300, 556)),
+        (slice(1024, 1200), slice(1024, 1200)),
+    ]
+    for (rows, cols), arr in zip(windows, granule.read_windows("B01", windows)):
+        assert np.allclose(arr, whole[rows, cols])
+
+
+def test_preview_fill_reads_windows(sample_archive, monkeypatch, tmp_path):
+    read = []
+
+    def read_band_windows(self, band, windows):
+        read.extend((band, w.height * w.width) for w in windows)
+        return [np.full((w.height, w.width), 1000, np.uint16) for w in windows]
+
+    def read_one_band(self, block_id):
+        raise AssertionError("a preview reads no whole bands")
+
+    monkeypatch.setattr(GCPS2Granule, "_read_band_windows", read_band_windows)
+    monkeypatch.setattr(GCPS2Granule, "_read_one_band", read_one_band)
+
+    archive = sample_archive(preview=5)
+    monkeypatch.chdir(tmp_path)
+    archive.fill()
+
+    # each band of each revisit reads far less than the whole band
+    for band in archive.cfg.bands:
+        pixels = sum(n for b, n in read if b == band) / len(archive.revisits)
+        factor = granule_module.UPSAMPLE_FACTOR[granule_module.S2_BAND_RESOLUTION[band]]
+        assert 0 < pixels < (10980 // factor) ** 2 / 10
+
+    # and only the sampled chips' blocks are stored
+    cs = archive.cfg.chipsize
+    for bi, bj in archive.chips.blocks():
+        block = archive.z[:, :, bi * cs : (bi + 1) * cs, bj * cs : (bj + 1) * cs]
+        assert (block >= 999).all()
+    assert archive.z.nchunks_initialized == (
+        len(archive.chips.blocks()) * len(archive.revisits) * len(archive.cfg.bands)
+    )
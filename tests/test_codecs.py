@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from eoflow.core.codecs import CodecEnum, benchmark_codecs, compress, decompress
+
+
+@pytest.fixture
+def sample_chip():
+    rng = np.random.default_rng(0)
+    return (1000 + rng.normal(0, 20, (3, 64, 64))).astype(np.uint16)
+
+
+@pytest.mark.parametrize("codec", list(CodecEnum))
+def test_codec_roundtrip(sample_chip, codec):
+    buffer = compress(sample_chip[:, 8:40, 8:40].copy(), codec)
+    chip = np.frombuffer(decompress(buffer, codec, np.uint16), dtype=np.uint16)
+
+    assert (chip.reshape(3, 32, 32) == sample_chip[:, 8:40, 8:40]).all()
+
+    target = np.frombuffer(b"\x00\xff" * 100, dtype=np.uint8)
+    assert decompress(compress(target, codec), codec) == target.tobytes()
+
+
+def test_codec_compresses(sample_chip):
+    for row in benchmark_codecs(sample_chip[None], levels=(3,), repeat=1):
+        assert row["ratio"] > 1.2 or row["codec"] == "none"
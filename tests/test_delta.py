@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from eoflow.core.composite import composite_times, merge_composites
+
+
+def test_merge_composites():
+    valid = np.array([[[True, False]], [[False, False]]])
+    times = composite_times(valid, np.array([10, 20]), "LAST")
+    assert times.tolist() == [[10, 0]]
+
+    prev = np.array([[[1, 2]]], dtype=np.uint16)
+    new = np.array([[[3, 4]]], dtype=np.uint16)
+    for method, expected in (("LAST", [[3, 2]]), ("FIRST", [[1, 2]])):
+        merged, merged_times, changed = merge_composites(
+            prev, np.array([[5, 5]]), new, times, method
+        )
+        assert merged[0].tolist() == expected
+        assert changed.any() == (method == "LAST")
+
+
+def test_delta_materialization(
+    sample_archive, sample_archive_revisits, fake_fill, read_chip, tmp_path
+):
+    revisits = sorted(sample_archive_revisits, key=lambda r: r.sensing_time)
+
+    def make(revisits, **update):
+        return sample_archive(revisits, composite_state=True, chip_batch=1, **update)
+
+    # a first run composites all but the latest revisit
+    first = make(revisits[:-1], dataset_store=str(tmp_path / "run-1"))
+    fake_fill(first, value=1000)
+    first.mask()
+    first_index = first.materialize()
+
+    # the next run fetches only the new revisit, which has data for one chip
+    second = make(
+        revisits,
+        dataset_store=str(tmp_path / "run-2"),
+        previous_store=str(tmp_path / "run-1"),
+    )
+    assert [r.granule_id for r in second.revisits] == [revisits[-1].granule_id]
+    fake_fill(second, value=2000, chips=[0])
+    second_index = second.materialize()
+
+    assert len(second_index.chips) == len(first_index.chips)
+    updated, *kept = second_index.chips
+    assert (read_chip(updated, 2) == 2000).all()
+    assert updated.chip_path.startswith(str(tmp_path / "run-2"))
+    assert updated.time_end == revisits[-1].sensing_time
+    for chip in kept:
+        assert chip.chip_path.startswith(str(tmp_path / "run-1"))
+        assert (read_chip(chip, 2) == 1000).all()
+    # a third run extends the second, reusing chips stored by either
+    third = make(
+        revisits,
+        dataset_store=str(tmp_path / "run-3"),
+        previous_store=str(tmp_path / "run-2"),
+    )
+    assert third.revisits == []
+    third_index = third.materialize()
+    assert [c.chip_path for c in third_index.chips] == [
+        c.chip_path for c in second_index.chips
+    ]
+
+    with pytest.raises(ValueError):
+        make(revisits, previous_store=str(tmp_path / "run-2"), composite="FIRST")
@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pyarrow.compute as pc
+import pytest
+import shapely
+
+from eoflow.core.index import (
+    index_metadata,
+    merge_index_files,
+    read_index,
+    read_index_metadata,
+    write_index,
+)
+from eoflow.core.query import ChipQuery
+from eoflow.models import ArchiveIndex
+
+
+def sample_index(
+    tile: str,
+    n: int,
+    pxcount: dict,
+    duplicate_chips: int = 0,
+    lon: float = 0.0,
+    year: int = 2024,
+):
+    return ArchiveIndex(
+        tile=tile,
+        duplicate_chips=duplicate_chips,
+        chips=[
+            {
+                "tile": tile,
+                "chip_ii": ii,
+                "chip_idx": f"{tile}-{ii}",
+                "chip_path": f"chips/{tile}-00000.shard",
+                "chip_offset": ii * 100,
+                "chip_nbytes": 100,
+                "chip_stats": {"mean": [ii, 2.0 * ii], "std": [1.0, 2.0]},
+                "target_path": f"targets/{tile}-00000.shard",
+                "target_pxcount": pxcount,
+                "chip_crs": "EPSG:32630",
+                "chip_bounds": [ii * 10.0, 0.0, ii * 10.0 + 10, 10.0],
+                "chip_bounds_wgs": [lon + ii, 50.0, lon + ii + 0.5, 50.5],
+                "time_start": datetime(year, 6, 1, tzinfo=timezone.utc),
+                "time_end": datetime(year, 8, 1, tzinfo=timezone.utc),
+            }
+            for ii in range(n)
+        ],
+    )
+
+
+@pytest.fixture
+def sample_indices():
+    return [
+        sample_index("30UXC", 4, {0: 10, 255: 6}, duplicate_chips=2),
+        sample_index("30UYC", 3, {0: 16}, duplicate_chips=1, lon=10.0, year=2023),
+    ]
+
+
+def test_index_table(sample_indices, tmp_path):
+    table = sample_indices[0].to_table(["B02", "B03"])
+
+    assert table["mean_B03"].to_pylist() == [0.0, 2.0, 4.0, 6.0]
+    assert table["px_255"].to_pylist() == [6] * 4
+    assert table["chip_offset"].to_pylist() == [0, 100, 200, 300]
+    assert index_metadata(table.schema)["duplicate_chips"] == 2
+
+    write_index(table, str(tmp_path / "30UXC-index.parquet"))
+    assert (
+        read_index(str(tmp_path / "30UXC-index.parquet"))
+        .cast(table.schema)
+        .equals(table)
+    )
+
+
+def test_merge_index_files(sample_indices, tmp_path):
+    paths = []
+    for index in sample_indices:
+        paths.append(str(tmp_path / f"{index.tile}-index.parquet"))
+        write_index(index.to_table(["B02", "B03"]), paths[-1])
+
+    metadata = merge_index_files(paths, str(tmp_path / "index.parquet"), workers=1)
+    merged = read_index(str(tmp_path / "index.parquet"))
+
+    assert len(merged) == 7 and metadata["n_chips"] == 7
+    assert metadata["duplicate_chips"] == 3
+    assert read_index_metadata(str(tmp_path / "index.parquet")) == metadata
+    assert merged["px_255"].to_pylist() == [6] * 4 + [0] * 3  # missing classes are 0
+
+    means = np.array([[ii, 2.0 * ii] for ii in [0, 1, 2, 3, 0, 1, 2]]).mean(axis=0)
+    assert np.allclose(metadata["chip_stats"]["mean"], means)
+
+    # filters are pushed down to the file
+    positives = read_index(
+        str(tmp_path / "index.parquet"),
+        columns=["chip_idx"],
+        filters=[("px_255", ">", 0)],
+    )
+    assert pc.all(pc.starts_with(positives["chip_idx"], "30UXC")).as_py()
+
+
+def test_chip_query(sample_indices, tmp_path):
+    paths = []
+    for index in sample_indices:
+        paths.append(str(tmp_path / f"{index.tile}-index.parquet"))
+        write_index(index.to_table(["B02", "B03"]), paths[-1])
+    merge_index_files(paths, str(tmp_path / "index.parquet"))
+
+    chips = ChipQuery.from_index(str(tmp_path / "index.parquet"))
+
+    def query(**criteria):
+        return chips.query(columns=["chip_idx"], **criteria)["chip_idx"].to_pylist()
+
+    assert query(geometry=(1.2, 50.1, 2.2, 50.2)) == ["30UXC-1", "30UXC-2"]
+    assert query(geometry=shapely.Point(11.2, 50.2)) == ["30UYC-1"]
+    assert query(tiles=["30UYC"]) == ["30UYC-0", "30UYC-1", "30UYC-2"]
+    assert len(query(min_pxcount={255: 1})) == 4
+    assert query(min_pxcount={7: 1}) == []
+    assert query(start=datetime(2024, 1, 1)) == query(tiles=["30UXC"])
+    assert query(end=datetime(2023, 7, 1), geometry=(0, 0, 10.9, 90)) == ["30UYC-0"]
+    assert chips.query(tiles=["30UXC"])["minx"].to_pylist() == [0, 10, 20, 30]
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from eoflow.loader import ChipLoader
+
+
+def test_loader_batches_and_normalizes(sample_dataset, read_chip):
+    cfg, index = sample_dataset()
+    loader = ChipLoader.from_store(cfg.dataset_store, batch_size=5)
+
+    batches = list(loader)
+    assert len(batches) == len(loader) == -(-len(index.chips) // 5)
+
+    chips, targets = batches[0]
+    assert chips.shape == (5, 2, 256, 256) and chips.dtype == np.float32
+    assert chips.flags["C_CONTIGUOUS"]
+    assert targets.shape == (5, 256, 256) and targets.dtype == np.uint8
+
+    mean = np.array(index.chip_stats.mean)[:, None, None]
+    sd = np.array(index.chip_stats.std)[:, None, None]
+    expected = (read_chip(index.chips[0], 2) - mean) / sd
+    assert np.allclose(chips[0], expected, atol=1e-4)
+    assert set(np.unique(targets).tolist()) <= {0, 255}
+    # uncompressed local chips are views of the mapped shard
+    assert np.shares_memory(loader.read_chip(0), loader._maps[index.chips[0].chip_path])
+    assert (targets.reshape(-1) == 255).sum() == sum(
+        chip.target_pxcount.get(255, 0) for chip in index.chips[:5]
+    )
+
+
+@pytest.mark.parametrize(
+    "update", [{"codec": "zstd", "chip_dtype": "uint8"}, {"shard_chips": False}]
+)
+def test_loader_reads_every_layout(sample_dataset, update):
+    cfg, index = sample_dataset(**update)
+    loader = ChipLoader.from_index(index, cfg, batch_size=4, normalize=False)
+
+    raw = np.concatenate([chips for chips, _ in loader])
+    assert len(raw) == len(index.chips)
+    assert raw.dtype == loader.read_chip(0).dtype
+
+
+def test_loader_outputs_and_shuffle(sample_dataset):
+    cfg, index = sample_dataset(loader_output="dict")
+    loader = ChipLoader.from_index(index, cfg, batch_size=3, shuffle=True)
+
+    first = [c for batch in loader for c in batch["chip_idx"]]
+    second = [c for batch in loader for c in batch["chip_idx"]]
+    assert sorted(first) == sorted(second) == sorted(c.chip_idx for c in index.chips)
+    assert first != second  # reshuffled every epoch
+
+    loader.cfg = cfg.model_copy(update={"loader_output": "xarray"})
+    ds = next(iter(loader))
+    assert ds["chips"].dims == ("chip", "band", "y", "x")
+    assert ds["band"].values.tolist() == ["B01", "B09"]
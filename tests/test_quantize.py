@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from eoflow.core.quantize import ChipDtypeEnum, Quantization, dequantize, quantize
+from eoflow.models import DataSpec
+
+
+@pytest.fixture
+def sample_reflectance():
+    return np.random.default_rng(0).integers(0, 6000, (3, 64, 64)).astype(np.uint16)
+
+
+@pytest.mark.parametrize(
+    "dtype, itemsize, tol",
+    [
+        (ChipDtypeEnum.UINT8, 1, 0.5 / 255),
+        (ChipDtypeEnum.UINT16_SCALED, 2, 0.5 / 65535),
+        (ChipDtypeEnum.FLOAT16, 2, 1e-3),
+    ],
+)
+def test_quantize_inverts(sample_reflectance, dtype, itemsize, tol):
+    stored, quantization = quantize(sample_reflectance, dtype, (0, 4000), (-1, 1))
+    expected = np.clip(sample_reflectance, 0, 4000) / 4000 * 2 - 1
+
+    assert stored.dtype.itemsize == itemsize
+    assert stored.dtype == quantization.numpy_dtype
+    assert np.abs(dequantize(stored, quantization) - expected).max() <= tol * 2 + 1e-6
+
+    # the quantization survives a roundtrip through the index
+    assert Quantization(**quantization.model_dump()) == quantization
+
+
+def test_quantize_raw_passthrough(sample_reflectance):
+    stored, quantization = quantize(
+        sample_reflectance, ChipDtypeEnum.UINT16, (0, 4000), (0, 1)
+    )
+
+    assert (stored == sample_reflectance).all()
+    assert (dequantize(stored, quantization) == sample_reflectance).all()
+
+
+def test_clip_validation():
+    with pytest.raises(ValueError):
+        DataSpec(
+            target_geofile="tests/data/parks.geojson",
+            dataset_store="tests/data/local_store",
+            clip=[4000, 0],
+        )
@@ -0,0 +1,95 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+
+from eoflow.core.revisits import RevisitIndex, _conform, _utc
+from eoflow.models import S2IndexDF, Tile, catalogue
+from eoflow.models.catalogue import get_revisits
+
+
+def sample_index(tiles, start, end):
+    """an offline stand-in for the BigQuery index"""
+
+    df = pd.DataFrame(json.load(open("./tests/data/sample_index_items.json")))
+    df["sensing_time"] = pd.to_datetime(df["sensing_time"].str.replace(" UTC", ""))
+    df["sensing_time"] = df["sensing_time"].dt.tz_localize("UTC")
+    df = df[
+        df["mgrs_tile"].isin(tiles)
+        & (df["sensing_time"] > start)
+        & (df["sensing_time"] <= end)
+    ]
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def test_revisit_index_refreshes_incrementally(tmp_path):
+    calls = []
+
+    def fetch(tiles, start, end):
+        calls.append((sorted(tiles), start, end))
+        return sample_index(tiles, start, end)
+
+    index = RevisitIndex(str(tmp_path / "revisits"), fetch=fetch)
+    tiles = ["30UXC", "30UYC"]
+
+    first = index.revisits(tiles, "2024-10-01", "2024-10-06")
+    assert len(calls) == 1 and len(first) == 2
+    assert (tmp_path / "revisits" / "mgrs_tile=30UXC" / "revisits.parquet").exists()
+
+    # a window the cache covers is answered without fetching
+    again = index.revisits(tiles, "2024-10-02", "2024-10-06")
+    assert len(calls) == 1 and again.equals(first)
+
+    # a later window fetches only the new days, plus the lookback margin
+    later = index.revisits(tiles, "2024-10-01", "2024-11-01")
+    assert len(calls) == 2
+    assert str(calls[1][1].date()) == "2024-10-03" and len(later) == 5
+    assert later["granule_id"].to_pylist().count(first["granule_id"][0].as_py()) == 1
+
+    # an earlier window backfills up to the cached interval
+    index.revisits(["30UXC"], "2024-09-01", "2024-10-06")
+    assert [str(t.date()) for t in calls[2][1:]] == ["2024-09-01", "2024-10-01"]
+    assert str(index.coverage("30UXC")[0].date()) == "2024-09-01"
+
+
+def test_get_revisits_from_cache(sample_dataspec, tmp_path):
+    index = RevisitIndex(str(tmp_path / "revisits"), fetch=sample_index)
+    index.refresh(["30UXC"], "2024-01-01", "2024-12-31")
+
+    cfg = sample_dataspec.model_copy(
+        update={
+            "revisit_index": str(tmp_path / "revisits"),
+            "start_datetime": "2024-06-01",
+            "end_datetime": "2024-12-31",
+        }
+    )
+    df = get_revisits([Tile(tile="30UXC")], cfg)
+    S2IndexDF.validate(df)
+    assert len(df) == 3 and set(df["mgrs_tile"]) == {"30UXC"}
+
+
+def test_get_revisits_backends_agree(sample_dataspec, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        catalogue,
+        "query_bigquery",
+        lambda tiles, start, end: _conform(sample_index(tiles, _utc(start), _utc(end))),
+    )
+    tiles = [Tile(tile="30UXC"), Tile(tile="30UYC")]
+    cfg = sample_dataspec.model_copy(
+        update={"start_datetime": "2024-01-01", "end_datetime": "2024-12-31"}
+    )
+
+    queried = get_revisits(tiles, cfg)
+    RevisitIndex(str(tmp_path / "revisits"), fetch=sample_index).refresh(
+        [t.tile for t in tiles], "2024-01-01", "2024-12-31"
+    )
+    cached = get_revisits(
+        tiles, cfg.model_copy(update={"revisit_index": str(tmp_path / "revisits")})
+    )
+
+    # every revisit in the window, from either backend
+    assert len(queried) > 3
+    key = ["granule_id"]
+    assert queried.sort_values(key, ignore_index=True).equals(
+        cached.sort_values(key, ignore_index=True)
+    )
@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from eoflow.core.shards import (
+    ShardWriter,
+    read_range,
+    read_shard_index,
+    read_shard_item,
+)
+
+
+def test_shard_roundtrip(tmp_path):
+    rng = np.random.default_rng(0)
+    payloads = {ii: rng.bytes(int(rng.integers(1, 4096))) for ii in range(100)}
+
+    shard = ShardWriter(str(tmp_path / "chips.shard"))
+    with ThreadPoolExecutor(4) as pool:
+        ranges = dict(
+            zip(payloads, pool.map(lambda ii: shard.add(ii, payloads[ii]), payloads))
+        )
+    shard.close()
+
+    assert len(shard) == len(payloads)
+    assert read_shard_index(shard.path) == ranges
+    for ii, (offset, nbytes) in ranges.items():
+        assert read_range(shard.path, offset, nbytes) == payloads[ii]
+    assert read_shard_item(shard.path, 42) == payloads[42]
+
+
+def test_read_range_whole_object(tmp_path):
+    pth = tmp_path / "chip.npy"
+    pth.write_bytes(b"abcdef")
+
+    assert read_range(str(pth)) == b"abcdef"
+    assert read_range(str(pth), 2, 3) == b"cde"
+    with pytest.raises(ValueError):
+        read_shard_index(str(pth))
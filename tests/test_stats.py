@@ -0,0 +1,99 @@
+import numpy as np
+
+from eoflow.core.stats import histogram, merge_moments, moments, percentiles, std
+from eoflow.models import Archive, ArchiveIndex
+
+
+def test_merge_moments_exact():
+    rng = np.random.default_rng(0)
+    parts = [
+        rng.normal(loc, scale, (3, 16, n))
+        for loc, scale, n in [(0, 1, 4), (100, 5, 16), (-3, 0.1, 1)]
+    ]
+    parts[0][1, 0, 0] = np.nan  # dropped, like nodata
+
+    count, mean, m2 = merge_moments(*(np.stack(m) for m in zip(*map(moments, parts))))
+    pixels = np.concatenate([p.reshape(3, -1) for p in parts], axis=1)
+
+    assert (count == np.isfinite(pixels).sum(axis=1)).all()
+    assert np.allclose(mean, np.nanmean(pixels, axis=1))
+    assert np.allclose(std(count, m2), np.nanstd(pixels, axis=1))
+
+
+def test_histogram_percentiles():
+    data = np.stack([np.linspace(0, 4000, 10001), np.full(10001, 500.0)])[:, None]
+    hist = histogram(data, (0, 4000), 400)
+
+    assert hist.shape == (2, 400) and (hist.sum(axis=1) == 10001).all()
+    assert histogram(np.array([[[-5.0, 1e9]]]), (0, 10), 10)[0, [0, -1]].tolist() == [
+        1,
+        1,
+    ]
+
+    p = percentiles(hist, (0, 4000), [2, 50, 98])
+    assert np.allclose(p[0], [80, 2000, 3920], atol=10)
+    assert np.allclose(p[1], 500, atol=10)
+
+
+def test_merge_archive_indices_pools_over_chips():
+    """dataset stats are per band, pooled over chips"""
+
+    def chip(ii, mean, std, count):
+        return {
+            "tile": "30UXC",
+            "chip_ii": ii,
+            "chip_idx": f"30UXC-{ii}",
+            "chip_path": "",
+            "target_path": "",
+            "target_pxcount": {},
+            "chip_stats": {"mean": mean, "std": std, "count": count},
+        }
+
+    index = ArchiveIndex(
+        tile="30UXC",
+        chips=[
+            chip(0, [0.0, 10.0], [1.0, 0.0], [4, 4]),
+            chip(1, [2.0, 10.0], [1.0, 0.0], [4, 4]),
+        ],
+        histogram=[[1, 2], [3, 4]],
+        hist_range=[0, 1],
+    )
+    merged = Archive.merge_archive_indices([index, index])
+
+    assert np.allclose(merged.chip_stats.mean, [1.0, 10.0])
+    assert np.allclose(merged.chip_stats.std, [np.sqrt(2.0), 0.0])
+    assert merged.chip_stats.count == [16, 16]
+    assert merged.histogram == [[2, 4], [6, 8]]
+
+    # no chips left, e.g. all owned by overlapping tiles
+    empty = Archive.merge_archive_indices([ArchiveIndex(tile="30UXC", chips=[])])
+    assert empty.chips == [] and empty.chip_stats.mean == []
+
+
+def test_moments_skip_invalid_pixels():
+    data = np.array([[[0.0, 2.0], [4.0, 0.0]]])
+    valid = np.array([[False, True], [True, False]])
+
+    count, mean, m2 = moments(data, valid)
+    assert count.tolist() == [2] and mean.tolist() == [3.0]
+    assert np.allclose(std(count, m2), 1.0)
+    assert histogram(data, (0, 4), 4, valid).tolist() == [[0, 0, 1, 1]]
+
+
+def test_chip_stats_exclude_nodata(sample_dataset):
+    """the composite fills nodata with 0, which must not count as a pixel value"""
+
+    cfg, index = sample_dataset(chip_dtype="uint8", rescale=[0.5, 1.0])
+    full = index.chips[0].chip_stats
+
+    cfg, index = sample_dataset(chip_dtype="uint8", rescale=[0.5, 1.0], nodata=True)
+    half = index.chips[0].chip_stats
+
+    assert half.count == [256 * 128] * 2 and full.count == [256 * 256] * 2
+    # nodata would dequantize to rescale[0] = 0.5 and pull the mean towards it
+    assert np.allclose(half.mean, full.mean, atol=0.01)
+    assert (
+        np.asarray(index.histogram).sum(axis=1).tolist()
+        == [256 * 128 * len(index.chips)] * 2
+    )
+    assert np.allclose(index.chip_stats.mean, half.mean, atol=0.01)
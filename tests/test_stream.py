@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from eoflow.loader import ChipLoader, ShardStream, stream
+
+
+@pytest.mark.parametrize("update", [{}, {"codec": "lz4", "shard_chips": False}])
+def test_stream_matches_loader(sample_dataset, update):
+    cfg, index = sample_dataset(chip_batch=4, loader_output="dict", **update)
+    loader = ChipLoader.from_index(index, cfg, batch_size=64)
+    stream = ShardStream.from_index(
+        index, cfg, batch_size=3, shuffle=True, shuffle_buffer=5, chunk_bytes=300_000
+    )
+
+    reference = next(iter(loader))
+    expected = dict(zip(reference["chip_idx"], range(len(index.chips))))
+
+    batches = list(stream)
+    assert len(batches) == len(stream)
+    seen = [c for batch in batches for c in batch["chip_idx"]]
+    assert sorted(seen) == sorted(expected)
+
+    for batch in batches:
+        for kk, chip_idx in enumerate(batch["chip_idx"]):
+            ii = expected[chip_idx]
+            assert np.array_equal(batch["chips"][kk], reference["chips"][ii])
+            assert np.array_equal(batch["targets"][kk], reference["targets"][ii])
+
+    # shard order and buffer mixing change every epoch
+    assert [c for batch in stream for c in batch["chip_idx"]] != seen
+
+
+def test_stream_shards_across_ranks(sample_dataset):
+    cfg, index = sample_dataset(chip_batch=2, loader_output="dict")
+
+    def epoch(rank):
+        stream = ShardStream.from_index(
+            index, cfg, batch_size=4, shuffle=True, rank=rank, world_size=2
+        )
+        return [c for batch in stream for c in batch["chip_idx"]]
+
+    ranks = [epoch(0), epoch(1)]
+    assert ranks[0] and ranks[1] and not set(ranks[0]) & set(ranks[1])
+    assert sorted(ranks[0] + ranks[1]) == sorted(c.chip_idx for c in index.chips)
+    assert epoch(0) == ranks[0]  # deterministic for a given seed and epoch
+
+
+@pytest.mark.parametrize("drop_last", [False, True])
+def test_stream_ranks_get_equal_chips(sample_dataset, monkeypatch, drop_last):
+    cfg, index = sample_dataset(chip_batch=3, loader_output="dict")
+    n = len(index.chips)
+    world_size = 5
+    assert n % world_size  # an uneven split
+
+    def epoch(rank, worker=0, n_workers=1):
+        monkeypatch.setattr(stream, "_worker_info", lambda: (worker, n_workers))
+        loader = ShardStream.from_index(
+            index,
+            cfg,
+            batch_size=2,
+            shuffle=True,
+            rank=rank,
+            world_size=world_size,
+            drop_last=drop_last,
+        )
+        loader.set_epoch(1)
+        return [c for batch in loader for c in batch["chip_idx"]]
+
+    ranks = [epoch(rank) for rank in range(world_size)]
+    # padded to the longest rank, or truncated to the shortest and to whole batches
+    per_rank = n // world_size // 2 * 2 if drop_last else -(-n // world_size)
+    assert [len(chips) for chips in ranks] == [per_rank] * world_size
+    seen = [c for chips in ranks for c in chips]
+    if drop_last:
+        assert len(set(seen)) == len(seen)
+        return
+    assert set(seen) == {c.chip_idx for c in index.chips}
+
+    # the loader processes of a rank split its chips between them
+    workers = [epoch(1, worker, 2) for worker in range(2)]
+    assert sorted(workers[0] + workers[1]) == sorted(ranks[1])
+
+
+def test_stream_set_epoch(sample_dataset):
+    cfg, index = sample_dataset(chip_batch=2, loader_output="dict")
+
+    def order(epoch):
+        loader = ShardStream.from_index(index, cfg, batch_size=4, shuffle=True)
+        loader.set_epoch(epoch)
+        return [c for batch in loader for c in batch["chip_idx"]]
+
+    # a fresh copy, as in a loader process, follows the epoch it is set to
+    assert order(3) == order(3) != order(4)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from eoflow.core.encoding import decode_target, decode_targets, encode_target
+from eoflow.models import TargetEncodingEnum
+
+
+@pytest.fixture
+def sample_targets():
+    rng = np.random.default_rng(0)
+    targets = np.zeros((4, 64, 64), dtype=np.uint8)
+    targets[0, 10:20, 5:50] = 255
+    targets[1] = (rng.random((64, 64)) > 0.9) * 255
+    targets[3] = 255
+    return targets
+
+
+@pytest.mark.parametrize("encoding", list(TargetEncodingEnum))
+def test_target_roundtrip(sample_targets, encoding):
+    buffers = [encode_target(t, encoding) for t in sample_targets]
+
+    assert (decode_targets(buffers, encoding, (64, 64)) == sample_targets).all()
+    for buffer, target in zip(buffers, sample_targets):
+        assert (decode_target(buffer, encoding, (64, 64)) == target).all()
+
+
+@pytest.mark.parametrize(
+    "encoding", [TargetEncodingEnum.RLE, TargetEncodingEnum.SPARSE]
+)
+def test_target_multiclass(encoding):
+    target = np.zeros((32, 32), dtype=np.uint8)
+    target[:4] = 1
+    target[8:12, 3] = 7
+
+    assert (
+        decode_target(encode_target(target, encoding), encoding, (32, 32)) == target
+    ).all()
+
+
+def test_target_compact(sample_targets):
+    raw = len(encode_target(sample_targets[0], TargetEncodingEnum.RAW))
+
+    assert len(encode_target(sample_targets[0], TargetEncodingEnum.BITPACK)) == raw / 8
+    assert len(encode_target(sample_targets[0], TargetEncodingEnum.RLE)) < raw / 8
+    assert len(encode_target(sample_targets[2], TargetEncodingEnum.SPARSE)) == 4
+
+    with pytest.raises(ValueError):
+        encode_target(np.ones((8, 8), dtype=np.uint8), TargetEncodingEnum.BITPACK)
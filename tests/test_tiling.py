@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import shapely
+
+from eoflow.core.tiling import load_tile_index, tiles_for_geometries
+from eoflow.models import Tile
+from eoflow.models.catalogue import get_tiles
+
+
+def test_get_tiles_local(sample_dataspec):
+    tiles = get_tiles(sample_dataspec)
+    assert "30UXC" in [tile.tile for tile in tiles]
+
+    parks = shapely.box(-0.16626047, 51.41679213, -0.06144908, 51.48794933)
+    for tile in tiles:
+        assert tile.geometry.to_shapely().intersects(parks)
+
+
+def test_tile_index_footprints():
+    ids, tree = load_tile_index()
+    footprint = tree.geometries[np.flatnonzero(ids == "30UXC")[0]]
+    assert footprint.equals_exact(Tile(tile="30UXC").geometry.to_shapely(), 1e-6)
+
+    # the norway and svalbard zone exceptions, and an antimeridian tile
+    assert {"32VLN", "33XVJ", "01VCG"} <= set(ids.tolist())
+    assert tiles_for_geometries([shapely.Point(179.99, 60)]) == ["01VCG", "60VXM"]
+
+
+def test_tile_index_is_never_built_implicitly(tmp_path):
+    with pytest.raises(FileNotFoundError, match="make tile-index"):
+        load_tile_index(str(tmp_path / "mgrs_tiles.parquet"))
+    assert not list(tmp_path.iterdir())
+
+
+def test_tiling_many_polygons():
+    rng = np.random.default_rng(0)
+    points = shapely.points(rng.uniform([-10, 40], [20, 60], (100_000, 2)))
+    polygons = shapely.buffer(points, 0.001, quad_segs=2)
+
+    tiles = tiles_for_geometries(polygons)
+    assert len(tiles) == len(set(tiles)) and "30UXC" in tiles
+    # a tile is found for every polygon
+    assert set(tiles) >= {t for p in polygons[:100] for t in tiles_for_geometries([p])}
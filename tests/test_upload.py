@@ -0,0 +1,45 @@
+import threading
+import time
+
+import pytest
+
+from eoflow.core.upload import UploadQueue, confirm
+
+
+def test_upload_queue_writes(tmp_path):
+    with UploadQueue(workers=4, maxsize=8) as uploads:
+        futures = [
+            uploads.write(str(tmp_path / f"chip-{ii}.npy"), bytes([ii]) * 10)
+            for ii in range(50)
+        ]
+        confirm(futures)
+
+    assert all(
+        (tmp_path / f"chip-{ii}.npy").read_bytes() == bytes([ii]) * 10
+        for ii in range(50)
+    )
+
+
+def test_upload_queue_backpressure():
+    """submit blocks once maxsize writes are in flight"""
+
+    release = threading.Event()
+    with UploadQueue(workers=2, maxsize=2) as uploads:
+        uploads.submit(release.wait)
+        uploads.submit(release.wait)
+
+        blocked = threading.Thread(target=uploads.submit, args=(time.sleep, 0))
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+
+        release.set()
+        blocked.join(1)
+        assert not blocked.is_alive()
+
+
+def test_upload_failure_is_raised(tmp_path):
+    with UploadQueue(workers=1, maxsize=1) as uploads:
+        future = uploads.write(str(tmp_path / "missing" / "chip.npy"), b"x")
+        with pytest.raises(FileNotFoundError):
+            confirm([future])
@@ -0,0 +1,25 @@
+import numpy as np
+
+from eoflow.loader import ChipLoader, open_dataset
+
+
+def test_open_dataset_is_lazy(sample_dataset):
+    cfg, index = sample_dataset(chip_dtype="uint8", codec="zstd")
+    ds = open_dataset(cfg.dataset_store, chips_per_block=4)
+
+    assert ds["chips"].dims == ("chip", "band", "y", "x")
+    assert ds["chips"].shape == (len(index.chips), 2, 256, 256)
+    assert ds["chips"].dtype == np.uint8
+    assert ds["chips"].data.chunks[0][0] == 4
+    assert ds["tile"].values.tolist() == ["30UXC"] * len(index.chips)
+    assert (ds["lon_min"] < ds["lon_max"]).all()
+    assert ds["time_end"].dtype.kind == "M"
+
+    chips, targets = next(iter(ChipLoader.from_index(index, cfg, normalize=False)))
+    assert np.array_equal(ds["chips"][:2].values, chips[:2])
+    assert np.array_equal(ds["targets"][:2].values, targets[:2])
+
+    # reductions compute block by block
+    values = open_dataset(index, cfg, dequantize=True)["chips"]
+    mean = values.mean(dim=("chip", "y", "x")).values
+    assert np.allclose(mean, index.chip_stats.mean, rtol=1e-4)